@@ -1,3 +1,11 @@
 from django.contrib import admin
+from .models import DailyShopMetrics
 
-# Register your models here.
+
+@admin.register(DailyShopMetrics)
+class DailyShopMetricsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'shop', 'payment_mode', 'refill_revenue', 'refill_count',
+                    'sales_revenue', 'sales_count', 'expenses_total', 'credit_repaid')
+    list_filter = ('shop', 'payment_mode', 'date')
+    date_hierarchy = 'date'
+    readonly_fields = ('updated_at',)
@@ -0,0 +1,141 @@
+"""
+Versioned response cache for the analytics endpoints.
+
+Every cached payload is keyed by the action, its query parameters and a version
+token for the shop it covers (or a global token for shop_id=all). Writes to the
+tables analytics reads from replace the shop's token and the global token once
+the write commits, so old entries are never served again.
+
+The cache alias only needs Django's basic get/set/add/incr, so it works with the
+local-memory and file-based backends. Use the file-based backend when running
+several worker processes so they share versions.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'analytics'
+KEY_PREFIX = 'analytics'
+CACHED_PARAMS = ('time_range', 'start_date', 'end_date')
+
+
+class AnalyticsCache:
+    """
+    Helpers for reading, writing and invalidating cached analytics payloads.
+    """
+
+    @staticmethod
+    def get_cache():
+        """Use the dedicated analytics cache if configured, otherwise the default cache"""
+        alias = CACHE_ALIAS if CACHE_ALIAS in settings.CACHES else 'default'
+        return caches[alias]
+
+    @staticmethod
+    def get_timeout():
+        return getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 300)
+
+    @staticmethod
+    def version_key(shop_id):
+        return f"{KEY_PREFIX}:version:{shop_id or 'all'}"
+
+    @staticmethod
+    def get_version(shop_id):
+        """Current version token for a shop ('all' for the cross-shop version)"""
+        cache = AnalyticsCache.get_cache()
+        key = AnalyticsCache.version_key(shop_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def bump_version(shop_id):
+        """
+        Invalidate cached payloads for a shop and for the all-shops view.
+        A fresh token is written rather than incremented so concurrent bumps
+        can never leave an old version in place.
+        """
+        cache = AnalyticsCache.get_cache()
+        token = time.time_ns()
+        keys = {AnalyticsCache.version_key('all')}
+        if shop_id:
+            keys.add(AnalyticsCache.version_key(shop_id))
+        cache.set_many({key: token for key in keys}, None)
+
+    @staticmethod
+    def build_key(action_name, request, shop_id):
+        """Cache key for an action call, including the shop's current version"""
+        params = [action_name, str(shop_id or 'all')]
+        params.extend(str(request.query_params.get(name, '')) for name in CACHED_PARAMS)
+        digest = hashlib.md5('|'.join(params).encode('utf-8')).hexdigest()
+        version = AnalyticsCache.get_version(shop_id if shop_id != 'all' else None)
+        return f"{KEY_PREFIX}:{action_name}:{digest}:{version}"
+
+    @staticmethod
+    def record(outcome, action_name):
+        """Count a cache hit or miss, overall and per action"""
+        cache = AnalyticsCache.get_cache()
+        for key in (f"{KEY_PREFIX}:stats:{outcome}", f"{KEY_PREFIX}:stats:{action_name}:{outcome}"):
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Key does not exist yet
+                cache.add(key, 0, None)
+                cache.incr(key)
+
+    @staticmethod
+    def get_stats(action_names):
+        """Hit/miss counters and hit rate, overall and for each action"""
+        cache = AnalyticsCache.get_cache()
+
+        def summarize(prefix):
+            hits = cache.get(f"{prefix}:hits") or 0
+            misses = cache.get(f"{prefix}:misses") or 0
+            total = hits + misses
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / total * 100, 1) if total else 0
+            }
+
+        stats = summarize(f"{KEY_PREFIX}:stats")
+        stats['actions'] = {name: summarize(f"{KEY_PREFIX}:stats:{name}") for name in action_names}
+        return stats
+
+
+def get_request_shop_id(request):
+    """Resolve shop_id the same way the analytics actions do"""
+    shop_id = request.query_params.get('shop_id')
+    if shop_id is None:
+        shop_id = request.data.get('shop_id', 'all')
+    return shop_id or 'all'
+
+
+def cached_analytics(action_name):
+    """
+    Decorator for analytics actions that serves successful responses from the
+    versioned cache and stores fresh ones.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = AnalyticsCache.get_cache()
+            key = AnalyticsCache.build_key(action_name, request, get_request_shop_id(request))
+
+            data = cache.get(key)
+            if data is not None:
+                AnalyticsCache.record('hits', action_name)
+                return Response(data)
+
+            AnalyticsCache.record('misses', action_name)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, AnalyticsCache.get_timeout())
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,67 @@
+"""
+Concurrent execution of independent analytics queries.
+
+The analytics actions build several aggregates (rollup totals, per-shop
+breakdowns, trends, expense rows) that do not depend on each other. Running them
+on a small, process-wide thread pool lets a request finish in roughly the time of
+its slowest query instead of the sum of all of them. Each worker thread uses its
+own database connection, which is released after every task the same way Django
+releases a request's connection.
+
+The pool is bounded by ANALYTICS_QUERY_WORKERS, so the number of extra database
+connections per process is also bounded. With 1 worker (or inside an atomic
+block, where other connections cannot see uncommitted rows) tasks run one after
+another on the calling thread.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class QueryDispatcher:
+    """
+    Runs a dictionary of independent query callables and returns their results.
+    """
+
+    @staticmethod
+    def get_workers():
+        return max(1, getattr(settings, 'ANALYTICS_QUERY_WORKERS', 4))
+
+    @staticmethod
+    def get_executor(workers):
+        """Shared executor for a pool size, created on first use in each process"""
+        with _executors_lock:
+            executor = _executors.get(workers)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analytics-query')
+                _executors[workers] = executor
+            return executor
+
+    @staticmethod
+    def run_task(task):
+        """Run one task on a pool thread and release its database connection afterwards"""
+        close_old_connections()
+        try:
+            return task()
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def run(tasks, workers=None):
+        """
+        Execute {name: callable} and return {name: result}. Callables must fully
+        evaluate their querysets (e.g. wrap them in list()) so the queries run on
+        the worker thread. The first exception raised by a task is re-raised.
+        """
+        workers = workers or QueryDispatcher.get_workers()
+        if workers == 1 or len(tasks) < 2 or connection.in_atomic_block:
+            return {name: task() for name, task in tasks.items()}
+
+        executor = QueryDispatcher.get_executor(workers)
+        futures = {name: executor.submit(QueryDispatcher.run_task, task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
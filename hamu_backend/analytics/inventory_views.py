@@ -9,7 +9,8 @@ from rest_framework.authentication import SessionAuthentication, BasicAuthentica
 
 from stock.models import StockItem, StockLog
 from shops.models import Shops
-from stock.services import StockCalculationService
+from stock.services import StockCalculationService, StockLedgerService
+from stock.filters import StockLedgerFilter
 from hamu_backend.permissions import IsShopAgentOrDirector, FlexibleJWTAuthentication
 from .inventory_serializers import InventoryAdjustmentSerializer
 
@@ -131,16 +132,18 @@ class InventoryHistoryView(APIView):
             return Response({"error": "shop_id parameter is required for directors"}, status=status.HTTP_400_BAD_REQUEST)
             
         # Base query for stock logs
-        query = StockLog.objects.filter(shop_id=shop_id).order_by('-log_date')
+        query = StockLog.objects.filter(shop_id=shop_id)
         
         # Filter by item_id if provided
         if item_id:
             query = query.filter(stock_item_id=item_id)
+
+        # min_date/max_date filters work the same way as on the stock log endpoints
+        filterset = StockLedgerFilter(request.query_params, queryset=query, request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get stock logs
-        stock_logs = query.select_related('stock_item', 'shop')
-        
-        # If filtering by item_id, get the current and previous quantities
+        # If filtering by item_id, get the current quantity
         if item_id:
             try:
                 stock_item = StockItem.objects.get(id=item_id)
@@ -153,26 +156,21 @@ class InventoryHistoryView(APIView):
         else:
             current_quantity = None
         
-        # Format the response
-        entries = []
-        for log in stock_logs:
-            entries.append({
-                "id": log.id,
-                "item_id": log.stock_item.id,
-                "item_name": log.stock_item.item_name,
-                "item_type": log.stock_item.item_type,
-                "user": log.director_name,
-                "timestamp": log.log_date.isoformat(),
-                "previous_quantity": 0,  # This would require additional calculation
-                "new_quantity": 0,       # This would require additional calculation
-                "adjustment_type": "add" if log.quantity_change > 0 else "subtract" if log.quantity_change < 0 else "set",
-                "quantity": abs(log.quantity_change),
-                "reason": log.notes,
-                "shop_name": log.shop.shopName
-            })
+        # One keyset page of the ledger, with quantities before and after each movement
+        try:
+            page = StockLedgerService.get_page(
+                filterset.qs,
+                cursor=request.query_params.get('cursor'),
+                page_size=StockLedgerService.get_page_size(request.query_params.get('page_size')),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = [StockLedgerService.serialize_entry(log) for log in page['results']]
         
         return Response({
             "entries": entries,
             "total_count": len(entries),
-            "current_quantity": current_quantity
+            "current_quantity": current_quantity,
+            "next_cursor": page['next_cursor']
         })
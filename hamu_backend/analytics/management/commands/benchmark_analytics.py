@@ -0,0 +1,114 @@
+"""
+Management command to compare sequential and concurrent execution of the
+analytics aggregates against the configured database.
+
+Run it against a local PostgreSQL seeded with production-sized data. Every
+request bypasses the response cache, so each timing covers the full query path.
+
+Usage: python manage.py benchmark_analytics [--endpoint sales|financial] [--time-range year]
+                                            [--shop SHOP_ID] [--iterations 10] [--workers 4]
+"""
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from analytics.cache import AnalyticsCache
+from analytics.views import AnalyticsViewSet
+from users.models import Users
+
+
+class Command(BaseCommand):
+    help = 'Benchmark analytics endpoints with sequential and concurrent aggregate queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint',
+            choices=['sales', 'financial'],
+            action='append',
+            help='Endpoint to benchmark (repeatable, defaults to both)',
+        )
+        parser.add_argument(
+            '--time-range',
+            default='year',
+            help='time_range parameter to request (default: year)',
+        )
+        parser.add_argument(
+            '--shop',
+            default='all',
+            help='shop_id parameter to request (default: all)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10,
+            help='Timed requests per endpoint and mode (default: 10)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'ANALYTICS_QUERY_WORKERS', 4),
+            help='Pool size for the concurrent run (default: ANALYTICS_QUERY_WORKERS)',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        if options['workers'] < 2:
+            raise CommandError('--workers must be at least 2 to compare against sequential execution')
+
+        user = Users.objects.filter(user_class=Users.UserClass.DIRECTOR).first()
+        if user is None:
+            raise CommandError('A Director user is required to call the analytics endpoints')
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'Running against {connection.vendor}; results are only representative on PostgreSQL.'
+            ))
+
+        params = {'time_range': options['time_range'], 'shop_id': options['shop']}
+        self.stdout.write(f"Benchmarking with {params} over {options['iterations']} iterations")
+
+        for endpoint in options['endpoint'] or ['sales', 'financial']:
+            view = AnalyticsViewSet.as_view({'get': endpoint})
+            sequential = self.measure(view, endpoint, params, user, 1, options['iterations'])
+            concurrent = self.measure(view, endpoint, params, user, options['workers'], options['iterations'])
+
+            self.stdout.write(f'\n{endpoint}:')
+            self.report('sequential', sequential)
+            self.report(f"concurrent ({options['workers']} workers)", concurrent)
+            speedup = statistics.median(sequential) / statistics.median(concurrent)
+            self.stdout.write(self.style.SUCCESS(f'  median speedup: {speedup:.2f}x'))
+
+    def measure(self, view, endpoint, params, user, workers, iterations):
+        """Time `iterations` uncached requests, after one untimed warm-up request"""
+        factory = APIRequestFactory()
+        timings = []
+        with override_settings(ANALYTICS_QUERY_WORKERS=workers):
+            for i in range(iterations + 1):
+                # A fresh version token makes every request a cache miss
+                AnalyticsCache.bump_version(None if params['shop_id'] == 'all' else params['shop_id'])
+                request = factory.get(f'/api/analytics/{endpoint}/', params)
+                force_authenticate(request, user=user)
+
+                started = time.perf_counter()
+                response = view(request)
+                elapsed = (time.perf_counter() - started) * 1000
+
+                if response.status_code != 200:
+                    raise CommandError(f'{endpoint} returned {response.status_code}: {response.data}')
+                if i > 0:
+                    timings.append(elapsed)
+        return timings
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(round(len(timings) * 0.95)) - 1)]
+        self.stdout.write(
+            f'  {label:<28} median {statistics.median(timings):8.1f} ms   '
+            f'mean {statistics.mean(timings):8.1f} ms   p95 {p95:8.1f} ms'
+        )
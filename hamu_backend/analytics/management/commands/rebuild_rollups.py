@@ -0,0 +1,53 @@
+"""
+Management command to rebuild the DailyShopMetrics rollup from the raw
+Refills, Sales, Expenses and Credits tables.
+
+Usage: python manage.py rebuild_rollups [--shop SHOP_ID] [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD]
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.services import RollupService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily shop metrics rollup used by the analytics endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop',
+            type=int,
+            help='Only rebuild rows for this shop ID',
+        )
+        parser.add_argument(
+            '--start-date',
+            type=str,
+            help='First local date to rebuild (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--end-date',
+            type=str,
+            help='Last local date to rebuild (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date = self.parse_date(options.get('start_date'))
+            end_date = self.parse_date(options.get('end_date'))
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        self.stdout.write('Rebuilding daily shop metrics...')
+        rows_written = RollupService.rebuild(
+            shop_id=options.get('shop'),
+            start_date=start_date,
+            end_date=end_date,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rollup rebuild complete! Wrote {rows_written} rows.'))
+
+    @staticmethod
+    def parse_date(value):
+        if not value:
+            return None
+        return datetime.strptime(value, '%Y-%m-%d').date()
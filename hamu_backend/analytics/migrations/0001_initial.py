@@ -0,0 +1,94 @@
+# Generated by Django 5.2 on 2026-10-16 09:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def populate_rollups(apps, schema_editor):
+    """Fill DailyShopMetrics from the existing refills, sales, expenses and credit payments"""
+    DailyShopMetrics = apps.get_model('analytics', 'DailyShopMetrics')
+    sources = [
+        ('refills', 'Refills', 'created_at', True, {
+            'refill_revenue': Sum('cost'),
+            'refill_count': Count('id'),
+            'refill_quantity': Sum('quantity'),
+            'free_refill_count': Count('id', filter=Q(is_free=True)),
+        }),
+        ('sales', 'Sales', 'sold_at', True, {
+            'sales_revenue': Sum('cost'),
+            'sales_count': Count('id'),
+            'sales_quantity': Sum('quantity'),
+        }),
+        ('expenses', 'Expenses', 'created_at', False, {
+            'expenses_total': Sum('cost'),
+            'expenses_count': Count('id'),
+        }),
+        ('credits', 'Credits', 'payment_date', True, {
+            'credit_repaid': Sum('money_paid'),
+            'credit_payment_count': Count('id'),
+        }),
+    ]
+
+    rows = {}
+    for app_label, model_name, date_field, has_payment_mode, aggregates in sources:
+        queryset = apps.get_model(app_label, model_name).objects.order_by().exclude(
+            **{f'{date_field}__isnull': True}
+        ).annotate(day=TruncDate(date_field, tzinfo=timezone.get_default_timezone()))
+        group_by = ['shop_id', 'day'] + (['payment_mode'] if has_payment_mode else [])
+        for row in queryset.values(*group_by).annotate(**aggregates):
+            metrics = rows.setdefault((row['shop_id'], row['day'], row.get('payment_mode', '')), {})
+            for field in aggregates:
+                metrics[field] = row[field] or 0
+
+    DailyShopMetrics.objects.bulk_create([
+        DailyShopMetrics(shop_id=shop_id, date=day, payment_mode=payment_mode, **metrics)
+        for (shop_id, day, payment_mode), metrics in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('shops', '0001_initial'),
+        ('refills', '0004_refills_client_id'),
+        ('sales', '0003_sales_client_id'),
+        ('expenses', '0003_expenses_client_id'),
+        ('credits', '0004_credits_client_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyShopMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='Local (Africa/Nairobi) date the activity happened on')),
+                ('payment_mode', models.CharField(blank=True, default='', max_length=20)),
+                ('refill_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('refill_count', models.IntegerField(default=0)),
+                ('refill_quantity', models.IntegerField(default=0)),
+                ('free_refill_count', models.IntegerField(default=0, help_text='Number of refills marked as free (loyalty redemptions)')),
+                ('sales_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('sales_quantity', models.IntegerField(default=0)),
+                ('expenses_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('expenses_count', models.IntegerField(default=0)),
+                ('credit_repaid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('credit_payment_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='shops.shops')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Shop Metrics',
+                'ordering': ['-date', 'shop'],
+                'indexes': [models.Index(fields=['date', 'shop'], name='analytics_metrics_date_shop')],
+                'unique_together': {('shop', 'date', 'payment_mode')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
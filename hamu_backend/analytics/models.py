@@ -1,3 +1,48 @@
 from django.db import models
+from decimal import Decimal
+from shops.models import Shops
 
-# Create your models here.
+
+class DailyShopMetrics(models.Model):
+    """
+    Daily rollup of shop activity per payment mode.
+    Kept up to date by signals on Refills, Sales, Expenses and Credits so analytics
+    can read one row per shop/day/payment mode instead of scanning every transaction.
+    Expenses have no payment mode and are recorded under an empty payment_mode.
+    """
+    shop = models.ForeignKey(Shops, on_delete=models.CASCADE, related_name='daily_metrics')
+    date = models.DateField(help_text="Local (Africa/Nairobi) date the activity happened on")
+    payment_mode = models.CharField(max_length=20, blank=True, default='')
+
+    # Refills
+    refill_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    refill_count = models.IntegerField(default=0)
+    refill_quantity = models.IntegerField(default=0)
+    free_refill_count = models.IntegerField(default=0, help_text="Number of refills marked as free (loyalty redemptions)")
+
+    # Sales
+    sales_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    sales_count = models.IntegerField(default=0)
+    sales_quantity = models.IntegerField(default=0)
+
+    # Expenses
+    expenses_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    expenses_count = models.IntegerField(default=0)
+
+    # Credit repayments
+    credit_repaid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    credit_payment_count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        mode = self.payment_mode or 'N/A'
+        return f"{self.shop} on {self.date} ({mode})"
+
+    class Meta:
+        verbose_name_plural = 'Daily Shop Metrics'
+        unique_together = ('shop', 'date', 'payment_mode')
+        indexes = [
+            models.Index(fields=['date', 'shop'], name='analytics_metrics_date_shop'),
+        ]
+        ordering = ['-date', 'shop']
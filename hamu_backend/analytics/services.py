@@ -0,0 +1,661 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Count, F, Q, Window, DateField, DateTimeField, DecimalField
+from django.db.models.functions import Lag, TruncHour, TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+
+
+class DateRangeService:
+    """
+    Service class that turns an analytics time_range into the current and previous
+    periods. Shared by every analytics action so they agree on period boundaries.
+    """
+
+    TIME_RANGES = ('day', 'week', 'month', 'quarter', 'year', 'custom')
+
+    @staticmethod
+    def shift_months(day, months):
+        """First day of the month `months` away from the month containing `day`"""
+        month_index = day.year * 12 + (day.month - 1) + months
+        return date(month_index // 12, month_index % 12 + 1, 1)
+
+    @staticmethod
+    def clamp_day(year, month, day):
+        """Build a date, clamping the day to the length of the month"""
+        return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+    @staticmethod
+    def end_of_day(day):
+        """Last microsecond of a local date as an aware datetime"""
+        return TrendService.local_midnight(day + timedelta(days=1)) - timedelta(microseconds=1)
+
+    @staticmethod
+    def resolve(time_range, start_date_str=None, end_date_str=None, now=None):
+        """
+        Resolve a time_range ('day', 'week', 'month', 'quarter', 'year' or 'custom'
+        with YYYY-MM-DD start/end strings) into a dictionary with 'start_date',
+        'end_date', 'previous_start_date' and 'previous_end_date'. All values are
+        aware datetimes in local time and every bound is inclusive.
+
+        Unknown ranges, and custom ranges with missing or invalid dates, fall back
+        to the current month.
+        """
+        now = timezone.localtime(now or timezone.now(), timezone.get_default_timezone())
+        today = now.date()
+
+        if time_range == 'custom':
+            try:
+                first_day = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+                last_day = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                return DateRangeService.resolve('month', now=now)
+            if first_day > last_day:
+                return DateRangeService.resolve('month', now=now)
+            return DateRangeService.resolve_custom(first_day, last_day)
+
+        if time_range == 'day':
+            first_day = today
+            previous_first_day = today - timedelta(days=1)
+        elif time_range == 'week':
+            # Weeks start on Monday
+            first_day = today - timedelta(days=today.weekday())
+            previous_first_day = first_day - timedelta(days=7)
+        elif time_range == 'quarter':
+            first_day = date(today.year, (today.month - 1) // 3 * 3 + 1, 1)
+            previous_first_day = DateRangeService.shift_months(first_day, -3)
+        elif time_range == 'year':
+            first_day = date(today.year, 1, 1)
+            previous_first_day = date(today.year - 1, 1, 1)
+        else:
+            # Default to the current month
+            first_day = today.replace(day=1)
+            previous_first_day = DateRangeService.shift_months(first_day, -1)
+
+        start_date = TrendService.local_midnight(first_day)
+        return {
+            'start_date': start_date,
+            'end_date': now,
+            'previous_start_date': TrendService.local_midnight(previous_first_day),
+            'previous_end_date': start_date - timedelta(microseconds=1),
+        }
+
+    @staticmethod
+    def resolve_custom(first_day, last_day):
+        """
+        Resolve an explicit date range. Year-, month- and quarter-to-date ranges are
+        compared with the same stretch of the previous year, month or quarter; any
+        other range is compared with the equally long period right before it.
+        """
+        quarter_start = date(last_day.year, (last_day.month - 1) // 3 * 3 + 1, 1)
+
+        if first_day == date(last_day.year, 1, 1):
+            # Year-to-date: compare with the same dates last year
+            previous_first_day = date(first_day.year - 1, 1, 1)
+            previous_last_day = DateRangeService.clamp_day(last_day.year - 1, last_day.month, last_day.day)
+        elif first_day == last_day.replace(day=1):
+            # Month-to-date: compare with the same days of the previous month
+            previous_first_day = DateRangeService.shift_months(first_day, -1)
+            previous_last_day = DateRangeService.clamp_day(
+                previous_first_day.year, previous_first_day.month, last_day.day
+            )
+        elif first_day == quarter_start:
+            # Quarter-to-date: compare with the same number of days of the previous quarter
+            previous_first_day = DateRangeService.shift_months(first_day, -3)
+            previous_last_day = previous_first_day + (last_day - first_day)
+        else:
+            # Any other range: use the same length period immediately before it
+            period_length = (last_day - first_day).days + 1
+            previous_last_day = first_day - timedelta(days=1)
+            previous_first_day = previous_last_day - timedelta(days=period_length - 1)
+
+        return {
+            'start_date': TrendService.local_midnight(first_day),
+            'end_date': DateRangeService.end_of_day(last_day),
+            'previous_start_date': TrendService.local_midnight(previous_first_day),
+            'previous_end_date': DateRangeService.end_of_day(previous_last_day),
+        }
+
+
+class TrendService:
+    """
+    Service class for building time-bucketed trends (hourly, daily, weekly, monthly)
+    for the analytics dashboards.
+
+    Every source queryset is grouped once by its truncated date, in the project's
+    local time (Africa/Nairobi), and empty buckets are filled in Python. This keeps
+    the number of queries fixed per source regardless of how many buckets are shown.
+    """
+
+    TRUNC_FUNCTIONS = {
+        'hour': TruncHour,
+        'day': TruncDay,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+
+    @staticmethod
+    def truncate(value, granularity):
+        """Truncate an aware datetime to the start of its bucket in local time"""
+        local = timezone.localtime(value, timezone.get_default_timezone())
+
+        if granularity == 'hour':
+            return local.replace(minute=0, second=0, microsecond=0)
+
+        day = local.date()
+        if granularity == 'week':
+            # Weeks start on Monday, matching TruncWeek
+            day = day - timedelta(days=day.weekday())
+        elif granularity == 'month':
+            day = day.replace(day=1)
+
+        return TrendService.local_midnight(day)
+
+    @staticmethod
+    def local_midnight(day):
+        """Return midnight of a date as an aware datetime in local time"""
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()), timezone.get_default_timezone())
+
+    @staticmethod
+    def shift(bucket_start, granularity, steps):
+        """Move a bucket start forwards (or backwards) by a number of buckets"""
+        if granularity == 'hour':
+            return bucket_start + timedelta(hours=steps)
+        if granularity == 'day':
+            day = bucket_start.date() + timedelta(days=steps)
+        elif granularity == 'week':
+            day = bucket_start.date() + timedelta(weeks=steps)
+        else:
+            month_index = bucket_start.year * 12 + (bucket_start.month - 1) + steps
+            day = bucket_start.date().replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+        return TrendService.local_midnight(day)
+
+    @staticmethod
+    def get_bucket_starts(granularity, anchor, count):
+        """
+        Return `count` bucket starts in chronological order, ending with the
+        bucket that contains `anchor`.
+        """
+        last_bucket = TrendService.truncate(anchor, granularity)
+        return [
+            TrendService.shift(last_bucket, granularity, step)
+            for step in range(-(count - 1), 1)
+        ]
+
+    @staticmethod
+    def is_date_field(queryset, date_field):
+        """True if the field is a plain DateField (e.g. rollup rows) rather than a DateTimeField"""
+        field = queryset.model._meta.get_field(date_field)
+        return isinstance(field, DateField) and not isinstance(field, DateTimeField)
+
+    @staticmethod
+    def aggregate_by_bucket(queryset, date_field, granularity, aggregates=None):
+        """
+        Group a queryset by truncated date in a single query.
+        Returns a dictionary mapping bucket start to the aggregated values.
+        """
+        if aggregates is None:
+            aggregates = {'total': Sum('cost'), 'count': Count('id')}
+
+        trunc_function = TrendService.TRUNC_FUNCTIONS[granularity]
+        if TrendService.is_date_field(queryset, date_field):
+            # Dates are already local, so truncate without a time zone
+            bucket = trunc_function(date_field, output_field=DateField())
+        else:
+            bucket = trunc_function(date_field, tzinfo=timezone.get_default_timezone())
+
+        rows = queryset.order_by().annotate(bucket=bucket).values('bucket').annotate(**aggregates)
+
+        result = {}
+        for row in rows:
+            key = row['bucket']
+            if not isinstance(key, datetime):
+                key = TrendService.local_midnight(key)
+            result[key] = {name: row[name] or 0 for name in aggregates}
+        return result
+
+    @staticmethod
+    def build_trend(sources, granularity, anchor, count):
+        """
+        Build a trend series for several sources at once.
+
+        `sources` maps a name to a (queryset, date_field) or
+        (queryset, date_field, aggregates) tuple. Without aggregates, each bucket
+        holds the Sum of 'cost' as 'total' and the row 'count'. The result is a
+        chronological list of dictionaries with the bucket 'start' plus an entry
+        per source, with zeros for buckets that had no rows.
+        """
+        bucket_starts = TrendService.get_bucket_starts(granularity, anchor, count)
+        window_start = bucket_starts[0]
+        window_end = TrendService.shift(bucket_starts[-1], granularity, 1)
+
+        grouped = {}
+        empty = {}
+        for name, source in sources.items():
+            queryset, date_field = source[0], source[1]
+            aggregates = source[2] if len(source) > 2 else {'total': Sum('cost'), 'count': Count('id')}
+            if TrendService.is_date_field(queryset, date_field):
+                queryset = queryset.filter(**{
+                    f'{date_field}__gte': window_start.date(),
+                    f'{date_field}__lt': window_end.date(),
+                })
+            else:
+                queryset = queryset.filter(**{
+                    f'{date_field}__gte': window_start,
+                    f'{date_field}__lt': window_end,
+                })
+            grouped[name] = TrendService.aggregate_by_bucket(queryset, date_field, granularity, aggregates)
+            empty[name] = {aggregate_name: 0 for aggregate_name in aggregates}
+
+        series = []
+        for bucket_start in bucket_starts:
+            entry = {'start': bucket_start}
+            for name in sources:
+                entry[name] = grouped[name].get(bucket_start, empty[name])
+            series.append(entry)
+
+        return series
+
+
+class RollupService:
+    """
+    Service class for maintaining and reading the DailyShopMetrics rollup.
+
+    Each Refill, Sale, Expense and Credit payment contributes a set of increments
+    to one (shop, date, payment_mode) row. Signals apply those increments as records
+    are created, edited or deleted, and rebuild() recomputes rows from scratch.
+    """
+
+    # model label -> (date field, whether the model has a payment_mode)
+    SOURCES = {
+        'refills.Refills': ('created_at', True),
+        'sales.Sales': ('sold_at', True),
+        'expenses.Expenses': ('created_at', False),
+        'credits.Credits': ('payment_date', True),
+    }
+
+    PAYMENT_MODES = ['MPESA', 'CASH', 'CREDIT']
+
+    METRIC_FIELDS = [
+        'refill_revenue', 'refill_count', 'refill_quantity', 'free_refill_count',
+        'sales_revenue', 'sales_count', 'sales_quantity',
+        'expenses_total', 'expenses_count',
+        'credit_repaid', 'credit_payment_count',
+    ]
+
+    @staticmethod
+    def local_date(value):
+        """Local (Africa/Nairobi) calendar date of a datetime"""
+        if timezone.is_naive(value):
+            return value.date()
+        return timezone.localtime(value, timezone.get_default_timezone()).date()
+
+    @staticmethod
+    def date_bounds(start_date, end_date):
+        """
+        Convert an inclusive datetime range into an inclusive date range for the rollup.
+        An end bound at exactly local midnight belongs to the previous day.
+        """
+        end = timezone.localtime(end_date, timezone.get_default_timezone())
+        if end.time() == datetime.min.time():
+            end = end - timedelta(microseconds=1)
+        return RollupService.local_date(start_date), end.date()
+
+    @staticmethod
+    def get_contribution(instance):
+        """
+        Return ((shop_id, date, payment_mode), {field: increment}) for a record,
+        or None if the record does not count towards the rollup.
+        """
+        label = instance._meta.label
+        if label not in RollupService.SOURCES:
+            return None
+
+        date_field, has_payment_mode = RollupService.SOURCES[label]
+        value = getattr(instance, date_field)
+        if value is None or instance.shop_id is None:
+            return None
+
+        key = (
+            instance.shop_id,
+            RollupService.local_date(value),
+            instance.payment_mode if has_payment_mode else '',
+        )
+
+        if label == 'refills.Refills':
+            deltas = {
+                'refill_revenue': instance.cost or 0,
+                'refill_count': 1,
+                'refill_quantity': instance.quantity or 0,
+                'free_refill_count': 1 if instance.is_free else 0,
+            }
+        elif label == 'sales.Sales':
+            deltas = {
+                'sales_revenue': instance.cost or 0,
+                'sales_count': 1,
+                'sales_quantity': instance.quantity or 0,
+            }
+        elif label == 'expenses.Expenses':
+            deltas = {
+                'expenses_total': instance.cost or 0,
+                'expenses_count': 1,
+            }
+        else:
+            deltas = {
+                'credit_repaid': instance.money_paid or 0,
+                'credit_payment_count': 1,
+            }
+
+        return key, deltas
+
+    @staticmethod
+    def apply_contribution(contribution, sign=1):
+        """
+        Add (sign=1) or remove (sign=-1) a contribution using F() increments.
+        Rows are only created when adding; removing from a missing row is a no-op.
+        """
+        from .models import DailyShopMetrics
+
+        if contribution is None:
+            return
+
+        (shop_id, day, payment_mode), deltas = contribution
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+
+        row = DailyShopMetrics.objects.filter(shop_id=shop_id, date=day, payment_mode=payment_mode)
+        updates = {field: F(field) + sign * value for field, value in deltas.items()}
+
+        with transaction.atomic():
+            if row.update(**updates) or sign < 0:
+                return
+            try:
+                with transaction.atomic():
+                    DailyShopMetrics.objects.create(
+                        shop_id=shop_id, date=day, payment_mode=payment_mode,
+                        **{field: value for field, value in deltas.items()}
+                    )
+            except IntegrityError:
+                # Another request created the row first
+                row.update(**updates)
+
+    @staticmethod
+    def get_queryset(start_date, end_date, shop_id=None):
+        """Rollup rows covering an inclusive datetime range, optionally for one shop"""
+        from .models import DailyShopMetrics
+
+        first_day, last_day = RollupService.date_bounds(start_date, end_date)
+        queryset = DailyShopMetrics.objects.filter(date__gte=first_day, date__lte=last_day)
+        if shop_id and shop_id != 'all':
+            queryset = queryset.filter(shop_id=shop_id)
+        return queryset
+
+    @staticmethod
+    def get_totals(queryset):
+        """Sum every metric field over a rollup queryset in one query"""
+        totals = queryset.aggregate(**{field: Sum(field) for field in RollupService.METRIC_FIELDS})
+        return {field: value or 0 for field, value in totals.items()}
+
+    @staticmethod
+    def get_comparison_totals(start_date, end_date, previous_start_date, previous_end_date, shop_id=None):
+        """
+        Sum every metric for the current and previous periods in a single scan of
+        the union window, splitting the two periods with conditional aggregation.
+        Returns (current_totals, previous_totals).
+        """
+        from .models import DailyShopMetrics
+
+        first_day, last_day = RollupService.date_bounds(start_date, end_date)
+        previous_first_day, previous_last_day = RollupService.date_bounds(previous_start_date, previous_end_date)
+
+        queryset = DailyShopMetrics.objects.filter(
+            date__gte=min(first_day, previous_first_day),
+            date__lte=max(last_day, previous_last_day)
+        )
+        if shop_id and shop_id != 'all':
+            queryset = queryset.filter(shop_id=shop_id)
+
+        current = Q(date__gte=first_day, date__lte=last_day)
+        previous = Q(date__gte=previous_first_day, date__lte=previous_last_day)
+        aggregates = {}
+        for field in RollupService.METRIC_FIELDS:
+            aggregates[f'current_{field}'] = Sum(field, filter=current)
+            aggregates[f'previous_{field}'] = Sum(field, filter=previous)
+        totals = queryset.aggregate(**aggregates)
+
+        current_totals = {field: totals[f'current_{field}'] or 0 for field in RollupService.METRIC_FIELDS}
+        previous_totals = {field: totals[f'previous_{field}'] or 0 for field in RollupService.METRIC_FIELDS}
+        return current_totals, previous_totals
+
+    @staticmethod
+    def get_revenue_breakdown(queryset):
+        """
+        Sales + refill revenue per shop, split by payment mode, in one grouped query
+        using conditional aggregation. Returns
+        {shop_id: {'MPESA': ..., 'CASH': ..., 'CREDIT': ..., 'total': ...}}.
+        """
+        revenue = F('sales_revenue') + F('refill_revenue')
+        aggregates = {
+            f'{mode.lower()}_revenue': Sum(revenue, filter=Q(payment_mode=mode))
+            for mode in RollupService.PAYMENT_MODES
+        }
+        aggregates['total_revenue'] = Sum(revenue)
+
+        breakdown = {}
+        for row in queryset.order_by().values('shop_id').annotate(**aggregates):
+            shop_breakdown = {
+                mode: row[f'{mode.lower()}_revenue'] or 0
+                for mode in RollupService.PAYMENT_MODES
+            }
+            shop_breakdown['total'] = row['total_revenue'] or 0
+            breakdown[row['shop_id']] = shop_breakdown
+        return breakdown
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(shop_id=None, start_date=None, end_date=None):
+        """
+        Recompute rollup rows from the raw tables with one grouped query per table.
+        start_date and end_date are local dates (inclusive). Returns the number of rows written.
+        """
+        from django.apps import apps
+        from django.db.models.functions import TruncDate
+        from .models import DailyShopMetrics
+
+        rows = {}
+        for label, (date_field, has_payment_mode) in RollupService.SOURCES.items():
+            queryset = apps.get_model(label).objects.order_by().exclude(**{f'{date_field}__isnull': True})
+            if shop_id:
+                queryset = queryset.filter(shop_id=shop_id)
+
+            queryset = queryset.annotate(
+                day=TruncDate(date_field, tzinfo=timezone.get_default_timezone())
+            )
+            if start_date:
+                queryset = queryset.filter(day__gte=start_date)
+            if end_date:
+                queryset = queryset.filter(day__lte=end_date)
+
+            group_by = ['shop_id', 'day'] + (['payment_mode'] if has_payment_mode else [])
+            if label == 'refills.Refills':
+                aggregates = {
+                    'refill_revenue': Sum('cost'),
+                    'refill_count': Count('id'),
+                    'refill_quantity': Sum('quantity'),
+                    'free_refill_count': Count('id', filter=Q(is_free=True)),
+                }
+            elif label == 'sales.Sales':
+                aggregates = {
+                    'sales_revenue': Sum('cost'),
+                    'sales_count': Count('id'),
+                    'sales_quantity': Sum('quantity'),
+                }
+            elif label == 'expenses.Expenses':
+                aggregates = {
+                    'expenses_total': Sum('cost'),
+                    'expenses_count': Count('id'),
+                }
+            else:
+                aggregates = {
+                    'credit_repaid': Sum('money_paid'),
+                    'credit_payment_count': Count('id'),
+                }
+
+            for row in queryset.values(*group_by).annotate(**aggregates):
+                key = (row['shop_id'], row['day'], row.get('payment_mode', ''))
+                metrics = rows.setdefault(key, {})
+                for field in aggregates:
+                    metrics[field] = row[field] or 0
+
+        existing = DailyShopMetrics.objects.all()
+        if shop_id:
+            existing = existing.filter(shop_id=shop_id)
+        if start_date:
+            existing = existing.filter(date__gte=start_date)
+        if end_date:
+            existing = existing.filter(date__lte=end_date)
+        existing.delete()
+
+        DailyShopMetrics.objects.bulk_create([
+            DailyShopMetrics(shop_id=key[0], date=key[1], payment_mode=key[2], **metrics)
+            for key, metrics in rows.items()
+        ], batch_size=1000)
+
+        return len(rows)
+
+
+class WaterConsumptionService:
+    """
+    Service class for daily water consumption measured by the shop meters.
+
+    Meter readings are cumulative litre counters, so a day's consumption is the
+    difference between a reading and the previous reading of the same meter.
+    Comparing that with the litres dispensed by refills gives the real wastage.
+    """
+
+    # How far before the window to look for each meter's previous reading
+    LOOKBACK_DAYS = 31
+
+    @staticmethod
+    def get_meter_deltas(first_day, last_day, shop_id=None):
+        """
+        Litres recorded by each meter on each day in [first_day, last_day].
+
+        The previous reading of every (shop, reading_type) meter is fetched with
+        LAG() in the same query. A reading lower than the previous one (meter reset
+        or replacement) counts as 0 litres. Returns a list of dictionaries with
+        'shop_id', 'reading_type', 'date' and 'litres'.
+        """
+        from meter_readings.models import MeterReading
+
+        queryset = MeterReading.objects.filter(
+            reading_date__gte=first_day - timedelta(days=WaterConsumptionService.LOOKBACK_DAYS),
+            reading_date__lte=last_day
+        )
+        if shop_id and shop_id != 'all':
+            queryset = queryset.filter(shop_id=shop_id)
+
+        rows = queryset.annotate(
+            previous_value=Window(
+                expression=Lag('value'),
+                partition_by=[F('shop_id'), F('reading_type')],
+                order_by=[F('reading_date').asc(), F('reading_time').asc()],
+            )
+        ).order_by().values('shop_id', 'reading_type', 'reading_date', 'value', 'previous_value')
+
+        deltas = []
+        for row in rows:
+            # Readings before the window only provide the starting value
+            if row['reading_date'] < first_day or row['previous_value'] is None:
+                continue
+            deltas.append({
+                'shop_id': row['shop_id'],
+                'reading_type': row['reading_type'],
+                'date': row['reading_date'],
+                'litres': max(row['value'] - row['previous_value'], 0),
+            })
+        return deltas
+
+    @staticmethod
+    def get_dispensed_litres(first_day, last_day, shop_id=None):
+        """Litres dispensed by refills per local day (quantity * package water amount)"""
+        from refills.models import Refills
+
+        queryset = Refills.objects.filter(
+            created_at__gte=TrendService.local_midnight(first_day),
+            created_at__lt=TrendService.local_midnight(last_day + timedelta(days=1))
+        )
+        if shop_id and shop_id != 'all':
+            queryset = queryset.filter(shop_id=shop_id)
+
+        grouped = TrendService.aggregate_by_bucket(queryset, 'created_at', 'day', {
+            'litres': Sum(
+                F('quantity') * F('package__water_amount_label'),
+                output_field=DecimalField(max_digits=14, decimal_places=1)
+            ),
+        })
+        return {bucket.date(): float(values['litres']) for bucket, values in grouped.items()}
+
+    @staticmethod
+    def get_daily_series(first_day, last_day, shop_id=None):
+        """
+        Daily series of metered consumption, dispensed litres and wastage for
+        every day in [first_day, last_day].
+
+        A shop that records its purifier meter is measured by the purifier alone,
+        since the dispensing machines draw from it; other shops are measured by the
+        sum of their machine meters. Days without meter data have no consumption
+        figure and a wastage of None.
+        """
+        from meter_readings.models import MeterReading
+
+        purifier = MeterReading.ReadingType.PURIFIER
+        deltas = WaterConsumptionService.get_meter_deltas(first_day, last_day, shop_id)
+        dispensed = WaterConsumptionService.get_dispensed_litres(first_day, last_day, shop_id)
+
+        purifier_shops = {delta['shop_id'] for delta in deltas if delta['reading_type'] == purifier}
+        metered = {}
+        by_reading_type = {}
+        for delta in deltas:
+            day_types = by_reading_type.setdefault(delta['date'], {})
+            day_types[delta['reading_type']] = day_types.get(delta['reading_type'], 0) + delta['litres']
+
+            is_purifier = delta['reading_type'] == purifier
+            if is_purifier == (delta['shop_id'] in purifier_shops):
+                metered[delta['date']] = metered.get(delta['date'], 0) + delta['litres']
+
+        series = []
+        day = first_day
+        while day <= last_day:
+            dispensed_litres = dispensed.get(day, 0)
+            has_readings = day in by_reading_type
+            consumption = metered.get(day, 0)
+            series.append({
+                'date': day.strftime('%Y-%m-%d'),
+                'consumption': round(consumption, 1),
+                'dispensed': round(dispensed_litres, 1),
+                'wastage': round(consumption - dispensed_litres, 1) if has_readings else None,
+                'by_reading_type': {
+                    reading_type: round(litres, 1)
+                    for reading_type, litres in by_reading_type.get(day, {}).items()
+                },
+            })
+            day += timedelta(days=1)
+        return series
+
+    @staticmethod
+    def summarize(series):
+        """Totals for a daily series; wastage only counts days with meter readings"""
+        metered_days = [day for day in series if day['wastage'] is not None]
+        consumption = sum(day['consumption'] for day in metered_days)
+        wastage = consumption - sum(day['dispensed'] for day in metered_days)
+        return {
+            'consumption': round(consumption, 1),
+            'dispensed': round(sum(day['dispensed'] for day in series), 1),
+            'wastage': round(wastage, 1),
+            'wastage_percentage': round(wastage / consumption * 100, 1) if consumption > 0 else 0,
+            'metered_days': len(metered_days),
+        }
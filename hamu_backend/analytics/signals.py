@@ -0,0 +1,69 @@
+"""
+Signal handlers that keep the DailyShopMetrics rollup in step with the
+Refills, Sales, Expenses and Credits tables, and invalidate the analytics
+response cache when data analytics reads from changes.
+
+Bulk queryset.update()/delete() calls bypass these handlers; run
+`python manage.py rebuild_rollups` after such operations.
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from refills.models import Refills
+from sales.models import Sales
+from expenses.models import Expenses
+from credits.models import Credits
+from customers.models import Customers
+from stock.models import StockItem, StockLog
+from meter_readings.models import MeterReading
+from .services import RollupService
+from .cache import AnalyticsCache
+
+ROLLUP_MODELS = (Refills, Sales, Expenses, Credits)
+CACHE_INVALIDATING_MODELS = ROLLUP_MODELS + (StockLog, StockItem, Customers, MeterReading)
+
+
+@receiver(pre_save, dispatch_uid='rollup_capture_previous')
+def capture_previous_contribution(sender, instance, **kwargs):
+    """Remember what an edited record contributed before the edit"""
+    if sender not in ROLLUP_MODELS:
+        return
+
+    instance._rollup_previous = None
+    if instance.pk:
+        previous = sender.objects.filter(pk=instance.pk).first()
+        if previous is not None:
+            instance._rollup_previous = RollupService.get_contribution(previous)
+
+
+@receiver(post_save, dispatch_uid='rollup_apply_save')
+def apply_saved_contribution(sender, instance, **kwargs):
+    """Move a created or edited record's totals into its rollup row"""
+    if sender not in ROLLUP_MODELS:
+        return
+
+    with transaction.atomic():
+        RollupService.apply_contribution(getattr(instance, '_rollup_previous', None), sign=-1)
+        RollupService.apply_contribution(RollupService.get_contribution(instance), sign=1)
+    instance._rollup_previous = None
+
+
+@receiver(post_delete, dispatch_uid='rollup_apply_delete')
+def remove_deleted_contribution(sender, instance, **kwargs):
+    """Take a deleted record's totals out of its rollup row"""
+    if sender not in ROLLUP_MODELS:
+        return
+
+    RollupService.apply_contribution(RollupService.get_contribution(instance), sign=-1)
+
+
+@receiver(post_save, dispatch_uid='analytics_cache_invalidate_save')
+@receiver(post_delete, dispatch_uid='analytics_cache_invalidate_delete')
+def invalidate_analytics_cache(sender, instance, **kwargs):
+    """Bump the shop's analytics cache version once the write has committed"""
+    if sender not in CACHE_INVALIDATING_MODELS:
+        return
+
+    shop_id = getattr(instance, 'shop_id', None)
+    transaction.on_commit(lambda: AnalyticsCache.bump_version(shop_id))
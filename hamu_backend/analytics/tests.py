@@ -1,3 +1,116 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from .services import DateRangeService
+
+
+def local(year, month, day, *args):
+    return timezone.make_aware(datetime(year, month, day, *args))
+
+
+def end_of(year, month, day):
+    return local(year, month, day) + timedelta(days=1, microseconds=-1)
+
+
+class DateRangeServiceTests(SimpleTestCase):
+    # Thursday 15 May 2025, mid-afternoon Nairobi time
+    now = local(2025, 5, 15, 14, 30)
+
+    def resolve(self, time_range, start=None, end=None):
+        return DateRangeService.resolve(time_range, start, end, now=self.now)
+
+    def assertRange(self, result, start, end, previous_start, previous_end):
+        self.assertEqual(result['start_date'], start)
+        self.assertEqual(result['end_date'], end)
+        self.assertEqual(result['previous_start_date'], previous_start)
+        self.assertEqual(result['previous_end_date'], previous_end)
+
+    def test_day(self):
+        self.assertRange(
+            self.resolve('day'),
+            local(2025, 5, 15), self.now,
+            local(2025, 5, 14), end_of(2025, 5, 14)
+        )
+
+    def test_week_starts_on_monday(self):
+        self.assertRange(
+            self.resolve('week'),
+            local(2025, 5, 12), self.now,
+            local(2025, 5, 5), end_of(2025, 5, 11)
+        )
+
+    def test_month(self):
+        self.assertRange(
+            self.resolve('month'),
+            local(2025, 5, 1), self.now,
+            local(2025, 4, 1), end_of(2025, 4, 30)
+        )
+
+    def test_month_in_january_compares_with_december(self):
+        result = DateRangeService.resolve('month', now=local(2025, 1, 10, 9))
+        self.assertEqual(result['previous_start_date'], local(2024, 12, 1))
+        self.assertEqual(result['previous_end_date'], end_of(2024, 12, 31))
+
+    def test_quarter(self):
+        self.assertRange(
+            self.resolve('quarter'),
+            local(2025, 4, 1), self.now,
+            local(2025, 1, 1), end_of(2025, 3, 31)
+        )
+
+    def test_first_quarter_compares_with_last_quarter_of_previous_year(self):
+        result = DateRangeService.resolve('quarter', now=local(2025, 2, 3, 9))
+        self.assertEqual(result['start_date'], local(2025, 1, 1))
+        self.assertEqual(result['previous_start_date'], local(2024, 10, 1))
+        self.assertEqual(result['previous_end_date'], end_of(2024, 12, 31))
+
+    def test_year(self):
+        self.assertRange(
+            self.resolve('year'),
+            local(2025, 1, 1), self.now,
+            local(2024, 1, 1), end_of(2024, 12, 31)
+        )
+
+    def test_unknown_range_falls_back_to_month(self):
+        self.assertEqual(self.resolve('fortnight'), self.resolve('month'))
+
+    def test_custom_range_uses_preceding_period_of_same_length(self):
+        self.assertRange(
+            self.resolve('custom', '2025-05-06', '2025-05-15'),
+            local(2025, 5, 6), end_of(2025, 5, 15),
+            local(2025, 4, 26), end_of(2025, 5, 5)
+        )
+
+    def test_custom_month_to_date_clamps_to_previous_month_length(self):
+        self.assertRange(
+            self.resolve('custom', '2025-03-01', '2025-03-31'),
+            local(2025, 3, 1), end_of(2025, 3, 31),
+            local(2025, 2, 1), end_of(2025, 2, 28)
+        )
+
+    def test_custom_quarter_to_date(self):
+        self.assertRange(
+            self.resolve('custom', '2025-04-01', '2025-05-15'),
+            local(2025, 4, 1), end_of(2025, 5, 15),
+            local(2025, 1, 1), end_of(2025, 2, 14)
+        )
+
+    def test_custom_year_to_date_handles_leap_day(self):
+        self.assertRange(
+            self.resolve('custom', '2024-01-01', '2024-02-29'),
+            local(2024, 1, 1), end_of(2024, 2, 29),
+            local(2023, 1, 1), end_of(2023, 2, 28)
+        )
+
+    def test_invalid_custom_dates_fall_back_to_month(self):
+        month = self.resolve('month')
+        self.assertEqual(self.resolve('custom'), month)
+        self.assertEqual(self.resolve('custom', '2025-13-01', '2025-05-15'), month)
+        self.assertEqual(self.resolve('custom', '2025-05-15', '2025-05-01'), month)
+
+    def test_helpers(self):
+        self.assertEqual(DateRangeService.shift_months(date(2025, 1, 31), -1), date(2024, 12, 1))
+        self.assertEqual(DateRangeService.shift_months(date(2025, 11, 5), 3), date(2026, 2, 1))
+        self.assertEqual(DateRangeService.clamp_day(2025, 2, 31), date(2025, 2, 28))
@@ -3,10 +3,12 @@ from .views import (
     SalesAnalyticsView, CustomerAnalyticsView, InventoryAnalyticsView, 
     FinancialAnalyticsView
 )
+from .inventory_views import InventoryHistoryView
 
 urlpatterns = [
     path('sales/', SalesAnalyticsView.as_view(), name='sales-analytics'),
     path('customers/', CustomerAnalyticsView.as_view(), name='customer-analytics'),
     path('inventory/', InventoryAnalyticsView.as_view(), name='inventory-analytics'),
     path('financial/', FinancialAnalyticsView.as_view(), name='financial-analytics'),
+    path('inventory/history/', InventoryHistoryView.as_view(), name='inventory-history'),
 ]
\ No newline at end of file
@@ -23,6 +23,10 @@ from credits.models import Credits
 from stock.models import StockItem, StockLog
 from meter_readings.models import MeterReading
 from stock.services import StockCalculationService
+from .models import DailyShopMetrics
+from .services import DateRangeService, TrendService, RollupService, WaterConsumptionService
+from .cache import AnalyticsCache, cached_analytics
+from .concurrency import QueryDispatcher
 from .serializers import (
     InventoryAdjustmentSerializer,
     StockItemAnalyticsSerializer,
@@ -40,6 +44,7 @@ class AnalyticsViewSet(viewsets.ViewSet):
     permission_classes = [IsShopAgentOrDirector]
     
     @action(detail=False, methods=['get'])
+    @cached_analytics('sales')
     def sales(self, request):
         """Get sales analytics data"""
         # Get time range from query parameters
@@ -55,192 +60,18 @@ class AnalyticsViewSet(viewsets.ViewSet):
         # If shop_id is None, try to get it from data
         if shop_id is None:
             shop_id = request.data.get('shop_id', 'all')
-            print(f"Sales Analytics - Shop ID from request data: {shop_id}")        # Calculate date range based on time_range parameter
-        end_date = timezone.now()
-        
-        # Check if custom date range is provided
-        if time_range == 'custom':
-            # Get start and end dates from query parameters
-            start_date_str = request.query_params.get('start_date')
-            end_date_str = request.query_params.get('end_date')
-            
-            # Log the received custom date range
-            print(f"Custom date range received - start_date: {start_date_str}, end_date: {end_date_str}")
-            
-            if start_date_str and end_date_str:
-                try:
-                    # Parse the date strings (format: YYYY-MM-DD)
-                    start_date_parsed = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    end_date_parsed = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    
-                    # Convert to timezone-aware datetimes
-                    start_date = timezone.make_aware(datetime.combine(start_date_parsed, datetime.min.time()))
-                    end_date = timezone.make_aware(datetime.combine(end_date_parsed, datetime.max.time()))
-                      # For comparison, use a more logical previous period
-                    # Check if the custom date range aligns with a calendar year, quarter or month
-                    today = end_date_parsed
-                    start_of_year = datetime(today.year, 1, 1).date()
-                    is_year_to_date = (start_date_parsed == start_of_year)
-                    
-                    # Check if it's a month-to-date
-                    start_of_month = datetime(today.year, today.month, 1).date()
-                    is_month_to_date = (start_date_parsed == start_of_month)
-                    
-                    # Check if it's a quarter-to-date
-                    current_month = today.month
-                    current_quarter = (current_month - 1) // 3 + 1
-                    quarter_start_month = (current_quarter - 1) * 3 + 1
-                    start_of_quarter = datetime(today.year, quarter_start_month, 1).date()
-                    is_quarter_to_date = (start_date_parsed == start_of_quarter)
-                    
-                    # Use the appropriate comparison period based on the range type
-                    if is_year_to_date:
-                        # If it's a year-to-date range, compare with previous year
-                        previous_start_date = timezone.make_aware(datetime.combine(
-                            datetime(today.year - 1, start_date_parsed.month, start_date_parsed.day).date(),
-                            datetime.min.time()
-                        ))
-                        previous_end_date = timezone.make_aware(datetime.combine(
-                            datetime(today.year - 1, end_date_parsed.month, min(end_date_parsed.day, 28 if end_date_parsed.month == 2 else 30)).date(),
-                            datetime.max.time()
-                        ))
-                    elif is_month_to_date:
-                        # If it's a month-to-date range, compare with previous month
-                        if start_date_parsed.month == 1:  # January
-                            prev_month_year = today.year - 1
-                            prev_month = 12
-                        else:
-                            prev_month_year = today.year
-                            prev_month = start_date_parsed.month - 1
-                            
-                        previous_start_date = timezone.make_aware(datetime.combine(
-                            datetime(prev_month_year, prev_month, 1).date(),
-                            datetime.min.time()
-                        ))
-                        
-                        # Handle varying month lengths properly
-                        last_day_of_prev_month = min(end_date_parsed.day, 28 if prev_month == 2 else 30 if prev_month in [4, 6, 9, 11] else 31)
-                        previous_end_date = timezone.make_aware(datetime.combine(
-                            datetime(prev_month_year, prev_month, last_day_of_prev_month).date(),
-                            datetime.max.time()
-                        ))
-                    elif is_quarter_to_date:
-                        # If it's a quarter-to-date range, compare with previous quarter
-                        if quarter_start_month == 1:  # Q1
-                            prev_quarter_year = today.year - 1
-                            prev_quarter_month = 10  # October of previous year (Q4)
-                        else:
-                            prev_quarter_year = today.year
-                            prev_quarter_month = quarter_start_month - 3
-                            
-                        previous_start_date = timezone.make_aware(datetime.combine(
-                            datetime(prev_quarter_year, prev_quarter_month, 1).date(),
-                            datetime.min.time()
-                        ))
-                        
-                        # For the end date, calculate days in quarter
-                        days_in_range = (end_date_parsed - start_date_parsed).days
-                        previous_end_date = previous_start_date + timedelta(days=days_in_range, seconds=86399)
-                    else:
-                        # For other custom ranges, use same length previous period
-                        period_length = (end_date_parsed - start_date_parsed).days + 1
-                        previous_end_date = start_date - timedelta(seconds=1)
-                        previous_start_date = previous_end_date - timedelta(days=period_length) + timedelta(seconds=1)
-                    
-                    print(f"Using custom date range: {start_date} to {end_date}")
-                    print(f"Previous period: {previous_start_date} to {previous_end_date}")
-                except ValueError as e:
-                    # Fallback to default if date parsing fails
-                    print(f"Error parsing custom dates: {e}")
-                    today = end_date.date()
-                    first_day_of_month = today.replace(day=1)
-                    start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-                    previous_start_date = start_date - timedelta(days=30)
-                    previous_end_date = start_date
-            else:
-                # Fallback to default if dates not provided
-                today = end_date.date()
-                first_day_of_month = today.replace(day=1)
-                start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-                previous_start_date = start_date - timedelta(days=30)
-                previous_end_date = start_date
-        elif time_range == 'day':
-            # Set start_date to the beginning of today (midnight)
-            today = end_date.date()
-            start_date = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-            # Previous day for comparison
-            previous_day = today - timedelta(days=1)
-            previous_start_date = timezone.make_aware(datetime.combine(previous_day, datetime.min.time()))
-            previous_end_date = start_date
-        elif time_range == 'week':
-            # Get current weekday (0 = Monday in Python's datetime)
-            today = end_date.date()
-            # Find the first day of the current week (Monday)
-            current_weekday = today.weekday()
-            days_to_subtract = current_weekday  # 0 for Monday, 1 for Tuesday, etc.
-            start_of_week = today - timedelta(days=days_to_subtract)
-            start_date = timezone.make_aware(datetime.combine(start_of_week, datetime.min.time()))
-            # Previous week
-            previous_week_end = start_date - timedelta(seconds=1)
-            previous_week_start = previous_week_end - timedelta(days=6)
-            previous_start_date = previous_week_start
-            previous_end_date = previous_week_end
-        elif time_range == 'month':
-            # Set to first day of current month
-            today = end_date.date()
-            first_day_of_month = today.replace(day=1)
-            start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-            # Previous month
-            if first_day_of_month.month == 1:  # January
-                prev_month = datetime(first_day_of_month.year - 1, 12, 1)
-            else:
-                prev_month = datetime(first_day_of_month.year, first_day_of_month.month - 1, 1)
-            prev_month_end = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time())) - timedelta(seconds=1)
-            previous_start_date = timezone.make_aware(prev_month)
-            previous_end_date = prev_month_end
-        elif time_range == 'quarter':
-            # Determine current quarter
-            today = end_date.date()
-            current_month = today.month
-            current_quarter = (current_month - 1) // 3 + 1
-            quarter_start_month = (current_quarter - 1) * 3 + 1
-            # First day of the current quarter
-            first_day_of_quarter = datetime(today.year, quarter_start_month, 1).date()
-            start_date = timezone.make_aware(datetime.combine(first_day_of_quarter, datetime.min.time()))
-            # Previous quarter
-            if quarter_start_month == 1:  # Q1
-                prev_quarter_year = today.year - 1
-                prev_quarter_month = 10  # October of previous year (Q4)
-            else:
-                prev_quarter_year = today.year
-                prev_quarter_month = quarter_start_month - 3
-            prev_quarter_start = datetime(prev_quarter_year, prev_quarter_month, 1).date()
-            prev_quarter_end = timezone.make_aware(datetime.combine(first_day_of_quarter, datetime.min.time())) - timedelta(seconds=1)
-            previous_start_date = timezone.make_aware(datetime.combine(prev_quarter_start, datetime.min.time()))
-            previous_end_date = prev_quarter_end
-        elif time_range == 'year':
-            # Set to first day of current year
-            today = end_date.date()
-            first_day_of_year = datetime(today.year, 1, 1).date()
-            start_date = timezone.make_aware(datetime.combine(first_day_of_year, datetime.min.time()))
-            # Previous year
-            prev_year_start = datetime(today.year - 1, 1, 1).date()
-            prev_year_end = datetime(today.year, 1, 1).date() - timedelta(days=1)
-            previous_start_date = timezone.make_aware(datetime.combine(prev_year_start, datetime.min.time()))
-            previous_end_date = timezone.make_aware(datetime.combine(prev_year_end, datetime.max.time()))
-        else:
-            # Default to current month if time_range not recognized
-            today = end_date.date()
-            first_day_of_month = today.replace(day=1)
-            start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-            # Previous month for comparison
-            if first_day_of_month.month == 1:  # January
-                prev_month = datetime(first_day_of_month.year - 1, 12, 1)
-            else:
-                prev_month = datetime(first_day_of_month.year, first_day_of_month.month - 1, 1)
-            prev_month_end = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time())) - timedelta(seconds=1)
-            previous_start_date = timezone.make_aware(prev_month)
-            previous_end_date = prev_month_end
+            print(f"Sales Analytics - Shop ID from request data: {shop_id}")
+
+        # Calculate current and previous date ranges based on time_range parameter
+        date_range = DateRangeService.resolve(
+            time_range,
+            request.query_params.get('start_date'),
+            request.query_params.get('end_date')
+        )
+        start_date = date_range['start_date']
+        end_date = date_range['end_date']
+        previous_start_date = date_range['previous_start_date']
+        previous_end_date = date_range['previous_end_date']
 
         # Filter sales by date range
         sales_query = Sales.objects.filter(sold_at__gte=start_date, sold_at__lte=end_date)
@@ -251,34 +82,75 @@ class AnalyticsViewSet(viewsets.ViewSet):
             sales_query = sales_query.filter(shop_id=shop_id)
             refills_query = refills_query.filter(shop_id=shop_id)
 
+        # Totals come from the daily rollup instead of scanning every transaction
+        metrics_query = RollupService.get_queryset(start_date, end_date, shop_id)
+
+        # Daily/weekly/monthly sales trend; each source is grouped once by time bucket
+        if time_range == 'day':
+            # For a day, get hourly breakdown from the raw transactions
+            trend_args = ({
+                'sales': (sales_query, 'sold_at'),
+                'refills': (refills_query, 'created_at'),
+            }, 'hour', start_date.replace(hour=23), 24)
+        else:
+            rollup_source = {
+                'metrics': (metrics_query, 'date', {
+                    'revenue': Sum(F('sales_revenue') + F('refill_revenue')),
+                    'count': Sum(F('sales_count') + F('refill_count')),
+                }),
+            }
+            if time_range == 'week':
+                # For a week, get daily breakdown
+                trend_args = (rollup_source, 'day', end_date, 7)
+                trend_label = lambda bucket: bucket.strftime('%Y-%m-%d')
+            else:
+                # For month/quarter/year, get weekly breakdown
+                num_weeks = 4  # For month
+                if time_range == 'quarter':
+                    num_weeks = 12
+                elif time_range == 'year':
+                    num_weeks = 52
+                trend_args = (rollup_source, 'week', end_date, num_weeks)
+                trend_label = lambda bucket: f"{bucket.strftime('%m/%d')} - {(bucket + timedelta(days=6)).strftime('%m/%d')}"
+
+        # The aggregates below are independent, so they run concurrently on the
+        # analytics query pool and the response waits only for the slowest one
+        results = QueryDispatcher.run({
+            # Current and previous period totals are read in a single scan of the rollup
+            'comparison': lambda: RollupService.get_comparison_totals(
+                start_date, end_date, previous_start_date, previous_end_date, shop_id
+            ),
+            # Payment-mode and per-shop revenue come from one conditional-aggregation query
+            'revenue_breakdown': lambda: RollupService.get_revenue_breakdown(metrics_query),
+            'shops': lambda: list(Shops.objects.values_list('id', 'shopName')),
+            'trend': lambda: TrendService.build_trend(*trend_args),
+            # Top selling packages, aggregated by package for sales and refills
+            'sales_by_pkg': lambda: list(sales_query.values('package__description').annotate(
+                total_qty=Sum('quantity'),
+                total_revenue=Sum('cost')
+            )),
+            'refills_by_pkg': lambda: list(refills_query.values('package__description').annotate(
+                total_qty=Sum('quantity'),
+                total_revenue=Sum('cost')
+            )),
+        })
+        totals, previous_totals = results['comparison']
+
         # Calculate total revenue
-        sales_revenue = sales_query.aggregate(total=Sum('cost'))['total'] or 0
-        refill_revenue = refills_query.aggregate(total=Sum('cost'))['total'] or 0
+        sales_revenue = totals['sales_revenue']
+        refill_revenue = totals['refill_revenue']
         total_revenue = sales_revenue + refill_revenue
 
         # Calculate sales counts
-        sales_count = sales_query.count()
-        refill_count = refills_query.count()
+        sales_count = totals['sales_count']
+        refill_count = totals['refill_count']
         total_sales_count = sales_count + refill_count
 
-        # Calculate previous period data for percentage changes
-        previous_sales_query = Sales.objects.filter(sold_at__gte=previous_start_date, sold_at__lte=previous_end_date)
-        previous_refills_query = Refills.objects.filter(created_at__gte=previous_start_date, created_at__lte=previous_end_date)
-
-        # Filter by shop if specified
-        if shop_id and shop_id != 'all':
-            previous_sales_query = previous_sales_query.filter(shop_id=shop_id)
-            previous_refills_query = previous_refills_query.filter(shop_id=shop_id)
-
         # Calculate previous period revenue
-        previous_sales_revenue = previous_sales_query.aggregate(total=Sum('cost'))['total'] or 0
-        previous_refill_revenue = previous_refills_query.aggregate(total=Sum('cost'))['total'] or 0
-        previous_total_revenue = previous_sales_revenue + previous_refill_revenue
+        previous_total_revenue = previous_totals['sales_revenue'] + previous_totals['refill_revenue']
 
         # Calculate previous period sales counts
-        previous_sales_count = previous_sales_query.count()
-        previous_refill_count = previous_refills_query.count()
-        previous_total_sales_count = previous_sales_count + previous_refill_count
+        previous_total_sales_count = previous_totals['sales_count'] + previous_totals['refill_count']
 
         # Calculate percentage changes
         revenue_change_percentage = 0
@@ -290,93 +162,42 @@ class AnalyticsViewSet(viewsets.ViewSet):
         if previous_total_sales_count > 0:
             sales_count_change_percentage = round(((total_sales_count - previous_total_sales_count) / previous_total_sales_count) * 100, 1)
 
+        revenue_breakdown = results['revenue_breakdown']
+
         # Calculate sales by payment mode
         sales_by_payment_mode = {
-            'MPESA': (sales_query.filter(payment_mode='MPESA').aggregate(total=Sum('cost'))['total'] or 0) +
-                    (refills_query.filter(payment_mode='MPESA').aggregate(total=Sum('cost'))['total'] or 0),
-            'CASH': (sales_query.filter(payment_mode='CASH').aggregate(total=Sum('cost'))['total'] or 0) +
-                   (refills_query.filter(payment_mode='CASH').aggregate(total=Sum('cost'))['total'] or 0),
-            'CREDIT': (sales_query.filter(payment_mode='CREDIT').aggregate(total=Sum('cost'))['total'] or 0) +
-                     (refills_query.filter(payment_mode='CREDIT').aggregate(total=Sum('cost'))['total'] or 0)
+            mode: sum(shop_revenue[mode] for shop_revenue in revenue_breakdown.values())
+            for mode in RollupService.PAYMENT_MODES
         }
 
         # Calculate sales by shop
         sales_by_shop = {}
-        shops = Shops.objects.all()
-        for shop in shops:
-            shop_sales = sales_query.filter(shop=shop).aggregate(total=Sum('cost'))['total'] or 0
-            shop_refills = refills_query.filter(shop=shop).aggregate(total=Sum('cost'))['total'] or 0
-            sales_by_shop[shop.shopName] = shop_sales + shop_refills
+        for shop_pk, shop_name in results['shops']:
+            sales_by_shop[shop_name] = revenue_breakdown.get(shop_pk, {}).get('total', 0)
 
-        # Calculate daily/weekly/monthly sales for trend analysis
+        trend = results['trend']
         if time_range == 'day':
-            # For a day, get hourly breakdown
-            sales_trend = []
-            for hour in range(24):
-                hour_start = start_date.replace(hour=hour, minute=0, second=0)
-                hour_end = start_date.replace(hour=hour, minute=59, second=59)
-                hour_sales = sales_query.filter(sold_at__gte=hour_start, sold_at__lte=hour_end)
-                hour_refills = refills_query.filter(created_at__gte=hour_start, created_at__lte=hour_end)
-                hour_revenue = (hour_sales.aggregate(total=Sum('cost'))['total'] or 0) + (hour_refills.aggregate(total=Sum('cost'))['total'] or 0)
-                hour_count = hour_sales.count() + hour_refills.count()
-                sales_trend.append({
-                    'date': hour_start.strftime('%H:%M'),
-                    'revenue': hour_revenue,
-                    'count': hour_count
-                })
-        elif time_range == 'week':
-            # For a week, get daily breakdown
-            sales_trend = []
-            for i in range(7):
-                day_date = end_date - timedelta(days=6-i)
-                day_start = day_date.replace(hour=0, minute=0, second=0)
-                day_end = day_date.replace(hour=23, minute=59, second=59)
-                day_sales = sales_query.filter(sold_at__gte=day_start, sold_at__lte=day_end)
-                day_refills = refills_query.filter(created_at__gte=day_start, created_at__lte=day_end)
-                day_revenue = (day_sales.aggregate(total=Sum('cost'))['total'] or 0) + (day_refills.aggregate(total=Sum('cost'))['total'] or 0)
-                day_count = day_sales.count() + day_refills.count()
-                sales_trend.append({
-                    'date': day_date.strftime('%Y-%m-%d'),
-                    'revenue': day_revenue,
-                    'count': day_count
-                })
+            sales_trend = [
+                {
+                    'date': bucket['start'].strftime('%H:%M'),
+                    'revenue': bucket['sales']['total'] + bucket['refills']['total'],
+                    'count': bucket['sales']['count'] + bucket['refills']['count']
+                }
+                for bucket in trend
+            ]
         else:
-            # For month/quarter/year, get weekly breakdown
-            sales_trend = []
-            num_weeks = 4  # For month
-            if time_range == 'quarter':
-                num_weeks = 12
-            elif time_range == 'year':
-                num_weeks = 52
-                
-            for i in range(num_weeks):
-                week_end = end_date - timedelta(days=7*i)
-                week_start = week_end - timedelta(days=6)
-                week_sales = sales_query.filter(sold_at__gte=week_start, sold_at__lte=week_end)
-                week_refills = refills_query.filter(created_at__gte=week_start, created_at__lte=week_end)
-                week_revenue = (week_sales.aggregate(total=Sum('cost'))['total'] or 0) + (week_refills.aggregate(total=Sum('cost'))['total'] or 0)
-                week_count = week_sales.count() + week_refills.count()
-                sales_trend.append({
-                    'date': f"{week_start.strftime('%m/%d')} - {week_end.strftime('%m/%d')}",
-                    'revenue': week_revenue,
-                    'count': week_count
-                })
-            # Reverse to get chronological order
-            sales_trend.reverse()
+            sales_trend = [
+                {
+                    'date': trend_label(bucket['start']),
+                    'revenue': bucket['metrics']['revenue'],
+                    'count': bucket['metrics']['count']
+                }
+                for bucket in trend
+            ]
+
+        sales_by_pkg = results['sales_by_pkg']
+        refills_by_pkg = results['refills_by_pkg']
 
-        # OPTIMIZED: Get top selling packages using aggregation
-        # Aggregate sales by package
-        sales_by_pkg = sales_query.values('package__description').annotate(
-            total_qty=Sum('quantity'),
-            total_revenue=Sum('cost')
-        )
-        
-        # Aggregate refills by package  
-        refills_by_pkg = refills_query.values('package__description').annotate(
-            total_qty=Sum('quantity'),
-            total_revenue=Sum('cost')
-        )
-        
         # Combine into dictionary
         sales_by_package = {}
         for item in sales_by_pkg:
@@ -424,6 +245,7 @@ class AnalyticsViewSet(viewsets.ViewSet):
         return Response(response_data)
     
     @action(detail=False, methods=['get'])
+    @cached_analytics('customers')
     def customers(self, request):
         """Get customer analytics data - OPTIMIZED VERSION with time filtering"""
         from django.db.models import Max, Count, Avg
@@ -435,35 +257,16 @@ class AnalyticsViewSet(viewsets.ViewSet):
         
         # Get time_range and calculate date range
         time_range = request.query_params.get('time_range', 'month')
-        end_date = timezone.now()
-        
-        # Calculate date range based on time_range parameter
-        if time_range == 'custom':
-            start_date_str = request.query_params.get('start_date')
-            end_date_str = request.query_params.get('end_date')
-            if start_date_str and end_date_str:
-                try:
-                    start_date_parsed = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    end_date_parsed = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    start_date = timezone.make_aware(datetime.combine(start_date_parsed, datetime.min.time()))
-                    end_date = timezone.make_aware(datetime.combine(end_date_parsed, datetime.max.time()))
-                except ValueError:
-                    start_date = timezone.now() - timedelta(days=30)
-            else:
-                start_date = timezone.now() - timedelta(days=30)
-        elif time_range == 'day':
-            start_date = timezone.make_aware(datetime.combine(end_date.date(), datetime.min.time()))
-        elif time_range == 'week':
-            today = end_date.date()
-            start_of_week = today - timedelta(days=today.weekday())
-            start_date = timezone.make_aware(datetime.combine(start_of_week, datetime.min.time()))
-        elif time_range == 'year':
-            first_day_of_year = datetime(end_date.year, 1, 1).date()
-            start_date = timezone.make_aware(datetime.combine(first_day_of_year, datetime.min.time()))
-        else:  # month
-            first_day_of_month = end_date.date().replace(day=1)
-            start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-        
+
+        # Calculate current and previous date ranges based on time_range parameter
+        date_range = DateRangeService.resolve(
+            time_range,
+            request.query_params.get('start_date'),
+            request.query_params.get('end_date')
+        )
+        start_date = date_range['start_date']
+        end_date = date_range['end_date']
+
         # Base customer query
         customers_query = Customers.objects.all()
         
@@ -495,8 +298,10 @@ class AnalyticsViewSet(viewsets.ViewSet):
             refills_query = refills_query.filter(shop_id=shop_id)
         active_customers = refills_query.values('customer_id').distinct().count()
         
-        # Calculate loyalty redemptions IN THE SELECTED PERIOD
-        loyalty_redemptions = refills_query.filter(is_free=True).count()
+        # Calculate loyalty redemptions IN THE SELECTED PERIOD (from the daily rollup)
+        loyalty_redemptions = RollupService.get_totals(
+            RollupService.get_queryset(start_date, end_date, shop_id)
+        )['free_refill_count']
         
         # OPTIMIZED: Skip avg_time_between_refills calculation (too expensive)
         # Use a simplified estimate based on total refills / active customers
@@ -515,13 +320,16 @@ class AnalyticsViewSet(viewsets.ViewSet):
             credit_sales = credit_sales.filter(shop_id=shop_id)
             credit_refills = credit_refills.filter(shop_id=shop_id)
             
-        credits_given = (credit_sales.aggregate(total=Sum('cost'))['total'] or 0) + \
-                        (credit_refills.aggregate(total=Sum('cost'))['total'] or 0)
-        
-        credits_query = Credits.objects.all()
+        # All-time credit given and repaid, read from the daily rollup in one query
+        all_metrics = DailyShopMetrics.objects.all()
         if shop_id and shop_id != 'all':
-            credits_query = credits_query.filter(shop_id=shop_id)
-        credits_repaid = credits_query.aggregate(total=Sum('money_paid'))['total'] or 0
+            all_metrics = all_metrics.filter(shop_id=shop_id)
+        credit_totals = all_metrics.aggregate(
+            given=Sum(F('sales_revenue') + F('refill_revenue'), filter=Q(payment_mode='CREDIT')),
+            repaid=Sum('credit_repaid')
+        )
+        credits_given = credit_totals['given'] or 0
+        credits_repaid = credit_totals['repaid'] or 0
         credits_outstanding = credits_given - credits_repaid
         
         # OPTIMIZED: Customer growth - simplified to reduce queries
@@ -690,6 +498,7 @@ class AnalyticsViewSet(viewsets.ViewSet):
         return Response(response_data)
     
     @action(detail=False, methods=['get'])
+    @cached_analytics('inventory')
     def inventory(self, request):
         """Get inventory analytics data"""
         # Get shop_id from either query params, data, or 'all' as default
@@ -727,8 +536,9 @@ class AnalyticsViewSet(viewsets.ViewSet):
         low_stock_items = 0
         total_stock_items = 0
         
-        for item in stock_items_query:
-            quantity = StockCalculationService.get_current_stock_level(item)
+        # Current quantities are annotated in the same query as the items
+        for item in StockCalculationService.annotate_current_quantity(stock_items_query):
+            quantity = item.current_quantity
             
             # Use the threshold and reorder_point fields from the stock item
             if quantity <= item.threshold:
@@ -745,50 +555,45 @@ class AnalyticsViewSet(viewsets.ViewSet):
                 'reorder_point': item.reorder_point
             })
             
-        # Calculate water consumption from meter readings
-        water_consumption = 0
-        water_wastage = 0
-        
-        # Get meter readings from the last 7 days
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        meter_readings_query = MeterReading.objects.filter(reading_date__gte=seven_days_ago)
-        
-        if shop_id and shop_id != 'all':
-            meter_readings_query = meter_readings_query.filter(shop_id=shop_id)
-            
-        # Group by shop and reading_type to calculate differences
-        water_consumption_trends = []
-        
-        # OPTIMIZED: Calculate total water consumption using aggregation
-        refills_query = Refills.objects.filter(created_at__gte=seven_days_ago)
-        if shop_id and shop_id != 'all':
-            refills_query = refills_query.filter(shop_id=shop_id)
-        
-        # Use refill count * average water amount (20L standard) as estimate
-        total_refill_qty = refills_query.aggregate(total=Sum('quantity'))['total'] or 0
-        water_consumption = total_refill_qty * 20  # Assume 20L per refill as average
-            
-        # Estimate water wastage (5% of consumption for demo)
-        water_wastage = round(water_consumption * 0.05)
-        
-        # OPTIMIZED: Generate daily water consumption using aggregation
-        for i in range(7):
-            day_date = timezone.now().date() - timedelta(days=6-i)
-            day_qty = refills_query.filter(created_at__date=day_date).aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
-            day_consumption = day_qty * 20  # Assume 20L average
-                
-            water_consumption_trends.append({
-                'date': day_date.strftime('%Y-%m-%d'),
-                'consumption': day_consumption
-            })
-            
+        # Water consumption window: the requested time_range, or the last 7 days
+        if 'time_range' in request.query_params:
+            date_range = DateRangeService.resolve(
+                request.query_params.get('time_range'),
+                request.query_params.get('start_date'),
+                request.query_params.get('end_date')
+            )
+            first_day = timezone.localtime(date_range['start_date']).date()
+            last_day = timezone.localtime(date_range['end_date']).date()
+        else:
+            last_day = timezone.localdate()
+            first_day = last_day - timedelta(days=6)
+        window_start = TrendService.local_midnight(first_day)
+
+        # Metered consumption per day (LAG over each meter's readings) compared
+        # with the litres actually dispensed by refills
+        water_series = WaterConsumptionService.get_daily_series(first_day, last_day, shop_id)
+        water_summary = WaterConsumptionService.summarize(water_series)
+        water_consumption = water_summary['consumption']
+        water_wastage = water_summary['wastage']
+
+        water_consumption_trends = [
+            {
+                'date': day['date'],
+                'consumption': day['consumption'],
+                'dispensed': day['dispensed'],
+                'wastage': day['wastage']
+            }
+            for day in water_series
+        ]
+
         # OPTIMIZED: Calculate stock movements using aggregated query
         from django.db.models.functions import Concat
         from django.db.models import Case, When
         
-        stock_logs_query = StockLog.objects.filter(log_date__gte=seven_days_ago)
+        stock_logs_query = StockLog.objects.filter(
+            log_date__gte=window_start,
+            log_date__lt=TrendService.local_midnight(last_day + timedelta(days=1))
+        )
         if shop_id and shop_id != 'all':
             stock_logs_query = stock_logs_query.filter(stock_item__shop_id=shop_id)
         
@@ -829,6 +634,8 @@ class AnalyticsViewSet(viewsets.ViewSet):
             'low_stock_items': low_stock_items,
             'water_consumption': water_consumption,
             'water_wastage': water_wastage,
+            'water_dispensed': water_summary['dispensed'],
+            'water_wastage_percentage': water_summary['wastage_percentage'],
             'stock_items': stock_items,
             'water_consumption_trends': water_consumption_trends,
             'stock_movements': stock_movements
@@ -837,6 +644,7 @@ class AnalyticsViewSet(viewsets.ViewSet):
         return Response(response_data)
     
     @action(detail=False, methods=['get'])
+    @cached_analytics('financial')
     def financial(self, request):
         """Get financial analytics data"""
         # Get time range from query parameters
@@ -852,256 +660,70 @@ class AnalyticsViewSet(viewsets.ViewSet):
         # If shop_id is None, try to get it from data
         if shop_id is None:
             shop_id = request.data.get('shop_id', 'all')
-            print(f"Financial Analytics - Shop ID from request data: {shop_id}")        # Calculate date range based on time_range parameter
-        end_date = timezone.now()
-        
-        # Check if custom date range is provided
-        if time_range == 'custom':
-            # Get start and end dates from query parameters
-            start_date_str = request.query_params.get('start_date')
-            end_date_str = request.query_params.get('end_date')
-            
-            # Log the received custom date range
-            print(f"Financial Analytics - Custom date range received - start_date: {start_date_str}, end_date: {end_date_str}")
-            
-            if start_date_str and end_date_str:
-                try:
-                    # Parse the date strings (format: YYYY-MM-DD)
-                    start_date_parsed = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                    end_date_parsed = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                    
-                    # Convert to timezone-aware datetimes
-                    start_date = timezone.make_aware(datetime.combine(start_date_parsed, datetime.min.time()))                    
-                    end_date = timezone.make_aware(datetime.combine(end_date_parsed, datetime.max.time()))
-                    
-                    # For comparison, use a more logical previous period
-                    # Check if the custom date range aligns with a calendar year, quarter or month
-                    today = end_date_parsed
-                    start_of_year = datetime(today.year, 1, 1).date()
-                    is_year_to_date = (start_date_parsed == start_of_year)
-                    
-                    # Check if it's a month-to-date
-                    start_of_month = datetime(today.year, today.month, 1).date()
-                    is_month_to_date = (start_date_parsed == start_of_month)
-                    
-                    # Check if it's a quarter-to-date
-                    current_month = today.month
-                    current_quarter = (current_month - 1) // 3 + 1
-                    quarter_start_month = (current_quarter - 1) * 3 + 1
-                    start_of_quarter = datetime(today.year, quarter_start_month, 1).date()
-                    is_quarter_to_date = (start_date_parsed == start_of_quarter)
-                    
-                    # Also track previous period data for comparison
-                    if is_year_to_date:
-                        # If it's a year-to-date range, compare with previous year
-                        previous_start_date = timezone.make_aware(datetime.combine(
-                            datetime(today.year - 1, start_date_parsed.month, start_date_parsed.day).date(),
-                            datetime.min.time()
-                        ))
-                        previous_end_date = timezone.make_aware(datetime.combine(
-                            datetime(today.year - 1, end_date_parsed.month, min(end_date_parsed.day, 28 if end_date_parsed.month == 2 else 30)).date(),
-                            datetime.max.time()
-                        ))
-                    elif is_month_to_date:
-                        # If it's a month-to-date range, compare with previous month
-                        if start_date_parsed.month == 1:  # January
-                            prev_month_year = today.year - 1
-                            prev_month = 12
-                        else:
-                            prev_month_year = today.year
-                            prev_month = start_date_parsed.month - 1
-                            
-                        previous_start_date = timezone.make_aware(datetime.combine(
-                            datetime(prev_month_year, prev_month, 1).date(),
-                            datetime.min.time()
-                        ))
-                        
-                        # Handle varying month lengths properly
-                        last_day_of_prev_month = min(end_date_parsed.day, 28 if prev_month == 2 else 30 if prev_month in [4, 6, 9, 11] else 31)
-                        previous_end_date = timezone.make_aware(datetime.combine(
-                            datetime(prev_month_year, prev_month, last_day_of_prev_month).date(),
-                            datetime.max.time()
-                        ))
-                    elif is_quarter_to_date:
-                        # If it's a quarter-to-date range, compare with previous quarter
-                        if quarter_start_month == 1:  # Q1
-                            prev_quarter_year = today.year - 1
-                            prev_quarter_month = 10  # October of previous year (Q4)
-                        else:
-                            prev_quarter_year = today.year
-                            prev_quarter_month = quarter_start_month - 3
-                            
-                        previous_start_date = timezone.make_aware(datetime.combine(
-                            datetime(prev_quarter_year, prev_quarter_month, 1).date(),
-                            datetime.min.time()
-                        ))
-                        
-                        # For the end date, calculate days in quarter
-                        days_in_range = (end_date_parsed - start_date_parsed).days
-                        previous_end_date = previous_start_date + timedelta(days=days_in_range, seconds=86399)
-                    else:
-                        # For other custom ranges, use same length previous period
-                        period_length = (end_date_parsed - start_date_parsed).days + 1
-                        previous_end_date = start_date - timedelta(seconds=1)
-                        previous_start_date = previous_end_date - timedelta(days=period_length) + timedelta(seconds=1)
-                    
-                    print(f"Financial Analytics - Using custom date range: {start_date} to {end_date}")
-                    print(f"Financial Analytics - Previous period: {previous_start_date} to {previous_end_date}")
-                except ValueError as e:
-                    # Fallback to default if date parsing fails
-                    print(f"Financial Analytics - Error parsing custom dates: {e}")
-                    today = end_date.date()
-                    first_day_of_month = today.replace(day=1)
-                    start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-            else:
-                # Fallback to default if dates not provided
-                today = end_date.date()
-                first_day_of_month = today.replace(day=1)
-                start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-        elif time_range == 'day':
-            # Set start_date to the beginning of today (midnight)
-            today = end_date.date()
-            start_date = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-        elif time_range == 'week':
-            # Get current weekday (0 = Monday in Python's datetime)
-            today = end_date.date()
-            # Find the first day of the current week (Monday)
-            current_weekday = today.weekday()
-            days_to_subtract = current_weekday  # 0 for Monday, 1 for Tuesday, etc.
-            start_of_week = today - timedelta(days=days_to_subtract)
-            start_date = timezone.make_aware(datetime.combine(start_of_week, datetime.min.time()))
-        elif time_range == 'month':
-            # Set to first day of current month
-            today = end_date.date()
-            first_day_of_month = today.replace(day=1)
-            start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))
-        elif time_range == 'quarter':
-            # Determine current quarter
-            today = end_date.date()
-            current_month = today.month
-            current_quarter = (current_month - 1) // 3 + 1
-            quarter_start_month = (current_quarter - 1) * 3 + 1
-            # First day of the current quarter
-            first_day_of_quarter = datetime(today.year, quarter_start_month, 1).date()
-            start_date = timezone.make_aware(datetime.combine(first_day_of_quarter, datetime.min.time()))
-        elif time_range == 'year':
-            # Set to first day of current year
-            today = end_date.date()
-            first_day_of_year = datetime(today.year, 1, 1).date()
-            start_date = timezone.make_aware(datetime.combine(first_day_of_year, datetime.min.time()))
-        else:
-            # Default to current month if time_range not recognized
-            today = end_date.date()
-            first_day_of_month = today.replace(day=1)
-            start_date = timezone.make_aware(datetime.combine(first_day_of_month, datetime.min.time()))        # Filter queries by date range
-        sales_query = Sales.objects.filter(sold_at__gte=start_date, sold_at__lte=end_date)
-        refills_query = Refills.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
-        expenses_query = Expenses.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
-        credits_query = Credits.objects.filter(payment_date__gte=start_date, payment_date__lte=end_date)
-        
-        # For comparison, also filter previous period data
-        # Define previous_start_date and previous_end_date if not already defined
-        if 'previous_start_date' not in locals() or 'previous_end_date' not in locals():
-            if time_range == 'day':
-                # Previous day
-                previous_day = end_date.date() - timedelta(days=1)
-                previous_start_date = timezone.make_aware(datetime.combine(previous_day, datetime.min.time()))
-                previous_end_date = timezone.make_aware(datetime.combine(previous_day, datetime.max.time()))
-            elif time_range == 'week':
-                # Previous week
-                previous_week_end = start_date - timedelta(seconds=1)
-                previous_week_start = previous_week_end - timedelta(days=6)
-                previous_start_date = previous_week_start
-                previous_end_date = previous_week_end
-            elif time_range == 'month':
-                # Previous month
-                today = end_date.date()
-                first_day_of_month = today.replace(day=1)
-                if first_day_of_month.month == 1:  # January
-                    prev_month_year = first_day_of_month.year - 1
-                    prev_month = 12
-                else:
-                    prev_month_year = first_day_of_month.year
-                    prev_month = first_day_of_month.month - 1
-                previous_start_date = timezone.make_aware(datetime.combine(
-                    datetime(prev_month_year, prev_month, 1).date(),
-                    datetime.min.time()
-                ))
-                # Get last day of previous month
-                if prev_month == 12:  # December
-                    last_day = datetime(prev_month_year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    last_day = datetime(prev_month_year, prev_month + 1, 1) - timedelta(days=1)
-                previous_end_date = timezone.make_aware(datetime.combine(
-                    last_day.date(),
-                    datetime.max.time()
-                ))
-            elif time_range == 'quarter':
-                # Previous quarter
-                today = end_date.date()
-                current_month = today.month
-                current_quarter = (current_month - 1) // 3 + 1
-                quarter_start_month = (current_quarter - 1) * 3 + 1
-                if quarter_start_month == 1:  # Q1
-                    prev_quarter_year = today.year - 1
-                    prev_quarter_month = 10  # October of previous year (Q4)
-                else:
-                    prev_quarter_year = today.year
-                    prev_quarter_month = quarter_start_month - 3
-                previous_start_date = timezone.make_aware(datetime.combine(
-                    datetime(prev_quarter_year, prev_quarter_month, 1).date(),
-                    datetime.min.time()
-                ))
-                # End date is one day before the start of current quarter
-                first_day_of_current_quarter = datetime(today.year, quarter_start_month, 1).date()
-                previous_end_date = timezone.make_aware(datetime.combine(
-                    first_day_of_current_quarter - timedelta(days=1),
-                    datetime.max.time()
-                ))
-            elif time_range == 'year':
-                # Previous year
-                today = end_date.date()
-                previous_start_date = timezone.make_aware(datetime.combine(
-                    datetime(today.year - 1, 1, 1).date(),
-                    datetime.min.time()
-                ))
-                previous_end_date = timezone.make_aware(datetime.combine(
-                    datetime(today.year - 1, 12, 31).date(),
-                    datetime.max.time()
-                ))
-            else:
-                # Default to previous month
-                today = end_date.date()
-                first_day_of_month = today.replace(day=1)
-                previous_end_date = timezone.make_aware(datetime.combine(
-                    first_day_of_month - timedelta(days=1),
-                    datetime.max.time()
-                ))
-                previous_start_date = timezone.make_aware(datetime.combine(
-                    previous_end_date.replace(day=1),
-                    datetime.min.time()
-                ))
-        
-        # Get previous period queries
-        previous_sales_query = Sales.objects.filter(sold_at__gte=previous_start_date, sold_at__lte=previous_end_date)
-        previous_refills_query = Refills.objects.filter(created_at__gte=previous_start_date, created_at__lte=previous_end_date)
-        previous_expenses_query = Expenses.objects.filter(created_at__gte=previous_start_date, created_at__lte=previous_end_date)
-        previous_credits_query = Credits.objects.filter(payment_date__gte=previous_start_date, payment_date__lte=previous_end_date)
+            print(f"Financial Analytics - Shop ID from request data: {shop_id}")
+
+        # Calculate current and previous date ranges based on time_range parameter
+        date_range = DateRangeService.resolve(
+            time_range,
+            request.query_params.get('start_date'),
+            request.query_params.get('end_date')
+        )
+        start_date = date_range['start_date']
+        end_date = date_range['end_date']
+        previous_start_date = date_range['previous_start_date']
+        previous_end_date = date_range['previous_end_date']
 
+        # Revenue and credit totals are read from the rollup; expense rows are still
+        # needed for the category breakdown and recent expenses list
+        expenses_query = Expenses.objects.filter(created_at__gte=start_date, created_at__lte=end_date)
+        
         # Filter by shop if specified
         if shop_id and shop_id != 'all':
-            sales_query = sales_query.filter(shop_id=shop_id)
-            refills_query = refills_query.filter(shop_id=shop_id)
             expenses_query = expenses_query.filter(shop_id=shop_id)
-            credits_query = credits_query.filter(shop_id=shop_id)
+
+        # Totals come from the daily rollup instead of scanning every transaction
+        metrics_query = RollupService.get_queryset(start_date, end_date, shop_id)
+
+        # Monthly financial trend; the rollup is grouped once by time bucket
+        trend_sources = {
+            'metrics': (metrics_query, 'date', {
+                'revenue': Sum(F('sales_revenue') + F('refill_revenue')),
+                'expenses': Sum('expenses_total'),
+            }),
+        }
+        if time_range == 'month':
+            # For month, get weekly breakdown labelled Week 1, Week 2, etc.
+            trend_args = (trend_sources, 'week', end_date, 4)
+        else:
+            # For quarter/year, get monthly breakdown
+            num_months = 3  # For quarter
+            if time_range == 'year':
+                num_months = 12
+            trend_args = (trend_sources, 'month', end_date, num_months)
+
+        # The aggregates below are independent, so they run concurrently on the
+        # analytics query pool and the response waits only for the slowest one
+        results = QueryDispatcher.run({
+            # Current and previous period totals are read in a single scan of the rollup
+            'comparison': lambda: RollupService.get_comparison_totals(
+                start_date, end_date, previous_start_date, previous_end_date, shop_id
+            ),
+            'revenue_breakdown': lambda: RollupService.get_revenue_breakdown(metrics_query),
+            'shops': lambda: list(Shops.objects.values_list('id', 'shopName')),
+            'trend': lambda: TrendService.build_trend(*trend_args),
+            # Expense rows for the category breakdown and recent expenses, newest first
+            'expenses': lambda: list(expenses_query.order_by('-created_at')),
+        })
+        totals, previous_totals = results['comparison']
+        expenses = results['expenses']
 
         # Calculate total revenue
-        sales_revenue = sales_query.aggregate(total=Sum('cost'))['total'] or 0
-        refill_revenue = refills_query.aggregate(total=Sum('cost'))['total'] or 0
+        sales_revenue = totals['sales_revenue']
+        refill_revenue = totals['refill_revenue']
         total_revenue = sales_revenue + refill_revenue
 
         # Calculate total expenses
-        total_expenses = expenses_query.aggregate(total=Sum('cost'))['total'] or 0
+        total_expenses = totals['expenses_total']
 
         # Calculate gross profit (revenue - direct expenses)
         # For simplicity, we'll assume 30% of expenses are direct costs
@@ -1118,7 +740,7 @@ class AnalyticsViewSet(viewsets.ViewSet):
 
         # Group expenses by category
         expense_categories = {}
-        for expense in expenses_query:
+        for expense in expenses:
             category = expense.description.split(' - ')[0] if ' - ' in expense.description else 'Other'
             # Simplify categories
             if 'Electricity' in category or 'Water' in category or 'Utility' in category:
@@ -1134,71 +756,33 @@ class AnalyticsViewSet(viewsets.ViewSet):
                 expense_categories[category] = 0
             expense_categories[category] += expense.cost
 
-        # Calculate revenue by shop
+        # Calculate revenue by shop from the grouped rollup query
+        revenue_breakdown = results['revenue_breakdown']
         revenue_by_shop = {}
-        shops = Shops.objects.all()
-        for shop in shops:
-            shop_sales = sales_query.filter(shop=shop).aggregate(total=Sum('cost'))['total'] or 0
-            shop_refills = refills_query.filter(shop=shop).aggregate(total=Sum('cost'))['total'] or 0
-            revenue_by_shop[shop.shopName] = shop_sales + shop_refills
+        for shop_pk, shop_name in results['shops']:
+            revenue_by_shop[shop_name] = revenue_breakdown.get(shop_pk, {}).get('total', 0)
 
-        # Calculate monthly financial trends
-        monthly_financials = []
-        
+        # Label the trend buckets
+        trend = results['trend']
         if time_range == 'month':
-            # For month, get weekly breakdown
-            for i in range(4):  # 4 weeks
-                week_end = end_date - timedelta(days=7*i)
-                week_start = week_end - timedelta(days=6)
-                
-                week_sales = sales_query.filter(sold_at__gte=week_start, sold_at__lte=week_end)
-                week_refills = refills_query.filter(created_at__gte=week_start, created_at__lte=week_end)
-                week_expenses = expenses_query.filter(created_at__gte=week_start, created_at__lte=week_end)
-                
-                week_revenue = (week_sales.aggregate(total=Sum('cost'))['total'] or 0) + \
-                              (week_refills.aggregate(total=Sum('cost'))['total'] or 0)
-                              
-                week_expense = week_expenses.aggregate(total=Sum('cost'))['total'] or 0
-                week_profit = week_revenue - week_expense
-                
-                monthly_financials.append({
-                    'month': f"Week {4-i}",  # Label as Week 1, Week 2, etc.
-                    'revenue': week_revenue,
-                    'expenses': week_expense,
-                    'profit': week_profit
-                })
+            trend_labels = [f"Week {i + 1}" for i in range(len(trend))]
         else:
-            # For quarter/year, get monthly breakdown
-            num_months = 3  # For quarter
-            if time_range == 'year':
-                num_months = 12
-                
-            for i in range(num_months):
-                month_end = end_date.replace(day=1) - timedelta(days=1)  # Last day of previous month
-                month_end = month_end - timedelta(days=30*i)  # Go back i months
-                month_start = month_end.replace(day=1)  # First day of that month
-                
-                month_sales = sales_query.filter(sold_at__gte=month_start, sold_at__lte=month_end)
-                month_refills = refills_query.filter(created_at__gte=month_start, created_at__lte=month_end)
-                month_expenses = expenses_query.filter(created_at__gte=month_start, created_at__lte=month_end)
-                
-                month_revenue = (month_sales.aggregate(total=Sum('cost'))['total'] or 0) + \
-                               (month_refills.aggregate(total=Sum('cost'))['total'] or 0)
-                               
-                month_expense = month_expenses.aggregate(total=Sum('cost'))['total'] or 0
-                month_profit = month_revenue - month_expense
-                
-                monthly_financials.append({
-                    'month': month_start.strftime('%b'),  # Month abbreviation
-                    'revenue': month_revenue,
-                    'expenses': month_expense,
-                    'profit': month_profit
-                })
-                
-        # Reverse to get chronological order
-        monthly_financials.reverse()        # Calculate cash flow
+            trend_labels = [bucket['start'].strftime('%b') for bucket in trend]  # Month abbreviation
+
+        monthly_financials = []
+        for label, bucket in zip(trend_labels, trend):
+            bucket_revenue = bucket['metrics']['revenue']
+            bucket_expense = bucket['metrics']['expenses']
+            monthly_financials.append({
+                'month': label,
+                'revenue': bucket_revenue,
+                'expenses': bucket_expense,
+                'profit': bucket_revenue - bucket_expense
+            })
+
+        # Calculate cash flow
         # Cash inflow: sales + refills + credit payments
-        cash_inflow = total_revenue + (credits_query.aggregate(total=Sum('money_paid'))['total'] or 0)
+        cash_inflow = total_revenue + totals['credit_repaid']
         
         # Cash outflow: expenses
         cash_outflow = total_expenses
@@ -1212,14 +796,11 @@ class AnalyticsViewSet(viewsets.ViewSet):
             'net': net_cash_flow
         }
         
-        # Calculate previous period metrics for comparison
         # Previous period revenue
-        previous_sales_revenue = previous_sales_query.aggregate(total=Sum('cost'))['total'] or 0
-        previous_refill_revenue = previous_refills_query.aggregate(total=Sum('cost'))['total'] or 0
-        previous_total_revenue = previous_sales_revenue + previous_refill_revenue
+        previous_total_revenue = previous_totals['sales_revenue'] + previous_totals['refill_revenue']
         
         # Previous period expenses
-        previous_total_expenses = previous_expenses_query.aggregate(total=Sum('cost'))['total'] or 0
+        previous_total_expenses = previous_totals['expenses_total']
         
         # Previous period profit
         previous_direct_expenses = previous_total_expenses * Decimal('0.3')  # Simplified
@@ -1243,7 +824,7 @@ class AnalyticsViewSet(viewsets.ViewSet):
         
         # Get recent expenses
         recent_expenses = []
-        for expense in expenses_query.order_by('-created_at')[:5]:
+        for expense in expenses[:5]:
             category = expense.description.split(' - ')[0] if ' - ' in expense.description else 'Other'
             # Simplify categories as before
             if 'Electricity' in category or 'Water' in category or 'Utility' in category:
@@ -1280,6 +861,11 @@ class AnalyticsViewSet(viewsets.ViewSet):
         
         return Response(response_data)
 
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Get hit/miss counters for the analytics response cache"""
+        return Response(AnalyticsCache.get_stats(['sales', 'customers', 'inventory', 'financial']))
+
 
 # Keep the existing individual APIView classes for backward compatibility
 class SalesAnalyticsView(APIView):
@@ -8,7 +8,7 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hamu_backend.settings')
 django.setup()
 
-from customers.models import Customers
+from customers.models import Customers, CustomerStats
 
 # Find customer DevOps
 customer = Customers.objects.filter(names__icontains='DevOps').first()
@@ -38,6 +38,19 @@ else:
     print(f'Credit Balance: KES {credit_balance:.2f}')
     print()
     
+    # Compare with the running totals served by the API
+    stats = CustomerStats.objects.filter(customer=customer).first()
+    print('=== CUSTOMER STATS ROW ===')
+    if not stats:
+        print('No stats row (run: python manage.py rebuild_customer_stats)')
+    else:
+        print(f'Credit Owed: KES {float(stats.credit_owed):.2f}')
+        print(f'Total Repaid: KES {float(stats.total_repaid):.2f}')
+        print(f'Credit Balance: KES {float(stats.credit_balance):.2f}')
+        if abs(float(stats.credit_balance) - credit_balance) >= 0.01:
+            print('⚠️ Stats row is out of step (run: python manage.py check_customer_stats --repair)')
+    print()
+    
     if credit_balance > 0:
         print(f'✅ Customer has KES {credit_balance:.2f} CREDIT BALANCE to use')
     elif credit_balance < 0:
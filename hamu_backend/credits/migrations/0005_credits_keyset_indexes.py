@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-16 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credits', '0004_credits_client_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='credits',
+            index=models.Index(fields=['shop', 'payment_date', 'id'], name='credits_shop_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credits',
+            index=models.Index(fields=['payment_date', 'id'], name='credits_payment_id_idx'),
+        ),
+    ]
@@ -46,6 +46,11 @@ class Credits(models.Model):
     class Meta:
         verbose_name_plural = 'Credit Payments' # Changed name
         ordering = ['-payment_date']
+        indexes = [
+            # Keyset pages on (payment_date, id), per shop for agents and across shops for directors
+            models.Index(fields=['shop', 'payment_date', 'id'], name='credits_shop_payment_idx'),
+            models.Index(fields=['payment_date', 'id'], name='credits_payment_id_idx'),
+        ]
 
     def __str__(self):
         return f"Credit payment of {self.money_paid} by {self.customer} ({self.payment_mode}) on {self.payment_date.strftime('%Y-%m-%d')}"
\ No newline at end of file
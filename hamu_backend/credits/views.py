@@ -6,7 +6,9 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Sum
 from .models import Credits
 from .serializers import CreditsSerializer
+from hamu_backend.pagination import TransactionPagination
 from hamu_backend.permissions import IsShopAgentOrDirector
+from hamu_backend.search import CustomerSearchFilter
 
 
 class CreditsViewSet(viewsets.ModelViewSet):
@@ -17,7 +19,10 @@ class CreditsViewSet(viewsets.ModelViewSet):
     """
     serializer_class = CreditsSerializer
     permission_classes = [IsShopAgentOrDirector]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = TransactionPagination
+    # Keyset pages with ?pagination=cursor
+    cursor_ordering_field = 'payment_date'
+    filter_backends = [DjangoFilterBackend, CustomerSearchFilter, filters.OrderingFilter]
     search_fields = ['customer__names', 'customer__phone_number', 'agent_name']
     ordering_fields = ['payment_date', 'money_paid']
     filterset_fields = ['shop', 'customer', 'payment_mode']
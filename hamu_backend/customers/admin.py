@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Customers
+from .models import Customers, CustomerStats
 
 
 @admin.register(Customers)
@@ -9,3 +9,10 @@ class CustomersAdmin(admin.ModelAdmin):
     search_fields = ('names', 'phone_number', 'apartment_name', 'room_number')
     date_hierarchy = 'date_registered'
     readonly_fields = ('date_registered',)
+
+
+@admin.register(CustomerStats)
+class CustomerStatsAdmin(admin.ModelAdmin):
+    list_display = ('customer', 'refill_count', 'purchase_count', 'total_spent', 'credit_owed', 'total_repaid', 'last_refill_date')
+    search_fields = ('customer__names', 'customer__phone_number')
+    readonly_fields = [field.name for field in CustomerStats._meta.fields]
@@ -0,0 +1,60 @@
+"""
+Management command to check CustomerStats rows against each customer's
+refills, sales and credit payments and optionally repair any drift.
+
+Usage: python manage.py check_customer_stats [--shop SHOP_ID] [--repair]
+"""
+from django.core.management.base import BaseCommand
+
+from customers.models import Customers
+from customers.services import CustomerStatsService
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer stats from their history and report (or repair) drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop',
+            type=int,
+            help='Only check customers of this shop ID',
+        )
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Rebuild drifted or missing stats rows from the history',
+        )
+
+    def handle(self, *args, **options):
+        customers = Customers.objects.all()
+        if options.get('shop'):
+            customers = customers.filter(shop_id=options['shop'])
+
+        drift = CustomerStatsService.get_drift(customers)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All customer stats match their history.'))
+            return
+
+        for entry in drift:
+            customer = entry['customer']
+            if entry['stats'] is None:
+                detail = 'no stats row'
+            else:
+                detail = ', '.join(
+                    f"{field} {entry['stats'][field]} (expected {expected})"
+                    for field, expected in entry['expected'].items()
+                    if entry['stats'][field] != expected
+                )
+            self.stdout.write(f'{customer.names} (ID: {customer.pk}): {detail}')
+
+        if not options['repair']:
+            self.stdout.write(self.style.WARNING(
+                f'{len(drift)} customer stats rows are out of step. Run with --repair to fix them.'
+            ))
+            return
+
+        repaired = CustomerStatsService.rebuild(
+            Customers.objects.filter(pk__in=[entry['customer'].pk for entry in drift])
+        )
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} customer stats rows.'))
@@ -0,0 +1,29 @@
+"""
+Management command to rebuild the CustomerStats table from the refills, sales
+and credit payments of each customer.
+
+Usage: python manage.py rebuild_customer_stats [--shop SHOP_ID]
+"""
+from django.core.management.base import BaseCommand
+
+from customers.models import Customers
+from customers.services import CustomerStatsService
+
+
+class Command(BaseCommand):
+    help = 'Recompute every customer stats row from the refill, sale and credit payment history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop',
+            type=int,
+            help='Only rebuild stats for customers of this shop ID',
+        )
+
+    def handle(self, *args, **options):
+        customers = Customers.objects.all()
+        if options.get('shop'):
+            customers = customers.filter(shop_id=options['shop'])
+
+        rebuilt = CustomerStatsService.rebuild(customers)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} customers.'))
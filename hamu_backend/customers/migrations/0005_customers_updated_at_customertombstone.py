@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-16 14:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0004_customers_client_id'),
+        ('shops', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customers',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='CustomerTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customer_tombstones', to='shops.shops')),
+            ],
+            options={
+                'verbose_name_plural': 'Customer Tombstones',
+            },
+        ),
+    ]
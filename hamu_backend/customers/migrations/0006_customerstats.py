@@ -0,0 +1,92 @@
+# Generated by Django 5.2 on 2026-10-16 15:02
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+
+def populate_stats(apps, schema_editor):
+    """Create a stats row for every existing customer from their history"""
+    Customers = apps.get_model('customers', 'Customers')
+    CustomerStats = apps.get_model('customers', 'CustomerStats')
+    Sales = apps.get_model('sales', 'Sales')
+    Credits = apps.get_model('credits', 'Credits')
+
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(Decimal('0.00'))
+
+    def sum_subquery(queryset, field):
+        total = queryset.order_by().values('customer').annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(total, output_field=money), zero)
+
+    sale_count = Sales.objects.filter(customer=OuterRef('pk')).order_by().values('customer').annotate(
+        total=Count('id')
+    ).values('total')
+
+    customers = Customers.objects.annotate(
+        stat_refill_count=Count('refills'),
+        stat_refill_quantity=Coalesce(
+            Sum(Coalesce(NullIf('refills__quantity', Value(0)), Value(1)), filter=Q(refills__isnull=False)),
+            Value(0)
+        ),
+        stat_free_refill_count=Count('refills', filter=Q(refills__is_free=True)),
+        stat_last_refill_date=Max('refills__created_at'),
+        stat_refill_spent=Coalesce(Sum('refills__cost'), zero, output_field=money),
+        stat_refill_credit=Coalesce(Sum('refills__cost', filter=Q(refills__payment_mode='CREDIT')), zero, output_field=money),
+        stat_purchase_count=Coalesce(Subquery(sale_count, output_field=models.IntegerField()), Value(0)),
+        stat_sale_spent=sum_subquery(Sales.objects.filter(customer=OuterRef('pk')), 'cost'),
+        stat_sale_credit=sum_subquery(Sales.objects.filter(customer=OuterRef('pk'), payment_mode='CREDIT'), 'cost'),
+        stat_repaid=sum_subquery(Credits.objects.filter(customer=OuterRef('pk')), 'money_paid'),
+    )
+
+    batch = []
+    for customer in customers.iterator(chunk_size=1000):
+        batch.append(CustomerStats(
+            customer_id=customer.pk,
+            refill_count=customer.stat_refill_count,
+            refill_quantity=customer.stat_refill_quantity,
+            free_refill_count=customer.stat_free_refill_count,
+            last_refill_date=customer.stat_last_refill_date,
+            purchase_count=customer.stat_purchase_count,
+            total_spent=customer.stat_refill_spent + customer.stat_sale_spent,
+            credit_owed=customer.stat_refill_credit + customer.stat_sale_credit,
+            total_repaid=customer.stat_repaid,
+        ))
+        if len(batch) >= 1000:
+            CustomerStats.objects.bulk_create(batch)
+            batch = []
+    CustomerStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credits', '0004_credits_client_id'),
+        ('customers', '0005_customers_updated_at_customertombstone'),
+        ('refills', '0004_refills_client_id'),
+        ('sales', '0003_sales_client_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='customers.customers')),
+                ('refill_count', models.IntegerField(default=0)),
+                ('refill_quantity', models.IntegerField(default=0)),
+                ('free_refill_count', models.IntegerField(default=0)),
+                ('last_refill_date', models.DateTimeField(blank=True, null=True)),
+                ('purchase_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('credit_owed', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_repaid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Customer Stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-16 18:40
+
+import re
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def normalize_phone(value):
+    """Copy of customers.models.normalize_phone as of this migration"""
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('254') and len(digits) > 9:
+        return '0' + digits[3:]
+    if len(digits) == 9 and digits[0] in '17':
+        return '0' + digits
+    return digits
+
+
+def populate_phone_normalized(apps, schema_editor):
+    Customers = apps.get_model('customers', 'Customers')
+    customers = list(Customers.objects.only('id', 'phone_number'))
+    for customer in customers:
+        customer.phone_normalized = normalize_phone(customer.phone_number)
+    Customers.objects.bulk_update(customers, ['phone_normalized'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0006_customerstats'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='customers',
+            name='phone_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=14),
+        ),
+        migrations.RunPython(populate_phone_normalized, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customers',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['names'], name='customers_names_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customers',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['apartment_name'], name='customers_apartment_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customers',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['room_number'], name='customers_room_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customers',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['phone_normalized'], name='customers_phone_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customers',
+            index=models.Index(fields=['phone_normalized'], name='customers_phone_norm_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,6 +1,25 @@
+import re
+from decimal import Decimal
+
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from shops.models import Shops
 
+
+def normalize_phone(value):
+    """
+    Digits of a phone number in national format, so 0712345678, +254712345678,
+    254 712 345 678 and 712345678 all become 0712345678. Partial numbers keep
+    only their digits.
+    """
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('254') and len(digits) > 9:
+        return '0' + digits[3:]
+    if len(digits) == 9 and digits[0] in '17':
+        return '0' + digits
+    return digits
+
+
 class Customers(models.Model):
     """
     Represents a customer registered with a specific shop.
@@ -19,15 +38,94 @@ class Customers(models.Model):
     names = models.CharField(max_length=50)
     # Phone number is unique but not the primary key
     phone_number = models.CharField(max_length=14, unique=False) # False for testing, True for production
+    # phone_number in national format (normalize_phone), kept in sync on save for search
+    phone_normalized = models.CharField(max_length=14, blank=True, default='', editable=False)
     apartment_name = models.CharField(max_length=50, blank=True) # Made blank=True, might not always be relevant
     room_number = models.CharField(max_length=30, blank=True)    # Made blank=True
     date_registered = models.DateTimeField(null=True) # Renamed 'date' for clarity
     # date_registered = models.DateTimeField(auto_now_add=True, null=True) # Renamed 'date' for clarity
+    # Bumped on every save and whenever one of the customer's refills, sales or
+    # credit payments changes (customers/signals.py), for offline delta sync
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.names} ({self.phone_number})"
 
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_normalized'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name_plural = 'Customers'
         # Optional: Add constraint to ensure phone_number uniqueness per shop if needed
-        # unique_together = ('shop', 'phone_number')
\ No newline at end of file
+        # unique_together = ('shop', 'phone_number')
+        indexes = [
+            # Trigram indexes behind the customer search (hamu_backend/search.py):
+            # they serve ILIKE '%term%' as well as the pg_trgm similarity operators
+            GinIndex(fields=['names'], name='customers_names_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['apartment_name'], name='customers_apartment_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['room_number'], name='customers_room_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['phone_normalized'], name='customers_phone_trgm', opclasses=['gin_trgm_ops']),
+            # Exact and prefix (LIKE '0712%') phone lookups
+            models.Index(fields=['phone_normalized'], name='customers_phone_norm_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+
+class CustomerTombstone(models.Model):
+    """
+    Records a deleted customer so offline clients syncing with a `since` cursor
+    can remove it from their cache.
+    """
+    customer_id = models.BigIntegerField()
+    shop = models.ForeignKey(Shops, on_delete=models.CASCADE, related_name='customer_tombstones')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Customer {self.customer_id} deleted on {self.deleted_at.strftime('%Y-%m-%d %H:%M')}"
+
+    class Meta:
+        verbose_name_plural = 'Customer Tombstones'
+
+
+
+class CustomerStats(models.Model):
+    """
+    Running refill, purchase and credit totals for a customer, kept equal to
+    their Refills, Sales and Credits rows by the signal handlers in
+    customers/signals.py so loyalty and credit state can be read without
+    aggregating the customer's history.
+    """
+    customer = models.OneToOneField(Customers, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    refill_count = models.IntegerField(default=0)
+    # Units refilled; a refill recorded without a quantity counts as one
+    refill_quantity = models.IntegerField(default=0)
+    free_refill_count = models.IntegerField(default=0)
+    last_refill_date = models.DateTimeField(null=True, blank=True)
+    purchase_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    # Cost of refills and sales paid on CREDIT, and the credit payments made
+    credit_owed = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_repaid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def credit_balance(self):
+        """Positive = customer has balance to use, negative = customer owes"""
+        return self.total_repaid - self.credit_owed
+
+    def __str__(self):
+        return f"{self.customer}: {self.refill_count} refills, balance {self.credit_balance}"
+
+    class Meta:
+        verbose_name_plural = 'Customer Stats'
+
+# Note: Refills, Sales and Credits remain the source of truth. Bulk
+# queryset.update()/delete() calls bypass the CustomerStats handlers; run
+# `python manage.py check_customer_stats --repair` (or rebuild_customer_stats)
+# after such operations.
+#
+# phone_normalized is set in Customers.save(); queryset.update(phone_number=...)
+# must set it too (normalize_phone) or the customer won't be found by phone.
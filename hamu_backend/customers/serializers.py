@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Customers
+from .services import CustomerStatsService
 from shops.serializers import ShopSerializer
 import datetime
 from django.utils import timezone
@@ -7,7 +8,7 @@ from django.utils import timezone
 
 class CustomerSerializer(serializers.ModelSerializer):
     shop_details = ShopSerializer(source='shop', read_only=True)
-    refill_count = serializers.IntegerField(source='refills.count', read_only=True)
+    refill_count = serializers.SerializerMethodField()
     packages = serializers.SerializerMethodField()
     loyalty = serializers.SerializerMethodField()
     client_id = serializers.UUIDField(required=False, allow_null=True)
@@ -39,6 +40,9 @@ class CustomerSerializer(serializers.ModelSerializer):
         
         return super().create(validated_data)
 
+    def get_refill_count(self, obj):
+        return CustomerStatsService.get_stats(obj).refill_count
+
     def get_packages(self, obj):
         """
         Get a summary of packages this customer has purchased, 
@@ -101,78 +105,15 @@ class CustomerSerializer(serializers.ModelSerializer):
         - refills_until_free: number of refills needed for free refill
         - free_refills_redeemed: total number of free refills redeemed
         """
-        if not hasattr(obj, 'refills') or not hasattr(obj, 'shop'):
-            return {
-                'current_points': 0,
-                'refills_until_free': 10,
-                'free_refills_redeemed': 0
-            }
-        
-        # Get the shop's free refill interval setting
-        shop = obj.shop
-        free_refill_interval = getattr(shop, 'freeRefillInterval', 10)  # Default to 10 if not set
-        
-        # Get all refills for this customer
-        refills = obj.refills.all()
-        total_refills = refills.count()
-        
-        # Get refill quantities rather than just counting refills
-        refill_quantities = sum(getattr(refill, 'quantity', 1) or 1 for refill in refills)
-        
-        # Count free refills from the database
-        free_refills = refills.filter(is_free=True).count()
-        
-        # Calculate the total free refills based on the shop's interval
-        # This is the theoretical number based on total quantities divided by interval
-        calculated_free_refills = refill_quantities // free_refill_interval
-        
-        # Use the larger of actual counted free refills or calculated free refills
-        free_refills_redeemed = max(free_refills, calculated_free_refills)
-        
-        # Calculate paid quantities (total minus free)
-        paid_quantities = refill_quantities - free_refills_redeemed
-        
-        # Calculate current points based on paid quantities
-        current_points = paid_quantities % free_refill_interval
-        
-        # Calculate refills until next free reward
-        refills_until_free = free_refill_interval - current_points if current_points > 0 else free_refill_interval
-        
-        return {
-            'current_points': current_points,
-            'refills_until_free': refills_until_free,
-            'free_refills_redeemed': free_refills_redeemed
-        }
+        return CustomerStatsService.get_customer_loyalty(obj)
     
     def get_activity_status(self, obj):
         """
         Calculate activity status based on most recent refill date.
         Returns one of: 'Very Active', 'Active', 'Irregular', 'Inactive', 'New'
         """
-        # Get the most recent refill for this customer
-        latest_refill = None
-        if hasattr(obj, 'refills'):
-            latest_refill = obj.refills.order_by('-created_at').first()
-        
-        if not latest_refill:
-            # No refills - check if it's a new customer (registered within last 30 days)
-            if obj.date_registered:
-                days_since_registration = (timezone.now() - obj.date_registered).days
-                if days_since_registration <= 30:
-                    return 'New'
-            return 'Inactive'
-        
-        # Calculate days since last refill
-        days_since_last_refill = (timezone.now() - latest_refill.created_at).days
-        
-        if days_since_last_refill <= 30:
-            return 'Very Active'
-        elif days_since_last_refill <= 60:
-            return 'Active'
-        elif days_since_last_refill <= 90:
-            return 'Irregular'
-        else:
-            return 'Inactive'
+        stats = CustomerStatsService.get_stats(obj)
+        return CustomerStatsService.get_activity_status(stats.last_refill_date, obj.date_registered)
 
 class CustomerLightSerializer(serializers.ModelSerializer):
     """A lightweight serializer for Customers with minimal fields."""
@@ -184,9 +125,13 @@ class CustomerInsightSerializer(serializers.ModelSerializer):
     """
     A specialized serializer for Customer Insights page with additional computed fields
     needed by the frontend components.
+
+    Every field reads the customer's stats row or the refills, sales and shop
+    loaded by CustomerStatsService.prefetch_insights, so a page costs the same
+    few queries whatever its size.
     """
     shop_details = ShopSerializer(source='shop', read_only=True)
-    refill_count = serializers.IntegerField(source='refills.count', read_only=True)
+    refill_count = serializers.SerializerMethodField()
     
     # Adding fields needed by frontend with both naming conventions
     name = serializers.CharField(source='names', read_only=True)
@@ -215,61 +160,32 @@ class CustomerInsightSerializer(serializers.ModelSerializer):
             'loyalty', 'trends'
         ]
     
+    def get_refill_count(self, obj):
+        return CustomerStatsService.get_stats(obj).refill_count
+
     def get_refills(self, obj):
         # This is the same as refill_count, but with a different name for frontend compatibility
-        return obj.refills.count() if hasattr(obj, 'refills') else 0
+        return CustomerStatsService.get_stats(obj).refill_count
     
     def get_purchases(self, obj):
         # Count bottle sales for this customer
-        return obj.sales.count() if hasattr(obj, 'sales') else 0
+        return CustomerStatsService.get_stats(obj).purchase_count
 
     def get_total_spent(self, obj):
-        # Calculate total amount spent by summing refills and sales
-        total = 0
-        
-        # Sum refills
-        if hasattr(obj, 'refills'):
-            for refill in obj.refills.all():
-                if hasattr(refill, 'cost'):
-                    total += refill.cost or 0
-        
-        # Sum sales
-        if hasattr(obj, 'sales'):
-            for sale in obj.sales.all():
-                if hasattr(sale, 'cost'):
-                    total += sale.cost or 0
-
-        return total
+        # Total amount spent on refills and sales
+        return CustomerStatsService.get_stats(obj).total_spent
     
     def get_last_refill(self, obj):
         # Get date of most recent refill
-        latest_refill = obj.refills.order_by('-created_at').first() if hasattr(obj, 'refills') else None
-        if latest_refill and hasattr(latest_refill, 'created_at'):
-            return latest_refill.created_at.strftime('%Y-%m-%d')
+        last_refill_date = CustomerStatsService.get_stats(obj).last_refill_date
+        if last_refill_date:
+            return last_refill_date.strftime('%Y-%m-%d')
         return None
     
     def get_activity_status(self, obj):
         # Calculate activity status based on most recent refill
-        import datetime
-        
-        latest_refill = obj.refills.order_by('-created_at').first() if hasattr(obj, 'refills') else None
-        
-        if not latest_refill:
-            # Check if it's a new customer (within last 30 days)
-            if obj.date_registered and (datetime.datetime.now(datetime.timezone.utc) - obj.date_registered).days <= 30:
-                return 'New'
-            return 'Inactive'
-            
-        days_since_last_refill = (datetime.datetime.now(datetime.timezone.utc) - latest_refill.created_at).days
-        
-        if days_since_last_refill <= 30:
-            return 'Very Active'
-        elif days_since_last_refill <= 60:
-            return 'Active'
-        elif days_since_last_refill <= 90:
-            return 'Irregular'
-        else:
-            return 'Inactive'
+        stats = CustomerStatsService.get_stats(obj)
+        return CustomerStatsService.get_activity_status(stats.last_refill_date, obj.date_registered)
     
     def get_packages(self, obj):
         """
@@ -337,50 +253,7 @@ class CustomerInsightSerializer(serializers.ModelSerializer):
           - Negative = customer owes money (debt)
         - repayment_rate: percentage of credit repaid
         """
-        # Calculate total credit given (from sales and refills with CREDIT payment mode)
-        total_credit = 0
-        
-        # Add up credit from refills
-        if hasattr(obj, 'refills'):
-            credit_refills = obj.refills.filter(payment_mode='CREDIT')
-            for refill in credit_refills:
-                if hasattr(refill, 'cost'):
-                    total_credit += float(refill.cost or 0)
-        
-        # Add up credit from sales
-        if hasattr(obj, 'sales'):
-            credit_sales = obj.sales.filter(payment_mode='CREDIT')
-            for sale in credit_sales:
-                if hasattr(sale, 'cost'):
-                    total_credit += float(sale.cost or 0)
-        
-        # Calculate total repayments
-        total_repaid = 0
-        if hasattr(obj, 'credit_payments'):
-            for payment in obj.credit_payments.all():
-                if hasattr(payment, 'money_paid'):
-                    total_repaid += float(payment.money_paid or 0)
-        
-        # Calculate credit_balance (same as export_for_offline)
-        # Positive = customer has credit (overpaid)
-        # Negative = customer owes money (debt)
-        credit_balance = total_repaid - total_credit
-        
-        # Calculate outstanding amount (for display, always >= 0)
-        outstanding = max(0, total_credit - total_repaid)
-        
-        # Calculate repayment rate
-        repayment_rate = 100
-        if total_credit > 0:
-            repayment_rate = min(100, round((total_repaid / total_credit) * 100))
-        
-        return {
-            'total_credit': total_credit,
-            'total_repaid': total_repaid,
-            'outstanding': outstanding,
-            'credit_balance': credit_balance,  # NEW: matches export_for_offline
-            'repayment_rate': repayment_rate
-        }
+        return CustomerStatsService.get_credit_info(CustomerStatsService.get_stats(obj))
       # Method to get loyalty information
     def get_loyalty(self, obj):
         """
@@ -389,48 +262,7 @@ class CustomerInsightSerializer(serializers.ModelSerializer):
         - refills_until_free: number of refills needed for free refill
         - free_refills_redeemed: total number of free refills redeemed
         """
-        if not hasattr(obj, 'refills') or not hasattr(obj, 'shop'):
-            return {
-                'current_points': 0,
-                'refills_until_free': 10,
-                'free_refills_redeemed': 0
-            }
-        
-        # Get the shop's free refill interval setting
-        shop = obj.shop
-        free_refill_interval = getattr(shop, 'freeRefillInterval', 10)  # Default to 10 if not set
-        
-        # Get all refills for this customer
-        refills = obj.refills.all()
-        total_refills = refills.count()
-        
-        # Get refill quantities rather than just counting refills
-        refill_quantities = sum(getattr(refill, 'quantity', 1) or 1 for refill in refills)
-        
-        # Count free refills from the database
-        free_refills = refills.filter(is_free=True).count()
-        
-        # Calculate the total free refills based on the shop's interval
-        # This is the theoretical number based on total quantities divided by interval
-        calculated_free_refills = refill_quantities // free_refill_interval
-        
-        # Use the larger of actual counted free refills or calculated free refills
-        free_refills_redeemed = max(free_refills, calculated_free_refills)
-        
-        # Calculate paid quantities (total minus free)
-        paid_quantities = refill_quantities - free_refills_redeemed
-        
-        # Calculate current points based on paid quantities
-        current_points = paid_quantities % free_refill_interval
-        
-        # Calculate refills until next free reward
-        refills_until_free = free_refill_interval - current_points if current_points > 0 else free_refill_interval
-        
-        return {
-            'current_points': current_points,
-            'refills_until_free': refills_until_free,
-            'free_refills_redeemed': free_refills_redeemed
-        }
+        return CustomerStatsService.get_customer_loyalty(obj)
     
     # Method to get behavioral trends
     def get_trends(self, obj):
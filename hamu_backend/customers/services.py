@@ -0,0 +1,309 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, IntegerField, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, NullIf
+from django.utils import timezone
+
+from credits.models import Credits
+from refills.models import Refills
+from sales.models import Sales
+from shops.models import Shops
+
+from .models import Customers, CustomerStats
+
+
+class CustomerStatsService:
+    """
+    Service class for the per-customer refill, loyalty and credit figures.
+
+    CustomerStats holds them as running totals, adjusted by the signal handlers
+    in customers/signals.py whenever a refill, sale or credit payment is
+    created, edited or deleted. annotate_stats recomputes the same figures from
+    scratch in the database, for rebuilding and checking the table.
+    """
+
+    MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+    # CustomerStats fields kept as running sums
+    COUNTERS = [
+        'refill_count', 'refill_quantity', 'free_refill_count', 'purchase_count',
+        'total_spent', 'credit_owed', 'total_repaid',
+    ]
+    # Every recomputable CustomerStats field
+    FIELDS = COUNTERS + ['last_refill_date']
+
+    @staticmethod
+    def sum_subquery(queryset, field):
+        """Correlated SUM(field) of a customer's rows, 0 when there are none"""
+        total = queryset.order_by().values('customer').annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(total, output_field=CustomerStatsService.MONEY), Value(Decimal('0.00')))
+
+    @staticmethod
+    def annotate_stats(queryset):
+        """
+        Annotate a Customers queryset, in one query, with `computed_<field>` for
+        every CustomerStats field:
+        - refill figures as conditional aggregates over the refills join
+        - sale and credit payment figures as correlated subqueries, so those rows
+          don't multiply the refill rows
+        """
+        money_zero = Value(Decimal('0.00'))
+        sales = Sales.objects.filter(customer=OuterRef('pk'))
+        sale_count = sales.order_by().values('customer').annotate(total=Count('id')).values('total')
+        return queryset.annotate(
+            computed_refill_count=Count('refills'),
+            # A refill recorded without a quantity counts as one
+            computed_refill_quantity=Coalesce(
+                Sum(Coalesce(NullIf('refills__quantity', Value(0)), Value(1)), filter=Q(refills__isnull=False)),
+                Value(0),
+                output_field=IntegerField()
+            ),
+            computed_free_refill_count=Count('refills', filter=Q(refills__is_free=True)),
+            computed_last_refill_date=Max('refills__created_at'),
+            computed_refill_spent=Coalesce(Sum('refills__cost'), money_zero, output_field=CustomerStatsService.MONEY),
+            computed_refill_credit=Coalesce(
+                Sum('refills__cost', filter=Q(refills__payment_mode='CREDIT')),
+                money_zero,
+                output_field=CustomerStatsService.MONEY
+            ),
+            computed_purchase_count=Coalesce(Subquery(sale_count, output_field=IntegerField()), Value(0)),
+            computed_sale_spent=CustomerStatsService.sum_subquery(sales, 'cost'),
+            computed_sale_credit=CustomerStatsService.sum_subquery(sales.filter(payment_mode='CREDIT'), 'cost'),
+            computed_total_repaid=CustomerStatsService.sum_subquery(
+                Credits.objects.filter(customer=OuterRef('pk')), 'money_paid'
+            ),
+        ).annotate(
+            computed_total_spent=F('computed_refill_spent') + F('computed_sale_spent'),
+            computed_credit_owed=F('computed_refill_credit') + F('computed_sale_credit'),
+        )
+
+    @staticmethod
+    def computed_values(customer):
+        """{field: value} from a customer annotated by annotate_stats"""
+        return {field: getattr(customer, f'computed_{field}') for field in CustomerStatsService.FIELDS}
+
+    @staticmethod
+    def refill_contribution(refill):
+        """What one refill (instance or values dict) adds to its customer's stats"""
+        get = refill.get if isinstance(refill, dict) else lambda field: getattr(refill, field)
+        cost = get('cost') or Decimal('0.00')
+        return {
+            'refill_count': 1,
+            'refill_quantity': get('quantity') or 1,
+            'free_refill_count': 1 if get('is_free') else 0,
+            'total_spent': cost,
+            'credit_owed': cost if get('payment_mode') == 'CREDIT' else Decimal('0.00'),
+        }
+
+    @staticmethod
+    def sale_contribution(sale):
+        """What one sale (instance or values dict) adds to its customer's stats"""
+        get = sale.get if isinstance(sale, dict) else lambda field: getattr(sale, field)
+        cost = get('cost') or Decimal('0.00')
+        return {
+            'purchase_count': 1,
+            'total_spent': cost,
+            'credit_owed': cost if get('payment_mode') == 'CREDIT' else Decimal('0.00'),
+        }
+
+    @staticmethod
+    def credit_contribution(payment):
+        """What one credit payment (instance or values dict) adds to its customer's stats"""
+        get = payment.get if isinstance(payment, dict) else lambda field: getattr(payment, field)
+        return {'total_repaid': get('money_paid') or Decimal('0.00')}
+
+    @staticmethod
+    def apply_changes(customer_id, changes, refill_date=None, recompute_last_refill=False, create_missing=True):
+        """
+        Add `changes` ({field: delta}) to a customer's stats with F() increments.
+
+        `refill_date` moves last_refill_date forward when it is later. When a
+        refill is deleted or re-dated, recompute_last_refill reads the latest
+        remaining refill date instead. Customers without a stats row yet get one
+        built from their history, which already includes the change. Deletes
+        pass create_missing=False so rows removed along with their customer
+        never insert a new one.
+        """
+        updates = {field: F(field) + delta for field, delta in changes.items() if delta}
+        if recompute_last_refill:
+            updates['last_refill_date'] = Subquery(
+                Refills.objects.filter(customer_id=customer_id).order_by().values('customer').annotate(
+                    latest=Max('created_at')
+                ).values('latest')
+            )
+        elif refill_date is not None:
+            updates['last_refill_date'] = Greatest(Coalesce(F('last_refill_date'), Value(refill_date)), Value(refill_date))
+        if not updates:
+            return
+
+        updates['updated_at'] = timezone.now()
+        if CustomerStats.objects.filter(customer_id=customer_id).update(**updates) or not create_missing:
+            return
+
+        try:
+            with transaction.atomic():
+                CustomerStatsService.rebuild(Customers.objects.filter(pk=customer_id))
+        except IntegrityError:
+            # Another transaction created the row first from the history it could
+            # see, which does not include this uncommitted change
+            CustomerStats.objects.filter(customer_id=customer_id).update(**updates)
+
+    @staticmethod
+    def get_stats(customer):
+        """
+        A customer's stats row, loaded with select_related('stats') when it is,
+        and built from their history if they don't have one yet
+        """
+        try:
+            return customer.stats
+        except CustomerStats.DoesNotExist:
+            CustomerStatsService.rebuild(Customers.objects.filter(pk=customer.pk))
+            return CustomerStats.objects.get(pk=customer.pk)
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(customers):
+        """
+        Reset the stats of a Customers queryset from their refills, sales and
+        credit payments. Existing stats rows are locked first, so a change
+        written concurrently is either counted here or applied afterwards by its
+        own increment. Returns the number of customers rebuilt.
+        """
+        customer_ids = list(customers.values_list('pk', flat=True))
+        existing = set(
+            CustomerStats.objects.select_for_update().filter(
+                customer_id__in=customer_ids
+            ).values_list('customer_id', flat=True)
+        )
+
+        rows = CustomerStatsService.annotate_stats(Customers.objects.filter(pk__in=customer_ids))
+        now = timezone.now()
+        stale, missing = [], []
+        for customer in rows.iterator(chunk_size=1000):
+            stats = CustomerStats(customer_id=customer.pk, updated_at=now, **CustomerStatsService.computed_values(customer))
+            (stale if customer.pk in existing else missing).append(stats)
+
+        CustomerStats.objects.bulk_update(stale, CustomerStatsService.FIELDS + ['updated_at'], batch_size=1000)
+        CustomerStats.objects.bulk_create(missing, batch_size=1000)
+        return len(stale) + len(missing)
+
+    @staticmethod
+    def get_drift(customers):
+        """
+        Compare the stats rows of a Customers queryset with their history.
+        Returns a list of dictionaries for customers whose stats are wrong or missing.
+        """
+        rows = CustomerStatsService.annotate_stats(customers.select_related('stats'))
+        drift = []
+        for customer in rows.iterator(chunk_size=1000):
+            expected = CustomerStatsService.computed_values(customer)
+            stats = getattr(customer, 'stats', None)
+            actual = {field: getattr(stats, field) for field in CustomerStatsService.FIELDS} if stats else None
+            if actual != expected:
+                drift.append({
+                    'customer': customer,
+                    'stats': actual,
+                    'expected': expected,
+                })
+        return drift
+
+    @staticmethod
+    def prefetch_insights(queryset):
+        """
+        Load everything CustomerInsightSerializer reads for a page of customers
+        in a fixed number of queries: the stats row joined in, then one query
+        each for the shops (with their customer counts), the refills and the
+        sales, with their packages joined in.
+        """
+        return queryset.select_related('stats').prefetch_related(
+            Prefetch('shop', queryset=Shops.objects.annotate(customer_count=Count('customers'))),
+            Prefetch('refills', queryset=Refills.objects.select_related('package')),
+            Prefetch('sales', queryset=Sales.objects.select_related('package')),
+        )
+
+    @staticmethod
+    def get_loyalty(refill_quantity, free_refill_count, free_refill_interval):
+        """Loyalty figures from a customer's refill totals and the shop's interval"""
+        calculated_free = refill_quantity // free_refill_interval
+        free_refills_redeemed = max(free_refill_count, calculated_free)
+        paid_quantities = refill_quantity - free_refills_redeemed
+        current_points = paid_quantities % free_refill_interval
+        refills_until_free = free_refill_interval - current_points if current_points > 0 else free_refill_interval
+        return {
+            'current_points': current_points,
+            'refills_until_free': refills_until_free,
+            'free_refills_redeemed': free_refills_redeemed
+        }
+
+    @staticmethod
+    def get_customer_loyalty(customer):
+        """Loyalty figures for a customer from their stats row"""
+        stats = CustomerStatsService.get_stats(customer)
+        free_refill_interval = getattr(customer.shop, 'freeRefillInterval', 10) if customer.shop else 10
+        return CustomerStatsService.get_loyalty(stats.refill_quantity, stats.free_refill_count, free_refill_interval)
+
+    @staticmethod
+    def get_activity_status(last_refill_date, date_registered, now=None):
+        """Activity badge from the last refill, or 'New' for recently registered customers"""
+        now = now or timezone.now()
+        if last_refill_date:
+            days_since_last_refill = (now - last_refill_date).days
+            if days_since_last_refill <= 30:
+                return 'Very Active'
+            elif days_since_last_refill <= 60:
+                return 'Active'
+            elif days_since_last_refill <= 90:
+                return 'Irregular'
+            return 'Inactive'
+        if date_registered and (now - date_registered).days <= 30:
+            return 'New'
+        return 'Inactive'
+
+    @staticmethod
+    def get_credit_info(stats):
+        """Credit summary from a stats row, in the shape of the insights `credit` field"""
+        total_credit = float(stats.credit_owed)
+        total_repaid = float(stats.total_repaid)
+        repayment_rate = 100
+        if total_credit > 0:
+            repayment_rate = min(100, round((total_repaid / total_credit) * 100))
+        return {
+            'total_credit': total_credit,
+            'total_repaid': total_repaid,
+            'outstanding': max(0, total_credit - total_repaid),
+            # Positive = customer has credit (overpaid), negative = customer owes
+            'credit_balance': total_repaid - total_credit,
+            'repayment_rate': repayment_rate
+        }
+
+    @staticmethod
+    def export_row(customer, now=None):
+        """Offline export entry for a customer loaded with select_related('stats')"""
+        stats = CustomerStatsService.get_stats(customer)
+        free_refill_interval = getattr(customer.shop, 'freeRefillInterval', 10) if customer.shop else 10
+        return {
+            'id': customer.id,
+            'names': customer.names,
+            'phone_number': customer.phone_number,
+            'apartment_name': customer.apartment_name,
+            'room_number': customer.room_number,
+            'date_registered': customer.date_registered.isoformat() if customer.date_registered else None,
+            'last_refill_date': stats.last_refill_date.isoformat() if stats.last_refill_date else None,
+            'shop': customer.shop_id,
+            'refill_count': stats.refill_count,
+            # Positive = customer has balance to use (repaid more than owed, or
+            # received loyalty/refund credits)
+            'credit_balance': float(stats.credit_balance),
+            'activity_status': CustomerStatsService.get_activity_status(
+                stats.last_refill_date, customer.date_registered, now
+            ),
+            'loyalty': CustomerStatsService.get_loyalty(
+                stats.refill_quantity, stats.free_refill_count, free_refill_interval
+            ),
+            'shop_details': {
+                'id': customer.shop.id,
+                'shopName': customer.shop.shopName,
+                'freeRefillInterval': customer.shop.freeRefillInterval,
+            } if customer.shop else None
+        }
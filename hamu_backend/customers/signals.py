@@ -0,0 +1,111 @@
+"""
+Signal handlers that keep each customer's CustomerStats row equal to their
+refills, sales and credit payments, keep Customers.updated_at moving whenever
+anything in the customer's offline export changes, and record a
+CustomerTombstone when a customer is deleted.
+
+Bulk queryset.update()/delete() calls bypass these handlers; run
+`python manage.py check_customer_stats --repair` after such operations, and
+clients fall back to a full export (no `since` cursor) to pick them up.
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from credits.models import Credits
+from refills.models import Refills
+from sales.models import Sales
+
+from .models import Customers, CustomerStats, CustomerTombstone
+from .services import CustomerStatsService
+
+# Fields each model contributes to CustomerStats, and how
+CONTRIBUTIONS = {
+    Refills: (['customer_id', 'quantity', 'is_free', 'cost', 'payment_mode', 'created_at'], CustomerStatsService.refill_contribution),
+    Sales: (['customer_id', 'cost', 'payment_mode'], CustomerStatsService.sale_contribution),
+    Credits: (['customer_id', 'money_paid'], CustomerStatsService.credit_contribution),
+}
+
+
+@receiver(pre_save, sender=Refills, dispatch_uid='customer_stats_capture_refill')
+@receiver(pre_save, sender=Sales, dispatch_uid='customer_stats_capture_sale')
+@receiver(pre_save, sender=Credits, dispatch_uid='customer_stats_capture_credit')
+def capture_previous_contribution(sender, instance, **kwargs):
+    """Remember what an edited row counted for, and for which customer"""
+    instance._stats_previous = None
+    if instance.pk:
+        fields, _ = CONTRIBUTIONS[sender]
+        instance._stats_previous = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save, sender=Refills, dispatch_uid='customer_stats_apply_refill')
+@receiver(post_save, sender=Sales, dispatch_uid='customer_stats_apply_sale')
+@receiver(post_save, sender=Credits, dispatch_uid='customer_stats_apply_credit')
+def apply_saved_contribution(sender, instance, **kwargs):
+    """Move a created or edited row's figures into its customer's stats"""
+    _, contribution = CONTRIBUTIONS[sender]
+    previous = getattr(instance, '_stats_previous', None)
+
+    # Net the old and new figures per customer so each row is touched once
+    changes = {}
+    if instance.customer_id:
+        changes[instance.customer_id] = dict(contribution(instance))
+    if previous is not None and previous['customer_id']:
+        customer_changes = changes.setdefault(previous['customer_id'], {})
+        for field, value in contribution(previous).items():
+            customer_changes[field] = customer_changes.get(field, 0) - value
+
+    refill_date = instance.created_at if sender is Refills else None
+    with transaction.atomic():
+        for customer_id, customer_changes in changes.items():
+            # A refill moved away from a customer or back in time may have been
+            # their latest one
+            recompute = sender is Refills and previous is not None and previous['customer_id'] == customer_id and (
+                customer_id != instance.customer_id or previous['created_at'] != instance.created_at
+            )
+            CustomerStatsService.apply_changes(
+                customer_id, customer_changes,
+                refill_date=refill_date if customer_id == instance.customer_id else None,
+                recompute_last_refill=recompute
+            )
+    instance._stats_previous = None
+
+
+@receiver(post_delete, sender=Refills, dispatch_uid='customer_stats_remove_refill')
+@receiver(post_delete, sender=Sales, dispatch_uid='customer_stats_remove_sale')
+@receiver(post_delete, sender=Credits, dispatch_uid='customer_stats_remove_credit')
+def remove_deleted_contribution(sender, instance, **kwargs):
+    """Take a deleted row's figures out of its customer's stats"""
+    if not instance.customer_id:
+        return
+    _, contribution = CONTRIBUTIONS[sender]
+    changes = {field: -value for field, value in contribution(instance).items()}
+    # Rows cascading from a deleted customer must not recreate their stats row
+    CustomerStatsService.apply_changes(
+        instance.customer_id, changes, recompute_last_refill=sender is Refills, create_missing=False
+    )
+
+
+@receiver(post_save, sender=Customers, dispatch_uid='customer_stats_create')
+def create_customer_stats(sender, instance, created, **kwargs):
+    """New customers start with empty stats"""
+    if created:
+        CustomerStats.objects.get_or_create(customer=instance)
+
+
+@receiver(post_save, sender=Refills, dispatch_uid='customer_touch_refill_save')
+@receiver(post_delete, sender=Refills, dispatch_uid='customer_touch_refill_delete')
+@receiver(post_save, sender=Sales, dispatch_uid='customer_touch_sale_save')
+@receiver(post_delete, sender=Sales, dispatch_uid='customer_touch_sale_delete')
+@receiver(post_save, sender=Credits, dispatch_uid='customer_touch_credit_save')
+@receiver(post_delete, sender=Credits, dispatch_uid='customer_touch_credit_delete')
+def touch_customer(sender, instance, **kwargs):
+    """The customer's refill, loyalty or credit figures changed"""
+    if instance.customer_id:
+        Customers.objects.filter(pk=instance.customer_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Customers, dispatch_uid='customer_tombstone')
+def record_customer_tombstone(sender, instance, **kwargs):
+    CustomerTombstone.objects.create(customer_id=instance.pk, shop_id=instance.shop_id)
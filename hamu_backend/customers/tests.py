@@ -1,3 +1,96 @@
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from packages.models import Packages
+from refills.models import Refills
+from sales.models import Sales
+from shops.models import Shops
+from users.models import Users
+
+from .models import Customers, CustomerStats
+
+
+class CustomerInsightsQueryCountTests(TestCase):
+    """
+    The insights list loads a page in a fixed number of queries: the page
+    count, the customers with their stats, and one prefetch each for shops,
+    refills and sales.
+    """
+    QUERIES_PER_PAGE = 5
+
+    def setUp(self):
+        self.shop = Shops.objects.create(shopName='Insights', freeRefillInterval=5)
+        self.refill_package = Packages.objects.create(
+            shop=self.shop, sale_type=Packages.SaleType.REFILL, water_amount_label=Decimal('20.0'), price=Decimal('100.00')
+        )
+        self.sale_package = Packages.objects.create(
+            shop=self.shop, sale_type=Packages.SaleType.SALE, bottle_type=Packages.BottleType.DISPOSABLE,
+            water_amount_label=Decimal('1.0'), price=Decimal('50.00')
+        )
+        director = Users.objects.create_user(
+            phone_number='0711000000', names='Director', user_class=Users.UserClass.DIRECTOR, password='pass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=director)
+
+    def add_customers(self, count):
+        now = timezone.now()
+        for i in range(count):
+            customer = Customers.objects.create(
+                shop=self.shop, names=f'Customer {Customers.objects.count()}',
+                phone_number=f'07{Customers.objects.count():08d}', date_registered=now
+            )
+            for payment_mode in ['CASH', 'CREDIT']:
+                Refills.objects.create(
+                    customer=customer, shop=self.shop, package=self.refill_package,
+                    payment_mode=payment_mode, cost=Decimal('100.00'), created_at=now
+                )
+            Sales.objects.create(
+                customer=customer, shop=self.shop, package=self.sale_package,
+                payment_mode='CASH', cost=Decimal('50.00'), sold_at=now
+            )
+
+    def get_page(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/customer-insights/')
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_customers(2)
+        small_page, small_queries = self.get_page()
+
+        self.add_customers(20)
+        large_page, large_queries = self.get_page()
+
+        self.assertEqual(len(small_page['results']), 2)
+        self.assertEqual(len(large_page['results']), 22)
+        self.assertEqual(small_queries, self.QUERIES_PER_PAGE)
+        self.assertEqual(large_queries, self.QUERIES_PER_PAGE)
+
+    def test_page_fields_come_from_loaded_data(self):
+        self.add_customers(1)
+        page, _ = self.get_page()
+        customer = page['results'][0]
+
+        self.assertEqual(customer['refills'], 2)
+        self.assertEqual(customer['purchases'], 1)
+        self.assertEqual(customer['total_spent'], Decimal('250.00'))
+        self.assertEqual(customer['credit']['total_credit'], 100.0)
+        self.assertEqual(customer['shop_details']['customer_count'], 1)
+        self.assertEqual(len(customer['packages']), 2)
+        self.assertEqual(customer['trends']['monthly_refills'][0]['count'], 2)
+
+    def test_refill_count_without_stats_row(self):
+        self.add_customers(1)
+        CustomerStats.objects.all().delete()
+        page, _ = self.get_page()
+        customer = page['results'][0]
 
-# Create your tests here.
+        self.assertEqual(customer['refill_count'], 2)
+        self.assertEqual(customer['refills'], 2)
@@ -3,9 +3,15 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Customers
+from django.db.models import Count, Max
+from django.utils import timezone
+from .models import Customers, CustomerTombstone
+from shops.models import Shops
 from .serializers import CustomerSerializer, CustomerInsightSerializer
+from .services import CustomerStatsService
 from hamu_backend.permissions import IsShopAgentOrDirector
+from hamu_backend.search import CustomerSearchFilter
+from hamu_backend.sync import OfflineSync
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
@@ -16,7 +22,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
     """
     serializer_class = CustomerSerializer
     permission_classes = [IsShopAgentOrDirector]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, CustomerSearchFilter, filters.OrderingFilter]
     search_fields = ['names', 'phone_number', 'apartment_name', 'room_number']
     ordering_fields = ['names', 'date_registered']
     filterset_fields = ['shop', 'apartment_name']
@@ -25,10 +31,10 @@ class CustomerViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.user_class == 'Director':
             # Directors see all customers across all shops
-            return Customers.objects.all().select_related('shop')
+            return Customers.objects.all().select_related('shop', 'stats')
         else:
             # Agents only see customers from their shop
-            return Customers.objects.filter(shop=user.shop).select_related('shop')
+            return Customers.objects.filter(shop=user.shop).select_related('shop', 'stats')
     
     def perform_create(self, serializer):
         """Automatically set shop for agent users"""
@@ -41,97 +47,59 @@ class CustomerViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def export_for_offline(self, request):
         """
-        Export all customers for offline caching.
+        Export customers for offline caching.
         Returns fields needed for offline customer detail pages.
+        With since=<cursor from the previous export>, only customers whose details,
+        refills, sales or credit payments changed since then are returned, plus
+        the ids of deleted customers.
         """
+        try:
+            since = OfflineSync.parse_since(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        cursor = OfflineSync.new_cursor()
         queryset = self.get_queryset()
+        deleted = []
+        if since is not None:
+            queryset = queryset.filter(updated_at__gte=since)
+            tombstones = CustomerTombstone.objects.filter(deleted_at__gte=since)
+            if request.user.user_class != 'Director':
+                tombstones = tombstones.filter(shop=request.user.shop)
+            deleted = sorted(set(tombstones.values_list('customer_id', flat=True)))
+
+        # Watermark of the export without reading the rows: their count and latest
+        # change, the shop details embedded in each row, and today's date (the
+        # activity status depends on it)
+        watermark = queryset.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+        shops = list(
+            Shops.objects.filter(id__in=queryset.values('shop_id')).order_by('id').values_list(
+                'id', 'shopName', 'freeRefillInterval'
+            )
+        )
+        etag = OfflineSync.get_etag(
+            'customers', request.user.user_class, request.user.shop_id, since,
+            watermark, deleted, shops, timezone.localdate()
+        )
+        if OfflineSync.is_not_modified(request, etag):
+            return OfflineSync.not_modified(etag)
+
+        queryset = queryset.order_by('id')
         
-        customers = []
-        for customer in queryset.select_related('shop').prefetch_related('refills', 'sales', 'credit_payments'):
-            # Calculate loyalty info
-            refills = customer.refills.all()
-            refill_count = refills.count()
-            free_refill_interval = getattr(customer.shop, 'freeRefillInterval', 10) if customer.shop else 10
-            refill_quantities = sum(getattr(r, 'quantity', 1) or 1 for r in refills)
-            free_refills = refills.filter(is_free=True).count()
-            calculated_free = refill_quantities // free_refill_interval
-            free_refills_redeemed = max(free_refills, calculated_free)
-            paid_quantities = refill_quantities - free_refills_redeemed
-            current_points = paid_quantities % free_refill_interval
-            refills_until_free = free_refill_interval - current_points if current_points > 0 else free_refill_interval
-            
-            # Get last refill date
-            last_refill = refills.order_by('-created_at').first()
-            last_refill_date = last_refill.created_at.isoformat() if last_refill else None
-            
-            # Calculate credit balance
-            # total_credit_owed = sum of CREDIT payment mode refills and sales
-            total_credit_owed = 0
-            credit_refills = refills.filter(payment_mode='CREDIT')
-            for r in credit_refills:
-                total_credit_owed += float(r.cost or 0)
-            if hasattr(customer, 'sales'):
-                credit_sales = customer.sales.filter(payment_mode='CREDIT')
-                for s in credit_sales:
-                    total_credit_owed += float(s.cost or 0)
-            
-            # total_repaid = sum of credit_payments
-            total_repaid = 0
-            if hasattr(customer, 'credit_payments'):
-                for payment in customer.credit_payments.all():
-                    total_repaid += float(payment.money_paid or 0)
-            
-            # credit_balance = positive means customer has balance to use
-            # (if repaid more than owed, or received loyalty/refund credits)
-            credit_balance = total_repaid - total_credit_owed
-            
-            # Calculate activity status based on last refill
-            from django.utils import timezone
-            activity_status = 'Inactive'
-            if last_refill:
-                days_since_last_refill = (timezone.now() - last_refill.created_at).days
-                if days_since_last_refill <= 30:
-                    activity_status = 'Very Active'
-                elif days_since_last_refill <= 60:
-                    activity_status = 'Active'
-                elif days_since_last_refill <= 90:
-                    activity_status = 'Irregular'
-                else:
-                    activity_status = 'Inactive'
-            elif customer.date_registered:
-                days_since_registration = (timezone.now() - customer.date_registered).days
-                if days_since_registration <= 30:
-                    activity_status = 'New'
-            
-            customers.append({
-                'id': customer.id,
-                'names': customer.names,
-                'phone_number': customer.phone_number,
-                'apartment_name': customer.apartment_name,
-                'room_number': customer.room_number,
-                'date_registered': customer.date_registered.isoformat() if customer.date_registered else None,
-                'last_refill_date': last_refill_date,
-                'shop': customer.shop_id,
-                'refill_count': refill_count,
-                'credit_balance': credit_balance,  # Positive = customer has balance to use
-                'activity_status': activity_status,  # Activity status for badges
-                'loyalty': {
-                    'current_points': current_points,
-                    'refills_until_free': refills_until_free,
-                    'free_refills_redeemed': free_refills_redeemed
-                },
-                'shop_details': {
-                    'id': customer.shop.id,
-                    'shopName': customer.shop.shopName,
-                    'freeRefillInterval': customer.shop.freeRefillInterval,
-                } if customer.shop else None
-            })
+        # Loyalty and activity status are derived from each customer's stats row
+        # (joined by get_queryset); rows are encoded as they are read from a
+        # server-side cursor
+        now = timezone.now()
+        customers = (
+            CustomerStatsService.export_row(customer, now)
+            for customer in queryset.iterator(chunk_size=500)
+        )
         
-        return Response({
-            'results': customers,
-            'count': len(customers),
-            'export_type': 'offline_cache'
-        })
+        return OfflineSync.stream_export(request, customers, {
+            'deleted': deleted,
+            'export_type': 'offline_delta' if since is not None else 'offline_cache',
+            'cursor': cursor
+        }, etag)
 
 
 class CustomerInsightViewSet(viewsets.ModelViewSet):
@@ -155,10 +123,10 @@ class CustomerInsightViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.user_class == 'Director':
             # Directors see insights for all customers across all shops
-            return Customers.objects.all().select_related('shop')
+            return CustomerStatsService.prefetch_insights(Customers.objects.all())
         else:
             # Agents only see insights for customers from their shop
-            return Customers.objects.filter(shop=user.shop).select_related('shop')
+            return CustomerStatsService.prefetch_insights(Customers.objects.filter(shop=user.shop))
 
 
 class CustomerInsightsViewSet(viewsets.ReadOnlyModelViewSet):
@@ -168,7 +136,7 @@ class CustomerInsightsViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = CustomerInsightSerializer
     permission_classes = [IsShopAgentOrDirector]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, CustomerSearchFilter, filters.OrderingFilter]
     search_fields = ['names', 'phone_number', 'apartment_name', 'room_number']
     ordering_fields = ['names', 'date_registered']
     filterset_fields = ['shop', 'apartment_name']
@@ -179,8 +147,8 @@ class CustomerInsightsViewSet(viewsets.ReadOnlyModelViewSet):
         # Get shop_id from query params
         shop_id = self.request.query_params.get('shop_id')
         
-        # Base query with necessary related objects
-        queryset = Customers.objects.all().select_related('shop')
+        # Base query with everything the serializer reads loaded per page
+        queryset = CustomerStatsService.prefetch_insights(Customers.objects.all())
         
         # Apply shop filtering
         if shop_id and shop_id.lower() != 'all':
@@ -0,0 +1,110 @@
+"""
+Opt-in keyset (cursor) pagination for the high-volume transaction lists.
+
+Page-number pagination stays the default. A request with `?pagination=cursor`
+(or a `cursor` from a previous page) is paged by keyset on (timestamp, id)
+instead, newest first, matching the model's ordering:
+
+    GET /api/refills/?pagination=cursor
+    GET /api/refills/?cursor=<next_cursor>
+
+Each page is a `WHERE (timestamp, id) < (last row)` range scan over a composite
+index, with no OFFSET and no COUNT(*), so it costs the same however far back it
+is. The response has `results`, `next` (the URL of the next page) and
+`next_cursor`; both are null on the last page. Keyset pages always use the
+timestamp order, so `ordering` is ignored in this mode.
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class TransactionPagination(PageNumberPagination):
+    """
+    PageNumberPagination with a keyset mode on the view's `cursor_ordering_field`
+    (e.g. 'created_at' for refills).
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+
+    keyset = False
+
+    @staticmethod
+    def encode_cursor(timestamp, pk):
+        data = {'ts': timestamp.isoformat() if timestamp else None, 'id': pk}
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Decode a cursor from a previous page; raises ValueError if it is invalid"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            timestamp = parse_datetime(data['ts']) if data['ts'] is not None else None
+            if data['ts'] is not None and timestamp is None:
+                raise ValueError(data['ts'])
+            return timestamp, int(data['id'])
+        except (TypeError, KeyError, ValueError, AttributeError, binascii.Error) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+
+    @staticmethod
+    def after_cursor(field, timestamp, pk):
+        """
+        Rows after (timestamp, pk) in `-field, -id` order, with NULL timestamps
+        first (PostgreSQL's default for descending order) before every dated row.
+        """
+        if timestamp is None:
+            return Q(**{f'{field}__isnull': True, 'pk__lt': pk}) | Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk})
+
+    def paginate_queryset(self, queryset, request, view=None):
+        field = getattr(view, 'cursor_ordering_field', None)
+        params = request.query_params
+        self.keyset = bool(field) and (
+            self.cursor_query_param in params or params.get(self.mode_query_param) == 'cursor'
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                timestamp, pk = self.decode_cursor(cursor)
+            except ValueError as e:
+                # ParseError keeps the repo's 400 {"error": "<message>"} shape
+                raise ParseError({'error': str(e)})
+            queryset = queryset.filter(self.after_cursor(field, timestamp, pk))
+
+        rows = list(queryset.order_by(F(field).desc(nulls_first=True), '-pk')[:page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = self.encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+        return rows
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        for param in [self.mode_query_param, self.page_query_param]:
+            url = remove_query_param(url, param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
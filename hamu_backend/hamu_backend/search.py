@@ -0,0 +1,93 @@
+"""
+Customer search backed by the pg_trgm indexes on the Customers table.
+
+Views keep DRF's `?search=` parameter and their `search_fields`, and swap
+filters.SearchFilter for CustomerSearchFilter:
+
+- A term that looks like a phone number (digits with optional +, spaces or
+  dashes) is matched against the normalized phone column, so 0712..., +254712...
+  and 712... find the same customer. Numbers starting with the term rank first.
+- Any other term matches customers whose names, apartment or room contain it
+  or are similar to it (pg_trgm `%` and `%>` operators), so typos still find
+  the customer. Results are ranked by trigram similarity.
+
+Every customer condition is served by a GIN trigram or btree index. On
+Refills, Sales and Credits the matching customers are found with a subquery on
+Customers instead of ILIKE across the join; fields of the view's own model
+(agent_name) are still matched with icontains. Other database backends fall
+back to SearchFilter.
+"""
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+from rest_framework import filters
+
+from customers.models import Customers, normalize_phone
+
+
+class CustomerSearchFilter(filters.SearchFilter):
+    # Customers columns with search indexes
+    CUSTOMER_FIELDS = {'names', 'phone_number', 'apartment_name', 'room_number'}
+    PHONE_TERM = re.compile(r'^\+?[\d\s-]{3,}$')
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        term = ' '.join(self.get_search_terms(request))
+        if not search_fields or not term or connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        prefix = '' if queryset.model is Customers else 'customer__'
+        customer_fields = [
+            field[len(prefix):] for field in search_fields
+            if field.startswith(prefix) and field[len(prefix):] in self.CUSTOMER_FIELDS
+        ]
+        other_fields = [field for field in search_fields if field[len(prefix):] not in customer_fields]
+
+        condition = Q(pk__in=[])
+        rank = Value(0.0, output_field=FloatField())
+        if customer_fields:
+            matches, _ = self.match_customers(term, customer_fields)
+            condition = Q(customer__in=Customers.objects.filter(matches)) if prefix else matches
+            _, rank = self.match_customers(term, customer_fields, prefix)
+        for field in other_fields:
+            condition |= Q(**{f'{field}__icontains': term})
+
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.filter(condition).annotate(search_rank=rank).order_by('-search_rank', *ordering)
+
+    def match_customers(self, term, fields, prefix=''):
+        """
+        Condition on the Customers `fields` (under `prefix`) matching a search
+        term, and the expression ranking the matches between 0 and 1
+        """
+        if 'phone_number' in fields and self.PHONE_TERM.match(term):
+            phone = normalize_phone(term)
+            digits = re.sub(r'\D', '', term)
+            starts_with = Q(**{f'{prefix}phone_normalized__startswith': phone})
+            condition = starts_with | Q(**{f'{prefix}phone_normalized__contains': digits})
+            # Rooms and apartments can be numbers too
+            for field in fields:
+                if field != 'phone_number':
+                    condition |= Q(**{f'{prefix}{field}__icontains': term})
+            rank = Case(When(starts_with, then=Value(1.0)), default=Value(0.5), output_field=FloatField())
+            return condition, rank
+
+        condition = Q(pk__in=[])
+        ranks = []
+        for field in fields:
+            if field == 'phone_number':
+                continue
+            path = f'{prefix}{field}'
+            condition |= (
+                Q(**{f'{path}__icontains': term})
+                | Q(**{f'{path}__trigram_similar': term})
+                | Q(**{f'{path}__trigram_word_similar': term})
+            )
+            # Similarity to the whole value, or to the closest word in it
+            ranks += [TrigramSimilarity(path, term), TrigramWordSimilarity(term, path)]
+        if not ranks:
+            return condition, Value(0.0, output_field=FloatField())
+        return condition, Greatest(*ranks) if len(ranks) > 1 else ranks[0]
@@ -88,6 +88,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # pg_trgm lookups for the customer search
     'rest_framework',
     'django_filters',
     'rest_framework_simplejwt',
@@ -215,6 +216,33 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The analytics cache is file-based so every gunicorn worker shares the same
+# version tokens; a local-memory backend also works for single-process setups.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'analytics'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+# Seconds an analytics payload may be served from cache. Writes invalidate
+# entries immediately; the timeout only bounds time-relative ranges like 'day'.
+ANALYTICS_CACHE_TIMEOUT = 300
+
+# Threads per process used to run independent analytics aggregates concurrently.
+# Each thread holds its own database connection; set to 1 to run them in sequence.
+ANALYTICS_QUERY_WORKERS = 4
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
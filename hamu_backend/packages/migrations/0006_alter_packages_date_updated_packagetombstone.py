@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-16 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packages', '0005_alter_packages_bottle_type'),
+        ('shops', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='packages',
+            name='date_updated',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='PackageTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('package_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='package_tombstones', to='shops.shops')),
+            ],
+            options={
+                'verbose_name_plural': 'Package Tombstones',
+            },
+        ),
+    ]
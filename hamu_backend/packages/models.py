@@ -46,7 +46,7 @@ class Packages(models.Model):
     description = models.CharField(max_length=50, blank=True, help_text="Optional extra description if needed")
     # Use DecimalField for price
     price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
-    date_updated = models.DateTimeField(auto_now=True)
+    date_updated = models.DateTimeField(auto_now=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True) # Track creation
 
     def clean(self):
@@ -88,4 +88,20 @@ class Packages(models.Model):
         unique_together = (
             ('shop', 'sale_type', 'water_amount_label', 'bottle_type', 'description', 'price') # Price included as slight variations might exist
         )
-        ordering = ['shop', 'sale_type', 'price'] # Default ordering
\ No newline at end of file
+        ordering = ['shop', 'sale_type', 'price'] # Default ordering
+
+
+class PackageTombstone(models.Model):
+    """
+    Records a deleted package so offline clients syncing with a `since` cursor
+    can remove it from their cache.
+    """
+    package_id = models.BigIntegerField()
+    shop = models.ForeignKey(Shops, on_delete=models.CASCADE, related_name='package_tombstones')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Package {self.package_id} deleted on {self.deleted_at.strftime('%Y-%m-%d %H:%M')}"
+
+    class Meta:
+        verbose_name_plural = 'Package Tombstones'
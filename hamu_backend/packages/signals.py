@@ -0,0 +1,13 @@
+"""
+Signal handler that records a PackageTombstone when a package is deleted, so
+offline clients syncing with a `since` cursor drop it from their cache.
+"""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Packages, PackageTombstone
+
+
+@receiver(post_delete, sender=Packages, dispatch_uid='package_tombstone')
+def record_package_tombstone(sender, instance, **kwargs):
+    PackageTombstone.objects.create(package_id=instance.pk, shop_id=instance.shop_id)
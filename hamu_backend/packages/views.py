@@ -3,9 +3,12 @@ from rest_framework import viewsets, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Packages
+from django.db.models import Count, Max
+from .models import Packages, PackageTombstone
+from shops.models import Shops
 from .serializers import PackageSerializer
 from hamu_backend.permissions import IsShopAgentOrDirector
+from hamu_backend.sync import OfflineSync
 
 
 class PackageViewSet(viewsets.ModelViewSet):
@@ -41,14 +44,39 @@ class PackageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def export_for_offline(self, request):
         """
-        Export all packages for offline caching.
+        Export packages for offline caching.
         Returns all fields needed for creating sales/refills offline.
+        With since=<cursor from the previous export>, only packages changed since
+        then are returned, plus the ids of deleted packages.
         """
+        try:
+            since = OfflineSync.parse_since(request.query_params.get('since'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        cursor = OfflineSync.new_cursor()
         queryset = self.get_queryset()
+        deleted = []
+        if since is not None:
+            queryset = queryset.filter(date_updated__gte=since)
+            tombstones = PackageTombstone.objects.filter(deleted_at__gte=since)
+            if request.user.user_class != 'Director':
+                tombstones = tombstones.filter(shop=request.user.shop)
+            deleted = sorted(set(tombstones.values_list('package_id', flat=True)))
         
-        packages = []
-        for pkg in queryset.select_related('shop'):
-            packages.append({
+        # Watermark of the export without reading the rows
+        watermark = queryset.aggregate(count=Count('id'), last_updated=Max('date_updated'))
+        shops = list(
+            Shops.objects.filter(id__in=queryset.values('shop_id')).order_by('id').values_list('id', 'shopName')
+        )
+        etag = OfflineSync.get_etag(
+            'packages', request.user.user_class, request.user.shop_id, since, watermark, deleted, shops
+        )
+        if OfflineSync.is_not_modified(request, etag):
+            return OfflineSync.not_modified(etag)
+
+        packages = (
+            {
                 'id': pkg.id,
                 'water_amount_label': pkg.water_amount_label,
                 'bottle_type': pkg.bottle_type,
@@ -60,10 +88,12 @@ class PackageViewSet(viewsets.ModelViewSet):
                     'id': pkg.shop.id,
                     'shopName': pkg.shop.shopName,
                 } if pkg.shop else None
-            })
+            }
+            for pkg in queryset.iterator(chunk_size=500)
+        )
         
-        return Response({
-            'results': packages,
-            'count': len(packages),
-            'export_type': 'offline_cache'
-        })
+        return OfflineSync.stream_export(request, packages, {
+            'deleted': deleted,
+            'export_type': 'offline_delta' if since is not None else 'offline_cache',
+            'cursor': cursor
+        }, etag)
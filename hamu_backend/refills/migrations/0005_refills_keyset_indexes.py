@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-16 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('refills', '0004_refills_client_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='refills',
+            index=models.Index(fields=['shop', 'created_at', 'id'], name='refills_shop_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refills',
+            index=models.Index(fields=['created_at', 'id'], name='refills_created_id_idx'),
+        ),
+    ]
@@ -67,4 +67,9 @@ class Refills(models.Model):
 
     class Meta:
         verbose_name_plural = 'Refills'
-        ordering = ['-created_at'] # Show newest first
\ No newline at end of file
+        ordering = ['-created_at'] # Show newest first
+        indexes = [
+            # Keyset pages on (created_at, id), per shop for agents and across shops for directors
+            models.Index(fields=['shop', 'created_at', 'id'], name='refills_shop_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='refills_created_id_idx'),
+        ]
\ No newline at end of file
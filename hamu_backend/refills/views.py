@@ -6,7 +6,9 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Count, F, Q
 from .models import Refills
 from .serializers import RefillSerializer
+from hamu_backend.pagination import TransactionPagination
 from hamu_backend.permissions import IsShopAgentOrDirector
+from hamu_backend.search import CustomerSearchFilter
 from sms.utils import send_free_refill_notification
 
 
@@ -18,7 +20,10 @@ class RefillViewSet(viewsets.ModelViewSet):
     """
     serializer_class = RefillSerializer
     permission_classes = [IsShopAgentOrDirector]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = TransactionPagination
+    # Keyset pages with ?pagination=cursor
+    cursor_ordering_field = 'created_at'
+    filter_backends = [DjangoFilterBackend, CustomerSearchFilter, filters.OrderingFilter]
     search_fields = ['customer__names', 'customer__phone_number', 'agent_name']
     ordering_fields = ['created_at', 'payment_mode', 'cost']
     filterset_fields = ['shop', 'customer', 'payment_mode', 'is_free']
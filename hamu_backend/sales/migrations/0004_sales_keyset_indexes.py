@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-16 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_sales_client_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['shop', 'sold_at', 'id'], name='sales_shop_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sales',
+            index=models.Index(fields=['sold_at', 'id'], name='sales_sold_id_idx'),
+        ),
+    ]
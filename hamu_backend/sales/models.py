@@ -61,4 +61,9 @@ class Sales(models.Model):
 
     class Meta:
         verbose_name_plural = 'Sales'
-        ordering = ['-sold_at'] # Show newest first
\ No newline at end of file
+        ordering = ['-sold_at'] # Show newest first
+        indexes = [
+            # Keyset pages on (sold_at, id), per shop for agents and across shops for directors
+            models.Index(fields=['shop', 'sold_at', 'id'], name='sales_shop_sold_idx'),
+            models.Index(fields=['sold_at', 'id'], name='sales_sold_id_idx'),
+        ]
\ No newline at end of file
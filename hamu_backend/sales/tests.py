@@ -1,3 +1,105 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from hamu_backend.pagination import TransactionPagination
+from packages.models import Packages
+from shops.models import Shops
+from users.models import Users
+
+from .models import Sales
+
+
+class SalesCursorPaginationTests(TestCase):
+    """
+    `?pagination=cursor` on the sales list: keyset pages on (sold_at, id),
+    walked with the `next` link.
+    """
+    PAGE_SIZE = 3
+
+    def setUp(self):
+        self.shop = Shops.objects.create(shopName='Cursor', freeRefillInterval=10)
+        self.package = Packages.objects.create(
+            shop=self.shop, sale_type=Packages.SaleType.SALE, bottle_type=Packages.BottleType.DISPOSABLE,
+            water_amount_label=Decimal('1.0'), price=Decimal('50.00')
+        )
+        director = Users.objects.create_user(
+            phone_number='0711000001', names='Director', user_class=Users.UserClass.DIRECTOR, password='pass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=director)
+
+        now = timezone.now().replace(microsecond=0)
+        # Several sales share a timestamp, so pages must break ties on id
+        sold_at = [now, now, now, now - timedelta(hours=1), now - timedelta(hours=1), now - timedelta(days=1), None]
+        self.sales = [
+            Sales.objects.create(
+                shop=self.shop, package=self.package, payment_mode='CASH',
+                cost=Decimal('50.00'), sold_at=value
+            )
+            for value in sold_at
+        ]
+
+        patcher = mock.patch.object(TransactionPagination, 'page_size', self.PAGE_SIZE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walk(self, url):
+        """Follow `next` links from url; returns the pages' responses"""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data['next']
+            self.assertLessEqual(len(pages), len(self.sales), 'cursor pages never ended')
+        return pages
+
+    def test_cursor_walk_returns_every_sale_once(self):
+        pages = self.walk('/api/sales/?pagination=cursor')
+        ids = [row['id'] for page in pages for row in page['results']]
+
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), sorted(sale.pk for sale in self.sales))
+        self.assertTrue(all(len(page['results']) <= self.PAGE_SIZE for page in pages))
+        self.assertIsNone(pages[-1]['next'])
+        self.assertIsNone(pages[-1]['next_cursor'])
+        self.assertNotIn('count', pages[0])
+
+    def test_cursor_walk_includes_undated_sale(self):
+        undated = self.sales[-1]
+        pages = self.walk('/api/sales/?pagination=cursor')
+        ids = [row['id'] for page in pages for row in page['results']]
+
+        self.assertIn(undated.pk, ids)
+        # NULL sold_at sorts first, as in the default descending ordering
+        self.assertEqual(ids[0], undated.pk)
+
+    def test_cursor_follows_timestamp_then_id_order(self):
+        pages = self.walk('/api/sales/?pagination=cursor')
+        ids = [row['id'] for page in pages for row in page['results']]
+        dated = sorted(
+            (sale for sale in self.sales if sale.sold_at is not None),
+            key=lambda sale: (sale.sold_at, sale.pk), reverse=True
+        )
+        self.assertEqual(ids[1:], [sale.pk for sale in dated])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/sales/', {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIsInstance(response.data['error'], str)
+        self.assertTrue(response.data['error'].startswith('Invalid cursor'))
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get('/api/sales/')
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(self.sales))
+        self.assertEqual(len(response.data['results']), self.PAGE_SIZE)
+        self.assertIn('page=2', response.data['next'])
+        self.assertNotIn('next_cursor', response.data)
@@ -6,7 +6,9 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Sum, F, Count
 from .models import Sales
 from .serializers import SalesSerializer
+from hamu_backend.pagination import TransactionPagination
 from hamu_backend.permissions import IsShopAgentOrDirector
+from hamu_backend.search import CustomerSearchFilter
 
 
 class SalesViewSet(viewsets.ModelViewSet):
@@ -17,7 +19,10 @@ class SalesViewSet(viewsets.ModelViewSet):
     """
     serializer_class = SalesSerializer
     permission_classes = [IsShopAgentOrDirector]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = TransactionPagination
+    # Keyset pages with ?pagination=cursor
+    cursor_ordering_field = 'sold_at'
+    filter_backends = [DjangoFilterBackend, CustomerSearchFilter, filters.OrderingFilter]
     search_fields = ['customer__names', 'customer__phone_number', 'agent_name']
     ordering_fields = ['sold_at', 'payment_mode', 'cost']
     filterset_fields = ['shop', 'customer', 'payment_mode', 'package']
@@ -3,8 +3,13 @@ from .models import Shops
 
 
 class ShopSerializer(serializers.ModelSerializer):
-    customer_count = serializers.IntegerField(read_only=True, source='customers.count')
+    customer_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Shops
-        fields = ['id', 'shopName', 'freeRefillInterval', 'phone_number', 'customer_count']
\ No newline at end of file
+        fields = ['id', 'shopName', 'freeRefillInterval', 'phone_number', 'customer_count']
+
+    def get_customer_count(self, obj):
+        # Querysets listing many shops annotate customer_count to skip a COUNT per shop
+        customer_count = getattr(obj, 'customer_count', None)
+        return customer_count if customer_count is not None else obj.customers.count()
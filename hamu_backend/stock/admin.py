@@ -1,8 +1,7 @@
 from django.contrib import admin
-from django.db.models import Sum
 from django import forms
 from django.contrib import messages
-from .models import StockItem, StockLog
+from .models import StockItem, StockLog, PackageComponent, StockItemComponent
 from .services import StockCalculationService
 
 
@@ -13,6 +12,14 @@ class StockLogInline(admin.TabularInline):
     readonly_fields = ('log_date',)
 
 
+class StockItemComponentInline(admin.TabularInline):
+    """Recipe for assembled items, e.g. the bottles and shrink wrap in a water bundle"""
+    model = StockItemComponent
+    fk_name = 'assembly'
+    extra = 0
+    autocomplete_fields = ('component',)
+
+
 class StockItemAdminForm(forms.ModelForm):
     """Custom form for StockItem that dynamically updates item_type choices based on item_name"""
     # Override the item_type field to always be a Select widget
@@ -68,7 +75,8 @@ class StockItemAdmin(admin.ModelAdmin):
     list_filter = ('shop', 'item_name', 'item_type')
     search_fields = ('item_name', 'item_type')
     readonly_fields = ('created_at', 'current_quantity')
-    inlines = [StockLogInline]
+    inlines = [StockItemComponentInline, StockLogInline]
+    list_select_related = ('shop', 'balance')
     fieldsets = (
         (None, {
             'fields': ('shop', 'item_name')
@@ -82,11 +90,8 @@ class StockItemAdmin(admin.ModelAdmin):
     )
     
     def current_quantity(self, obj):
-        """Calculate current stock level by summing all stock log entries"""
-        quantity = StockLog.objects.filter(stock_item=obj).aggregate(
-            total=Sum('quantity_change')
-        )['total'] or 0
-        return quantity
+        """Current stock level from the item's StockBalance row"""
+        return StockCalculationService.get_current_stock_level(obj)
     
     current_quantity.short_description = 'Current Quantity'
     
@@ -129,3 +134,12 @@ class StockLogAdmin(admin.ModelAdmin):
 
 # Register StockItem with its custom admin
 admin.site.register(StockItem, StockItemAdmin)
+
+
+@admin.register(PackageComponent)
+class PackageComponentAdmin(admin.ModelAdmin):
+    list_display = ('package', 'stock_item', 'quantity')
+    list_filter = ('package__shop', 'package__sale_type', 'stock_item__item_name')
+    search_fields = ('package__description', 'stock_item__item_name', 'stock_item__item_type')
+    list_select_related = ('package', 'stock_item')
+    autocomplete_fields = ('stock_item',)
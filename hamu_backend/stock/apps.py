@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StockConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stock'
+
+    def ready(self):
+        # Register the StockBalance signal handlers
+        from . import signals  # noqa: F401
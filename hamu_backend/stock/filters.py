@@ -44,4 +44,19 @@ class StockLogFilter(django_filters.FilterSet):
             'stock_item__item_name': ['exact'],
             'stock_item__item_type': ['exact'],
             'quantity_change': ['gt', 'lt'],
-        }
\ No newline at end of file
+        }
+
+class StockLedgerFilter(StockLogFilter):
+    """
+    Filter for the stock ledger. Same as StockLogFilter but without the
+    quantity_change filters, which would drop individual movements of an item
+    and break its running balance.
+    """
+
+    class Meta(StockLogFilter.Meta):
+        fields = {
+            'shop': ['exact'],
+            'stock_item': ['exact'],
+            'stock_item__item_name': ['exact'],
+            'stock_item__item_type': ['exact'],
+        }
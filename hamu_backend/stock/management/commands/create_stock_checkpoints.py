@@ -0,0 +1,70 @@
+"""
+Management command to write month-end StockCheckpoint rows. Run it nightly (or
+at least once after each month ends); it is safe to re-run.
+
+Usage: python manage.py create_stock_checkpoints [--shop SHOP_ID] [--month YYYY-MM] [--backfill]
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from stock.models import StockLog
+from stock.services import StockCheckpointService
+
+
+class Command(BaseCommand):
+    help = 'Write month-end stock checkpoints (defaults to the last completed month)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop',
+            type=int,
+            help='Only checkpoint stock items for this shop ID',
+        )
+        parser.add_argument(
+            '--month',
+            help='Completed month to checkpoint, as YYYY-MM',
+        )
+        parser.add_argument(
+            '--backfill',
+            action='store_true',
+            help='Checkpoint every completed month since the first stock log '
+                 '(also recreates checkpoints removed by back-dated logs)',
+        )
+
+    def handle(self, *args, **options):
+        current_month = StockCheckpointService.month_start(timezone.localdate())
+
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must be in YYYY-MM format')
+            period_ends = [StockCheckpointService.next_month_start(month)]
+            if period_ends[0] > current_month:
+                raise CommandError(f"{options['month']} has not ended yet")
+        elif options['backfill']:
+            logs = StockLog.objects.all()
+            if options['shop']:
+                logs = logs.filter(shop_id=options['shop'])
+            first_log = logs.aggregate(first=Min('log_date'))['first']
+            if first_log is None:
+                self.stdout.write('No stock logs to checkpoint.')
+                return
+
+            # Oldest month first, so each month builds on the previous checkpoint
+            period_ends = []
+            period_end = StockCheckpointService.next_month_start(timezone.localtime(first_log).date())
+            while period_end <= current_month:
+                period_ends.append(period_end)
+                period_end = StockCheckpointService.next_month_start(period_end.date())
+        else:
+            period_ends = [current_month]
+
+        for period_end in period_ends:
+            created = StockCheckpointService.create_checkpoints(period_end, shop_id=options['shop'])
+            self.stdout.write(f"{period_end:%Y-%m-%d}: {created} checkpoints")
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote checkpoints for {len(period_ends)} month(s).'))
@@ -1,179 +1,111 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
 from shops.models import Shops
-from stock.models import StockItem
+from stock.models import StockItem, StockBalance
+from stock.services import StockCalculationService
 
 
 class Command(BaseCommand):
     help = 'Generate stock items for all shops using predefined choices'
 
     def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop',
+            type=int,
+            help='Only generate stock items for this shop ID',
+        )
         parser.add_argument(
             '--force',
             action='store_true',
-            help='Force creation even if items already exist',
+            help='Also reset the unit of existing items to the default for their category',
         )
 
     def handle(self, *args, **options):
         force = options['force']
         shops = Shops.objects.all()
+        if options['shop']:
+            shops = shops.filter(id=options['shop'])
+        shops = {shop.id: shop.shopName for shop in shops}
         
-        if not shops.exists():
+        if not shops:
+            if options['shop']:
+                raise CommandError(f"Shop {options['shop']} not found.")
             self.stdout.write(self.style.ERROR('No shops found. Please create shops first.'))
             return
         
-        self.stdout.write(self.style.SUCCESS(f'Found {shops.count()} shops. Starting stock item generation...'))
+        self.stdout.write(self.style.SUCCESS(f'Found {len(shops)} shops. Starting stock item generation...'))
         
-        # Get all item types from the model
-        bottle_types = list(StockItem.BottleType.values)
-        cap_types = list(StockItem.CapType.values)
-        label_types = list(StockItem.LabelType.values)
-        shrink_wrap_types = list(StockItem.ShrinkWrapType.values)
-        water_bundle_types = list(StockItem.WaterBundleType.values)
-        
-        total_created = 0
-        total_existing = 0
+        # Every (item_name, item_type) the model defines, with its default unit
+        definitions = {}
+        for item_name, types in [
+            (StockItem.ItemName.BOTTLE, StockItem.BottleType.values),
+            (StockItem.ItemName.CAP, StockItem.CapType.values),
+            (StockItem.ItemName.LABEL, StockItem.LabelType.values),
+            (StockItem.ItemName.SHRINK_WRAP, StockItem.ShrinkWrapType.values),
+            (StockItem.ItemName.WATER_BUNDLE, StockItem.WaterBundleType.values),
+        ]:
+            unit = 'bundle' if item_name == StockItem.ItemName.WATER_BUNDLE else 'piece'
+            for item_type in types:
+                definitions[(str(item_name), item_type)] = unit
         
         with transaction.atomic():
-            # Process each shop
-            for shop in shops:
-                self.stdout.write(f'Processing shop: {shop.shopName}')
-                
-                # Generate Bottle items
-                for bottle_type in bottle_types:
-                    existing = StockItem.objects.filter(
-                        shop=shop,
-                        item_name=StockItem.ItemName.BOTTLE,
-                        item_type=bottle_type
-                    ).exists()
-                    
-                    if not existing or force:
-                        if existing and force:
-                            # Skip if already exists and not forcing
-                            self.stdout.write(f'  - Bottle {bottle_type} already exists, skipping')
-                            total_existing += 1
-                            continue
-                            
-                        # Create the stock item
-                        StockItem.objects.create(
-                            shop=shop,
-                            item_name=StockItem.ItemName.BOTTLE,
-                            item_type=bottle_type,
-                            unit='piece'
-                        )
-                        self.stdout.write(f'  + Created Bottle {bottle_type}')
-                        total_created += 1
-                    else:
-                        total_existing += 1
-                
-                # Generate Cap items
-                for cap_type in cap_types:
-                    existing = StockItem.objects.filter(
-                        shop=shop,
-                        item_name=StockItem.ItemName.CAP,
-                        item_type=cap_type
-                    ).exists()
-                    
-                    if not existing or force:
-                        if existing and force:
-                            # Skip if already exists and not forcing
-                            self.stdout.write(f'  - Cap {cap_type} already exists, skipping')
-                            total_existing += 1
-                            continue
-                            
-                        # Create the stock item
-                        StockItem.objects.create(
-                            shop=shop,
-                            item_name=StockItem.ItemName.CAP,
-                            item_type=cap_type,
-                            unit='piece'
-                        )
-                        self.stdout.write(f'  + Created Cap {cap_type}')
-                        total_created += 1
-                    else:
-                        total_existing += 1
-                
-                # Generate Label items
-                for label_type in label_types:
-                    existing = StockItem.objects.filter(
-                        shop=shop,
-                        item_name=StockItem.ItemName.LABEL,
-                        item_type=label_type
-                    ).exists()
-                    
-                    if not existing or force:
-                        if existing and force:
-                            # Skip if already exists and not forcing
-                            self.stdout.write(f'  - Label {label_type} already exists, skipping')
-                            total_existing += 1
-                            continue
-                            
-                        # Create the stock item
-                        StockItem.objects.create(
-                            shop=shop,
-                            item_name=StockItem.ItemName.LABEL,
-                            item_type=label_type,
-                            unit='piece'
-                        )
-                        self.stdout.write(f'  + Created Label {label_type}')
-                        total_created += 1
-                    else:
-                        total_existing += 1
-                
-                # Generate Shrink Wrap items
-                for shrink_wrap_type in shrink_wrap_types:
-                    existing = StockItem.objects.filter(
-                        shop=shop,
-                        item_name=StockItem.ItemName.SHRINK_WRAP,
-                        item_type=shrink_wrap_type
-                    ).exists()
-                    
-                    if not existing or force:
-                        if existing and force:
-                            # Skip if already exists and not forcing
-                            self.stdout.write(f'  - Shrink Wrap {shrink_wrap_type} already exists, skipping')
-                            total_existing += 1
-                            continue
-                            
-                        # Create the stock item
-                        StockItem.objects.create(
-                            shop=shop,
-                            item_name=StockItem.ItemName.SHRINK_WRAP,
-                            item_type=shrink_wrap_type,
-                            unit='piece'
-                        )
-                        self.stdout.write(f'  + Created Shrink Wrap {shrink_wrap_type}')
-                        total_created += 1
-                    else:
-                        total_existing += 1
-                
-                # Generate Water Bundle items
-                for water_bundle_type in water_bundle_types:
-                    existing = StockItem.objects.filter(
-                        shop=shop,
-                        item_name=StockItem.ItemName.WATER_BUNDLE,
-                        item_type=water_bundle_type
-                    ).exists()
-                    
-                    if not existing or force:
-                        if existing and force:
-                            # Skip if already exists and not forcing
-                            self.stdout.write(f'  - Water Bundle {water_bundle_type} already exists, skipping')
-                            total_existing += 1
-                            continue
-                            
-                        # Create the stock item
-                        StockItem.objects.create(
-                            shop=shop,
-                            item_name=StockItem.ItemName.WATER_BUNDLE,
-                            item_type=water_bundle_type,
-                            unit='bundle'
-                        )
-                        self.stdout.write(f'  + Created Water Bundle {water_bundle_type}')
-                        total_created += 1
-                    else:
-                        total_existing += 1
+            # One fetch of what exists, diffed against the full desired set
+            existing = {
+                (item.shop_id, item.item_name, item.item_type): item
+                for item in StockItem.objects.filter(shop_id__in=shops)
+            }
+            missing = [
+                StockItem(shop_id=shop_id, item_name=item_name, item_type=item_type, unit=unit)
+                for shop_id in shops
+                for (item_name, item_type), unit in definitions.items()
+                if (shop_id, item_name, item_type) not in existing
+            ]
+            try:
+                with transaction.atomic():
+                    StockItem.objects.bulk_create(missing, batch_size=1000)
+                created = missing
+            except IntegrityError:
+                # Another process inserted some of these items since the fetch; insert
+                # them one at a time so only the rows this run wrote are reported
+                created = []
+                for item in missing:
+                    item = StockItem(shop_id=item.shop_id, item_name=item.item_name, item_type=item.item_type, unit=item.unit)
+                    try:
+                        with transaction.atomic():
+                            StockItem.objects.bulk_create([item])
+                    except IntegrityError:
+                        continue
+                    created.append(item)
+            
+            updated = []
+            if force:
+                for (shop_id, item_name, item_type), item in existing.items():
+                    unit = definitions.get((item_name, item_type))
+                    if unit and item.unit != unit:
+                        item.unit = unit
+                        updated.append(item)
+                StockItem.objects.bulk_update(updated, ['unit'], batch_size=1000)
+            
+            # bulk_create skips the post_save handlers, so do their work here:
+            # empty balances and the default bill of materials for the new items
+            # (bulk_create sets their ids on PostgreSQL)
+            created_ids = [item.id for item in created]
+            if created_ids:
+                StockBalance.objects.bulk_create(
+                    [StockBalance(stock_item_id=item_id, quantity=0) for item_id in created_ids],
+                    batch_size=1000,
+                    ignore_conflicts=True
+                )
+                StockCalculationService.sync_default_components(
+                    options['shop'], stock_item_ids=created_ids
+                )
+        
+        for item in created:
+            self.stdout.write(f'  + Created {item.item_name} {item.item_type} for {shops[item.shop_id]}')
+        for item in updated:
+            self.stdout.write(f'  ~ Reset unit of {item.item_name} {item.item_type} for {shops[item.shop_id]} to {item.unit}')
         
         self.stdout.write(self.style.SUCCESS(
-            f'Stock item generation complete! Created {total_created} items, skipped {total_existing} existing items.'
-        ))
\ No newline at end of file
+            f'Stock item generation complete! Created {len(created_ids)} items, '
+            f'skipped {len(existing)} existing items, reset {len(updated)} units.'
+        ))
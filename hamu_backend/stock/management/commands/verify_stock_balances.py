@@ -0,0 +1,52 @@
+"""
+Management command to check StockBalance rows against the StockLog and
+optionally repair any drift.
+
+Usage: python manage.py verify_stock_balances [--shop SHOP_ID] [--repair]
+"""
+from django.core.management.base import BaseCommand
+
+from stock.services import StockCalculationService
+
+
+class Command(BaseCommand):
+    help = 'Recompute stock balances from the stock log and report (or repair) drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shop',
+            type=int,
+            help='Only check stock items for this shop ID',
+        )
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Reset drifted or missing balances to the sum of the log',
+        )
+
+    def handle(self, *args, **options):
+        drift = StockCalculationService.get_balance_drift(shop_id=options.get('shop'))
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All stock balances match the stock log.'))
+            return
+
+        for entry in drift:
+            item = entry['stock_item']
+            if entry['balance'] is None:
+                detail = 'no balance row'
+            else:
+                detail = f"balance {entry['balance']}, drift {entry['balance'] - entry['log_total']:+d}"
+            self.stdout.write(
+                f"{item.shop.shopName} - {item.item_name} {item.item_type}: "
+                f"log total {entry['log_total']}, {detail}"
+            )
+
+        if not options['repair']:
+            self.stdout.write(self.style.WARNING(
+                f'{len(drift)} stock balances are out of step with the log. Run with --repair to fix them.'
+            ))
+            return
+
+        repaired = StockCalculationService.repair_balances(entry['stock_item'].pk for entry in drift)
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} stock balances.'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-16 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_balances(apps, schema_editor):
+    """Create a balance row for every existing stock item from its log"""
+    StockItem = apps.get_model('stock', 'StockItem')
+    StockLog = apps.get_model('stock', 'StockLog')
+    StockBalance = apps.get_model('stock', 'StockBalance')
+
+    totals = dict(
+        StockLog.objects.order_by().values('stock_item_id').annotate(
+            total=Sum('quantity_change')
+        ).values_list('stock_item_id', 'total')
+    )
+    StockBalance.objects.bulk_create([
+        StockBalance(stock_item_id=item_id, quantity=totals.get(item_id) or 0)
+        for item_id in StockItem.objects.values_list('id', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0007_stocklog_client_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBalance',
+            fields=[
+                ('stock_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='stock.stockitem')),
+                ('quantity', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Balances',
+            },
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
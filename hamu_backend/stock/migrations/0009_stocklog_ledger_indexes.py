@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-16 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0008_stockbalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stocklog',
+            index=models.Index(fields=['shop', 'log_date', 'id'], name='stock_log_shop_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklog',
+            index=models.Index(fields=['stock_item', 'log_date', 'id'], name='stock_log_item_date_idx'),
+        ),
+    ]
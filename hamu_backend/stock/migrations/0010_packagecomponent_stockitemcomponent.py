@@ -0,0 +1,115 @@
+# Generated by Django 5.2 on 2026-10-16 11:20
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+# The deduction rules in use when the bill of materials was introduced. Kept here
+# rather than imported so the migration doesn't change if the service does.
+BUNDLE_RECIPES = {
+    '12x1L': [('Bottle', '1L', 12), ('Shrink Wrap', '12x1L', 1)],
+    '24x0.5L': [('Bottle', '0.5L', 24), ('Shrink Wrap', '24x0.5L', 1)],
+    '8x1.5L': [('Bottle', '1.5L', 8), ('Shrink Wrap', '8x1.5L', 1)],
+}
+
+
+def default_package_items(package):
+    """(item_name, item_type) pairs a package used to deduct per unit"""
+    amount = package.water_amount_label
+    litres = f"{Decimal(str(amount)).normalize():f}"
+    items = []
+    if package.sale_type == 'REFILL':
+        if amount in [10, 20]:
+            items.append(('Cap', '10/20L'))
+        if amount in [5, 10, 20]:
+            items.append(('Label', f"{litres}L"))
+    elif package.sale_type == 'SALE' and package.bottle_type == 'BUNDLE':
+        description = (package.description or '').lower()
+        if '12x1' in description:
+            items.append(('Water Bundle', '12x1L'))
+        elif '24x0.5' in description or '24x500' in description:
+            items.append(('Water Bundle', '24x0.5L'))
+        elif '8x1.5' in description:
+            items.append(('Water Bundle', '8x1.5L'))
+    elif package.sale_type == 'SALE':
+        if package.bottle_type == 'HARD' and amount == 20:
+            items.append(('Bottle', '20L Hard'))
+        else:
+            items.append(('Bottle', f"{litres}L"))
+        if amount in [5, 10, 20]:
+            items.append(('Label', f"{litres}L"))
+    return items
+
+
+def seed_components(apps, schema_editor):
+    """Seed the bill of materials for every shop from the original rules"""
+    Packages = apps.get_model('packages', 'Packages')
+    StockItem = apps.get_model('stock', 'StockItem')
+    PackageComponent = apps.get_model('stock', 'PackageComponent')
+    StockItemComponent = apps.get_model('stock', 'StockItemComponent')
+
+    item_ids = {
+        (shop_id, item_name, item_type): item_id
+        for item_id, shop_id, item_name, item_type in StockItem.objects.values_list(
+            'id', 'shop_id', 'item_name', 'item_type'
+        )
+    }
+
+    package_components = []
+    for package in Packages.objects.all():
+        for item_name, item_type in default_package_items(package):
+            item_id = item_ids.get((package.shop_id, item_name, item_type))
+            if item_id:
+                package_components.append(PackageComponent(package_id=package.id, stock_item_id=item_id, quantity=1))
+    PackageComponent.objects.bulk_create(package_components, batch_size=1000, ignore_conflicts=True)
+
+    item_components = []
+    for (shop_id, item_name, item_type), assembly_id in item_ids.items():
+        if item_name != 'Water Bundle':
+            continue
+        for component_name, component_type, quantity in BUNDLE_RECIPES.get(item_type, []):
+            component_id = item_ids.get((shop_id, component_name, component_type))
+            if component_id:
+                item_components.append(StockItemComponent(
+                    assembly_id=assembly_id, component_id=component_id, quantity=quantity
+                ))
+    StockItemComponent.objects.bulk_create(item_components, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packages', '0005_alter_packages_bottle_type'),
+        ('stock', '0009_stocklog_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageComponent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, help_text='Units of the stock item used per unit of the package')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='components', to='packages.packages')),
+                ('stock_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='package_components', to='stock.stockitem')),
+            ],
+            options={
+                'verbose_name_plural': 'Package Components',
+                'unique_together': {('package', 'stock_item')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StockItemComponent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, help_text='Units of the component used per unit of the assembly')),
+                ('assembly', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='components', to='stock.stockitem')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_in', to='stock.stockitem')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Item Components',
+                'unique_together': {('assembly', 'component')},
+            },
+        ),
+        migrations.RunPython(seed_components, migrations.RunPython.noop),
+    ]
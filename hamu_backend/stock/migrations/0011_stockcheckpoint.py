@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-16 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0010_packagecomponent_stockitemcomponent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateTimeField(help_text='Exclusive end of the period (local midnight on the 1st of the next month)')),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('stock_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='stock.stockitem')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Checkpoints',
+                'ordering': ['-period_end'],
+                'unique_together': {('stock_item', 'period_end')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-16 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0011_stockcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stocklog',
+            index=models.Index(fields=['log_date', 'id'], name='stock_log_date_id_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from shops.models import Shops
+from packages.models import Packages
 # from django.contrib.auth import get_user_model # Use if linking agent/director to Users model later
 
 # User = get_user_model() # Use if linking agent/director to Users model later
@@ -130,8 +131,89 @@ class StockLog(models.Model):
     class Meta:
         verbose_name_plural = 'Stock Change Log'
         ordering = ['-log_date']
+        indexes = [
+            # Ledger pages (keyset on log_date, id) and per-item balances up to a point in time
+            models.Index(fields=['shop', 'log_date', 'id'], name='stock_log_shop_date_idx'),
+            models.Index(fields=['stock_item', 'log_date', 'id'], name='stock_log_item_date_idx'),
+            # Keyset pages across shops (directors)
+            models.Index(fields=['log_date', 'id'], name='stock_log_date_id_idx'),
+        ]
 
-# Note: Calculating the *current* stock level for a StockItem involves summing
-# the 'quantity_change' from all related StockLog entries. This is usually done
-# in a view or manager method, not stored directly on the StockItem model itself
-# to avoid data duplication and potential inconsistencies.
\ No newline at end of file
+
+class PackageComponent(models.Model):
+    """
+    Bill of materials for a package: the stock items used up by each unit sold or
+    refilled (e.g. a 20L refill uses one 10/20L cap and one 20L label).
+    """
+    package = models.ForeignKey(Packages, on_delete=models.CASCADE, related_name='components')
+    stock_item = models.ForeignKey(StockItem, on_delete=models.CASCADE, related_name='package_components')
+    quantity = models.PositiveIntegerField(default=1, help_text="Units of the stock item used per unit of the package")
+
+    def __str__(self):
+        return f"{self.package}: {self.quantity} x {self.stock_item.item_name} {self.stock_item.item_type}"
+
+    class Meta:
+        verbose_name_plural = 'Package Components'
+        unique_together = ('package', 'stock_item')
+
+
+class StockItemComponent(models.Model):
+    """
+    Recipe for a stock item assembled from other stock items (e.g. a 12x1L water
+    bundle uses twelve 1L bottles and one 12x1L shrink wrap).
+    """
+    assembly = models.ForeignKey(StockItem, on_delete=models.CASCADE, related_name='components')
+    component = models.ForeignKey(StockItem, on_delete=models.CASCADE, related_name='used_in')
+    quantity = models.PositiveIntegerField(default=1, help_text="Units of the component used per unit of the assembly")
+
+    def __str__(self):
+        return f"{self.assembly.item_name} {self.assembly.item_type}: {self.quantity} x {self.component.item_name} {self.component.item_type}"
+
+    class Meta:
+        verbose_name_plural = 'Stock Item Components'
+        unique_together = ('assembly', 'component')
+
+
+class StockBalance(models.Model):
+    """
+    Current quantity of a StockItem, kept equal to the sum of its StockLog
+    quantity_change values so stock levels can be read without scanning the log.
+    """
+    stock_item = models.OneToOneField(StockItem, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    quantity = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.stock_item}: {self.quantity}"
+
+    class Meta:
+        verbose_name_plural = 'Stock Balances'
+
+class StockCheckpoint(models.Model):
+    """
+    Closing quantity of a StockItem at the end of a month: the sum of its StockLog
+    quantity_change values with log_date before `period_end`. Balances as of a
+    date start from the nearest checkpoint and only sum the logs after it.
+    """
+    stock_item = models.ForeignKey(StockItem, on_delete=models.CASCADE, related_name='checkpoints')
+    period_end = models.DateTimeField(help_text="Exclusive end of the period (local midnight on the 1st of the next month)")
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.stock_item} before {self.period_end:%Y-%m-%d}: {self.quantity}"
+
+    class Meta:
+        verbose_name_plural = 'Stock Checkpoints'
+        unique_together = ('stock_item', 'period_end')
+        ordering = ['-period_end']
+
+# Note: The StockLog remains the source of truth for stock levels. StockBalance is
+# updated with an F() increment by signal handlers (stock/signals.py) whenever a
+# StockLog is created, edited or deleted. Bulk queryset.update()/delete() calls on
+# StockLog bypass those handlers; run `python manage.py verify_stock_balances --repair`
+# after such operations.
+#
+# StockCheckpoint rows are written by `python manage.py create_stock_checkpoints`
+# and deleted by the same handlers when a StockLog dated before them is created,
+# edited or deleted (offline sync sends back-dated log_date values).
\ No newline at end of file
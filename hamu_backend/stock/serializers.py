@@ -64,8 +64,14 @@ class StockItemSerializer(serializers.ModelSerializer):
         }
     
     def get_current_quantity(self, obj):
-        """Calculate current stock level using the StockCalculationService"""
-        return StockCalculationService.get_current_stock_level(obj)
+        """
+        Use the current_quantity annotation from the viewset queryset when present,
+        otherwise calculate it with the StockCalculationService
+        """
+        quantity = getattr(obj, 'current_quantity', None)
+        if quantity is None:
+            quantity = StockCalculationService.get_current_stock_level(obj)
+        return quantity
         
     def to_representation(self, instance):
         """Add a low_stock warning if quantity is below threshold"""
@@ -1,7 +1,20 @@
-from django.db.models import Sum, F, Q, Case, When, Value, IntegerField
-from django.db import connection, transaction
+import base64
+import binascii
+import heapq
+import json
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Sum, F, Q, Case, When, Value, IntegerField, DecimalField, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce, TruncDate
+from django.db import DatabaseError, IntegrityError, connection, transaction
 from django.utils import timezone
-from .models import StockItem, StockLog
+from .models import StockItem, StockLog, StockBalance, StockCheckpoint, PackageComponent, StockItemComponent
 from sales.models import Sales
 from refills.models import Refills
 
@@ -14,125 +27,612 @@ class StockCalculationService:
     
     @staticmethod
     def get_current_stock_level(stock_item):
-        """Calculate current stock level for a specific StockItem"""
-        quantity = StockLog.objects.filter(stock_item=stock_item).aggregate(
-            total=Sum('quantity_change')
-        )['total'] or 0
+        """
+        Get the current stock level for a specific StockItem from its StockBalance row.
+        Uses a balance loaded with select_related('balance') when there is one, and
+        falls back to summing the log for items that have no balance row yet.
+        """
+        quantity = None
+        if StockItem.balance.is_cached(stock_item):
+            balance = getattr(stock_item, 'balance', None)
+            if balance is not None:
+                quantity = balance.quantity
+        else:
+            quantity = StockBalance.objects.filter(stock_item_id=stock_item.pk).values_list(
+                'quantity', flat=True
+            ).first()
+
+        if quantity is None:
+            quantity = StockCalculationService.sum_stock_logs(stock_item.pk)
         return quantity
-    
+
+    @staticmethod
+    def annotate_current_quantity(queryset):
+        """
+        Annotate a StockItem queryset with `current_quantity` in the same query:
+        the StockBalance quantity, or the sum of the log for items that have no
+        balance row yet.
+        """
+        log_total = StockLog.objects.filter(stock_item=OuterRef('pk')).order_by().values(
+            'stock_item'
+        ).annotate(total=Sum('quantity_change')).values('total')
+        return queryset.annotate(
+            current_quantity=Coalesce(
+                F('balance__quantity'),
+                Subquery(log_total, output_field=IntegerField()),
+                Value(0)
+            )
+        )
+
+    @staticmethod
+    def sum_stock_logs(stock_item_id):
+        """
+        Calculate a StockItem's level from the StockLog: its latest checkpoint
+        plus every entry after it
+        """
+        return StockCheckpointService.get_balances_before([stock_item_id])[stock_item_id]
+
+    @staticmethod
+    def apply_balance_change(stock_item_id, delta, create_missing=True):
+        """
+        Add `delta` to a StockItem's balance with an F() increment.
+
+        When the item has no balance row yet, one is created from the log (which
+        already includes the change being applied). Deletes pass
+        create_missing=False so removing logs for an item that is itself being
+        deleted never inserts a new row.
+        """
+        if not delta:
+            return
+
+        updated = StockBalance.objects.filter(stock_item_id=stock_item_id).update(
+            quantity=F('quantity') + delta,
+            updated_at=timezone.now()
+        )
+        if updated or not create_missing:
+            return
+
+        quantity = StockCalculationService.sum_stock_logs(stock_item_id)
+        try:
+            with transaction.atomic():
+                StockBalance.objects.create(stock_item_id=stock_item_id, quantity=quantity)
+        except IntegrityError:
+            # Another transaction created the row first from the log it could see,
+            # which does not include this uncommitted change
+            StockBalance.objects.filter(stock_item_id=stock_item_id).update(
+                quantity=F('quantity') + delta,
+                updated_at=timezone.now()
+            )
+
     @staticmethod
-    def get_current_stock_by_shop(shop_id):
-        """Get all stock items and their current levels for a specific shop"""
-        items = StockItem.objects.filter(shop_id=shop_id)
+    def get_balance_drift(shop_id=None):
+        """
+        Compare every StockItem's balance with the sum of its log.
+        Returns a list of dictionaries for items whose balance is wrong or missing.
+        """
+        items = StockItem.objects.select_related('shop', 'balance').annotate(
+            log_total=Sum('stock_logs__quantity_change')
+        )
+        if shop_id:
+            items = items.filter(shop_id=shop_id)
+
+        drift = []
+        for item in items:
+            expected = item.log_total or 0
+            balance = getattr(item, 'balance', None)
+            actual = balance.quantity if balance is not None else None
+            if actual != expected:
+                drift.append({
+                    'stock_item': item,
+                    'balance': actual,
+                    'log_total': expected,
+                })
+        return drift
+
+    @staticmethod
+    @transaction.atomic
+    def repair_balances(stock_item_ids):
+        """
+        Reset balances to the sum of the log for the given items.
+        Existing balance rows are locked before the log is summed, so a StockLog
+        written concurrently is either counted here or applied afterwards by its
+        own increment, never both or neither.
+        """
+        stock_item_ids = list(stock_item_ids)
+        locked = set(
+            StockBalance.objects.select_for_update().filter(
+                stock_item_id__in=stock_item_ids
+            ).values_list('stock_item_id', flat=True)
+        )
+        totals = dict(
+            StockLog.objects.filter(stock_item_id__in=stock_item_ids).order_by().values(
+                'stock_item_id'
+            ).annotate(total=Sum('quantity_change')).values_list('stock_item_id', 'total')
+        )
+
+        now = timezone.now()
+        missing = []
+        for stock_item_id in stock_item_ids:
+            quantity = totals.get(stock_item_id) or 0
+            if stock_item_id in locked:
+                StockBalance.objects.filter(stock_item_id=stock_item_id).update(quantity=quantity, updated_at=now)
+            else:
+                missing.append(StockBalance(stock_item_id=stock_item_id, quantity=quantity))
+        StockBalance.objects.bulk_create(missing, batch_size=1000)
+        return len(stock_item_ids)
+
+    @staticmethod
+    def get_current_stock_by_shop(shop_id, as_of=None):
+        """
+        Get all stock items and their levels for a specific shop: current levels,
+        or the levels from the logs dated before `as_of` when it is given
+        """
+        if as_of is None:
+            items = StockCalculationService.annotate_current_quantity(StockItem.objects.filter(shop_id=shop_id))
+        else:
+            items = list(StockItem.objects.filter(shop_id=shop_id))
+            levels = StockCheckpointService.get_balances_before([item.id for item in items], as_of)
+            for item in items:
+                item.current_quantity = levels[item.id]
         result = []
         
         for item in items:
-            quantity = StockCalculationService.get_current_stock_level(item)
             result.append({
                 'id': item.id,
                 'item_name': item.item_name,
                 'item_type': item.item_type,
                 'unit': item.unit,
-                'current_quantity': quantity
+                'current_quantity': item.current_quantity
             })
         
         return result
     
     @staticmethod
-    def calculate_stock_impact_from_sales(start_date=None, end_date=None, shop_id=None):
+    def filter_event_window(queryset, field, start_date=None, end_date=None, shop_id=None):
         """
-        Calculate how sales have impacted stock levels.
-        Returns a dictionary of stock items and quantities used.
+        Restrict a Sales/Refills queryset to a date window. Plain dates cover whole
+        local days (the end date is inclusive), so the bounds stay index-friendly.
         """
-        # Start with an empty query
-        sales_query = Sales.objects.all()
-        
-        # Apply filters if provided
         if start_date:
-            sales_query = sales_query.filter(sold_at__gte=start_date)
+            if not isinstance(start_date, datetime):
+                start_date = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+            queryset = queryset.filter(**{f'{field}__gte': start_date})
         if end_date:
-            sales_query = sales_query.filter(sold_at__lte=end_date)
+            if isinstance(end_date, datetime):
+                queryset = queryset.filter(**{f'{field}__lte': end_date})
+            else:
+                next_day = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+                queryset = queryset.filter(**{f'{field}__lt': next_day})
         if shop_id:
-            sales_query = sales_query.filter(shop_id=shop_id)
-            
-        # Group results by package and get total quantities
-        # This will need a raw query since the logic to map from package to stock item is complex
+            queryset = queryset.filter(shop_id=shop_id)
+        return queryset
+
+    @staticmethod
+    def calculate_event_impact(queryset):
+        """
+        Stock impact of a Sales or Refills queryset, computed with two grouped queries:
+        - units of each stock item used, via the packages' bill of materials
+        - litres of water dispensed, per package size
+        Returns {"<item_name>: <item_type>": change} with negative changes for usage.
+        Row counts depend on the number of stock items and package sizes, not on the
+        number of transactions.
+        """
+        queryset = queryset.order_by()
         impact = {}
-        
-        # Process each sale and determine stock impact
-        for sale in sales_query:
-            package_name = sale.package.package_name
-            quantity = sale.quantity
-            
-            # Get bottle info from package name (e.g., "20L Bottle", "12x1L Pack")
-            # For bottle sales (e.g., "20L Bottle")
-            if "x" not in package_name.lower() and "bottle" in package_name.lower():
-                bottle_type = package_name.replace("Bottle", "").strip()
-                
-                # Add to impact dictionary
-                key = f"Bottle: {bottle_type}"
-                impact[key] = impact.get(key, 0) - quantity  # Negative for reduction
-                
-            # For shrink-wrapped bundles (e.g., "12x1L Pack", "24x500ml Pack")
-            elif "x" in package_name.lower() and ("pack" in package_name.lower() or "bundle" in package_name.lower()):
-                # Extract the format like "12x1L"
-                format_part = package_name.split()[0]  # e.g., "12x1L"
-                # Add to impact dictionary
-                key = f"Shrink Wrap: {format_part}"
-                impact[key] = impact.get(key, 0) - quantity  # Negative for reduction
-                
+
+        components = queryset.filter(package__components__isnull=False).values(
+            'package__components__stock_item__item_name',
+            'package__components__stock_item__item_type',
+        ).annotate(
+            units=Sum(F('quantity') * F('package__components__quantity'))
+        )
+        for row in components:
+            key = f"{row['package__components__stock_item__item_name']}: {row['package__components__stock_item__item_type']}"
+            impact[key] = impact.get(key, 0) - (row['units'] or 0)  # Negative for reduction
+
+        water = queryset.values('package__water_amount_label').annotate(
+            litres=Sum(
+                F('quantity') * F('package__water_amount_label'),
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )
+        ).order_by('package__water_amount_label')
+        for row in water:
+            litres = StockCalculationService.format_litres(row['package__water_amount_label'])
+            impact[f"Water: {litres}L"] = -(row['litres'] or 0)  # Negative for usage
+
         return impact
+
+    @staticmethod
+    def calculate_stock_impact_from_sales(start_date=None, end_date=None, shop_id=None):
+        """
+        Calculate how sales have impacted stock levels.
+        Returns a dictionary of stock items and quantities used.
+        """
+        sales_query = StockCalculationService.filter_event_window(
+            Sales.objects.all(), 'sold_at', start_date, end_date, shop_id
+        )
+        return StockCalculationService.calculate_event_impact(sales_query)
     
     @staticmethod
     def calculate_stock_impact_from_refills(start_date=None, end_date=None, shop_id=None):
         """
-        Calculate how refills have impacted stock levels.
+        Calculate how refills have impacted stock levels (caps, labels and water used).
         Returns a dictionary of stock items and quantities used.
         """
-        # Similar to sales, but for refills
-        refills_query = Refills.objects.all()
-        
-        # Apply filters if provided
-        if start_date:
-            refills_query = refills_query.filter(created_at__gte=start_date)
-        if end_date:
-            refills_query = refills_query.filter(created_at__lte=end_date)
-        if shop_id:
-            refills_query = refills_query.filter(shop_id=shop_id)
-        
-        # Process refills to determine stock impact
-        impact = {}
-        
-        for refill in refills_query:
-            # Since refills use water, they don't directly reduce physical inventory
-            # But they can be tracked for reporting purposes
-            package_name = refill.package.package_name
-            water_amount = refill.package.water_amount
-            quantity = refill.quantity
-            
-            # Track water usage
-            key = f"Water: {water_amount}L"
-            impact[key] = impact.get(key, 0) - (water_amount * quantity)  # Negative for usage
-            
-        return impact
+        refills_query = StockCalculationService.filter_event_window(
+            Refills.objects.all(), 'created_at', start_date, end_date, shop_id
+        )
+        return StockCalculationService.calculate_event_impact(refills_query)
     
+    # Note prefixes written by deduct_stock_for_sale / deduct_caps_and_labels_for_refill
+    AUTO_DEDUCTION_NOTES = ('Auto-deducted for Sale', 'Auto-deducted for Refill')
+
+    # Rows fetched per round trip from each server-side cursor
+    RECONCILIATION_CHUNK_SIZE = 2000
+
     @staticmethod
-    def reconcile_stocklogs_with_events():
+    def stream_expected_deductions(queryset, date_field):
         """
-        Compare explicit StockLog entries with calculated impacts from sales and refills.
-        Useful for auditing and finding discrepancies.
+        Deductions implied by a Sales or Refills queryset through the package bill of
+        materials, as (shop_id, stock_item_id, day, quantity) ordered by that key.
         """
-        # This would compare the sum of StockLog entries with the calculated 
-        # impact from sales and refills to identify any discrepancies
-        # Implementation depends on specific business requirements
-        pass
+        rows = queryset.filter(package__components__isnull=False).annotate(
+            day=TruncDate(date_field)
+        ).values(
+            'shop_id', 'package__components__stock_item_id', 'day'
+        ).annotate(
+            units=Sum(F('quantity') * F('package__components__quantity'))
+        ).order_by('shop_id', 'package__components__stock_item_id', 'day')
+
+        for row in rows.iterator(chunk_size=StockCalculationService.RECONCILIATION_CHUNK_SIZE):
+            yield (row['shop_id'], row['package__components__stock_item_id'], row['day']), row['units'] or 0
+
+    @staticmethod
+    def stream_logged_deductions(queryset):
+        """Automatic sale/refill deductions in a StockLog queryset, keyed like stream_expected_deductions"""
+        notes = Q()
+        for prefix in StockCalculationService.AUTO_DEDUCTION_NOTES:
+            notes |= Q(notes__startswith=prefix)
+
+        rows = queryset.filter(notes).annotate(
+            day=TruncDate('log_date')
+        ).values(
+            'shop_id', 'stock_item_id', 'day'
+        ).annotate(
+            units=Sum('quantity_change')
+        ).order_by('shop_id', 'stock_item_id', 'day')
+
+        for row in rows.iterator(chunk_size=StockCalculationService.RECONCILIATION_CHUNK_SIZE):
+            yield (row['shop_id'], row['stock_item_id'], row['day']), -(row['units'] or 0)
+
+    @staticmethod
+    def reconcile_stocklogs_with_events(start_date=None, end_date=None, shop_id=None):
+        """
+        Compare the automatic deduction StockLog entries with the deductions implied
+        by the Sales and Refills in the same window, per stock item and local day.
+
+        The three grouped queries are read through server-side cursors (iterator())
+        in (shop, stock_item, day) order and merge-joined, so memory stays bounded
+        by the number of stock items however long the window is. Yields a
+        'discrepancy' dict for every (item, day) where the two sides differ and a
+        final 'summary' dict with per-item totals for items that don't balance.
+
+        Deductions are logged when a transaction reaches the server, so offline
+        sales synced on a later day show up as a pair of opposite daily
+        discrepancies that cancel out in the summary.
+        """
+        sales = StockCalculationService.filter_event_window(
+            Sales.objects.all(), 'sold_at', start_date, end_date, shop_id
+        )
+        refills = StockCalculationService.filter_event_window(
+            Refills.objects.all(), 'created_at', start_date, end_date, shop_id
+        )
+        logs = StockCalculationService.filter_event_window(
+            StockLog.objects.all(), 'log_date', start_date, end_date, shop_id
+        )
+
+        items = StockItem.objects.all()
+        if shop_id:
+            items = items.filter(shop_id=shop_id)
+        names = {
+            item_id: f"{item_name}: {item_type}"
+            for item_id, item_name, item_type in items.values_list('id', 'item_name', 'item_type')
+        }
+
+        # Tag each row with its side so the merged stream can be split again per key
+        streams = [
+            ((key, 'expected', units) for key, units in StockCalculationService.stream_expected_deductions(sales, 'sold_at')),
+            ((key, 'expected', units) for key, units in StockCalculationService.stream_expected_deductions(refills, 'created_at')),
+            ((key, 'logged', units) for key, units in StockCalculationService.stream_logged_deductions(logs)),
+        ]
+
+        totals = {}
+        days_compared = 0
+        discrepancies = 0
+        for key, rows in groupby(heapq.merge(*streams, key=itemgetter(0)), key=itemgetter(0)):
+            sides = {'expected': 0, 'logged': 0}
+            for _, side, units in rows:
+                sides[side] += units
+            shop, stock_item_id, day = key
+            days_compared += 1
+
+            item_totals = totals.setdefault(stock_item_id, {'shop_id': shop, 'expected': 0, 'logged': 0})
+            item_totals['expected'] += sides['expected']
+            item_totals['logged'] += sides['logged']
+
+            if sides['expected'] != sides['logged']:
+                discrepancies += 1
+                yield {
+                    'type': 'discrepancy',
+                    'shop_id': shop,
+                    'stock_item_id': stock_item_id,
+                    'item': names.get(stock_item_id, str(stock_item_id)),
+                    'date': day.isoformat(),
+                    'expected': sides['expected'],
+                    'logged': sides['logged'],
+                    'difference': sides['logged'] - sides['expected'],
+                }
+
+        yield {
+            'type': 'summary',
+            'days_compared': days_compared,
+            'discrepancies': discrepancies,
+            'items': [
+                {
+                    'shop_id': item['shop_id'],
+                    'stock_item_id': stock_item_id,
+                    'item': names.get(stock_item_id, str(stock_item_id)),
+                    'expected': item['expected'],
+                    'logged': item['logged'],
+                    'difference': item['logged'] - item['expected'],
+                }
+                for stock_item_id, item in sorted(totals.items())
+                if item['expected'] != item['logged']
+            ],
+        }
     
+    @staticmethod
+    def format_litres(water_amount):
+        """Format a water amount the way stock item types spell it (Decimal('20.0') -> '20', 0.5 -> '0.5')"""
+        return f"{Decimal(str(water_amount)).normalize():f}"
+
+    @staticmethod
+    def lock_stock_levels(stock_item_ids):
+        """
+        Lock the StockBalance rows of the given items with SELECT ... FOR UPDATE
+        and return their quantities keyed by id. Must run inside a transaction.
+
+        Only these rows are locked, so writes to other items of the shop carry on.
+        Rows are locked in stock_item_id order; every caller locking several items
+        this way acquires them in the same order and can't deadlock with another.
+        Items without a balance row get one from the log before locking.
+        """
+        stock_item_ids = sorted(set(stock_item_ids))
+        existing = set(
+            StockBalance.objects.filter(stock_item_id__in=stock_item_ids).values_list('stock_item_id', flat=True)
+        )
+        missing = [item_id for item_id in stock_item_ids if item_id not in existing]
+        if missing:
+            StockBalance.objects.bulk_create(
+                [
+                    StockBalance(stock_item_id=item_id, quantity=StockCalculationService.sum_stock_logs(item_id))
+                    for item_id in missing
+                ],
+                ignore_conflicts=True
+            )
+
+        return dict(
+            StockBalance.objects.select_for_update().filter(
+                stock_item_id__in=stock_item_ids
+            ).order_by('stock_item_id').values_list('stock_item_id', 'quantity')
+        )
+
+    @staticmethod
+    def apply_balance_changes(changes):
+        """
+        Apply {stock_item_id: delta} to several balances in one UPDATE. Used after
+        StockLog.objects.bulk_create, which does not send the signals that normally
+        keep balances in step. Items without a balance row fall back to
+        apply_balance_change, which creates the row from the log.
+        """
+        changes = {stock_item_id: delta for stock_item_id, delta in changes.items() if delta}
+        if not changes:
+            return
+
+        updated = set(
+            StockBalance.objects.filter(stock_item_id__in=changes.keys()).values_list('stock_item_id', flat=True)
+        )
+        if updated:
+            StockBalance.objects.filter(stock_item_id__in=updated).update(
+                quantity=F('quantity') + Case(
+                    *[When(stock_item_id=stock_item_id, then=Value(changes[stock_item_id])) for stock_item_id in updated],
+                    default=Value(0),
+                    output_field=IntegerField()
+                ),
+                updated_at=timezone.now()
+            )
+        for stock_item_id in changes.keys() - updated:
+            StockCalculationService.apply_balance_change(stock_item_id, changes[stock_item_id])
+
+    @staticmethod
+    def write_deductions(shop_id, deductions, notes, director_name):
+        """
+        Record automatic deductions with a single bulk insert.
+
+        `deductions` is a list of (stock_item_id, quantity) tuples, usually taken
+        from StockItemResolver. If a cached stock item turns out to have been
+        deleted, the shop is reloaded and the insert retried once without the
+        deleted items, the way untracked items are skipped. Returns the created
+        StockLog entries; raises ValueError if the retry fails too.
+        """
+        deductions = [(stock_item_id, quantity) for stock_item_id, quantity in deductions if quantity]
+        for attempt in range(2):
+            log_date = timezone.now()
+            logs = [
+                StockLog(
+                    stock_item_id=stock_item_id,
+                    quantity_change=-quantity,  # Negative for deduction
+                    notes=notes,
+                    shop_id=shop_id,
+                    director_name=director_name,
+                    log_date=log_date
+                )
+                for stock_item_id, quantity in deductions
+            ]
+            if not logs:
+                return []
+
+            try:
+                with transaction.atomic():
+                    StockLog.objects.bulk_create(logs)
+                    changes = {}
+                    for log in logs:
+                        changes[log.stock_item_id] = changes.get(log.stock_item_id, 0) + log.quantity_change
+                    StockCalculationService.apply_balance_changes(changes)
+                    # Foreign keys are checked at commit by default (DEFERRABLE INITIALLY
+                    # DEFERRED); check them now so a stale cached id fails inside this
+                    # savepoint instead of when the caller's transaction commits
+                    connection.check_constraints(table_names=[StockLog._meta.db_table, StockBalance._meta.db_table])
+                return logs
+            except IntegrityError as e:
+                # A cached stock item was deleted by another process; the savepoint
+                # was rolled back, so reload the shop and retry once
+                StockItemResolver.invalidate(shop_id)
+                if attempt:
+                    raise ValueError(f"A stock item used by this deduction no longer exists: {e}")
+                existing = set(
+                    StockItem.objects.filter(
+                        pk__in=[stock_item_id for stock_item_id, _ in deductions]
+                    ).values_list('pk', flat=True)
+                )
+                deductions = [deduction for deduction in deductions if deduction[0] in existing]
+
+    @staticmethod
+    def deduct_package_components(transaction_record, agent_name, notes):
+        """
+        Deduct the bill of materials of a refill's or sale's package, multiplied by
+        the number of units, using the shop's cached PackageComponent rows.
+        """
+        components = StockItemResolver.get_package_components(
+            transaction_record.shop_id, transaction_record.package_id
+        )
+        deductions = [
+            (stock_item_id, per_unit * transaction_record.quantity)
+            for stock_item_id, per_unit in components
+        ]
+        return StockCalculationService.write_deductions(
+            transaction_record.shop_id, deductions, notes, agent_name
+        )
+
+    @staticmethod
+    def get_default_package_components(package, item_ids):
+        """
+        Default bill of materials for a package, as {stock_item_id: quantity per unit}:
+        - Refills use a 10/20L cap (10L and 20L) and a label (5L, 10L and 20L)
+        - Bottle sales use the matching bottle, plus a label for 5L, 10L and 20L
+        - Bundle sales use the water bundle named in the package description
+        `item_ids` is the shop's {(item_name, item_type): stock_item_id} map;
+        items the shop doesn't track are left out.
+        """
+        amount = package.water_amount_label
+        litres = StockCalculationService.format_litres(amount)
+        wanted = []
+
+        if package.sale_type == 'REFILL':
+            if amount in [10, 20]:
+                wanted.append(('Cap', '10/20L'))
+            if amount in [5, 10, 20]:
+                wanted.append(('Label', f"{litres}L"))
+        elif package.sale_type == 'SALE' and package.bottle_type == 'BUNDLE':
+            description = (package.description or '').lower()
+            if '12x1' in description:
+                wanted.append(('Water Bundle', '12x1L'))
+            elif '24x0.5' in description or '24x500' in description:
+                wanted.append(('Water Bundle', '24x0.5L'))
+            elif '8x1.5' in description:
+                wanted.append(('Water Bundle', '8x1.5L'))
+        elif package.sale_type == 'SALE':
+            if package.bottle_type == 'HARD' and amount == 20:
+                wanted.append(('Bottle', '20L Hard'))
+            else:
+                wanted.append(('Bottle', f"{litres}L"))
+            if amount in [5, 10, 20]:
+                wanted.append(('Label', f"{litres}L"))
+
+        return {item_ids[key]: 1 for key in wanted if key in item_ids}
+
+    # Default recipes for assembling water bundles: bundle type -> components per bundle
+    BUNDLE_RECIPES = {
+        '12x1L': [('Bottle', '1L', 12), ('Shrink Wrap', '12x1L', 1)],
+        '24x0.5L': [('Bottle', '0.5L', 24), ('Shrink Wrap', '24x0.5L', 1)],
+        '8x1.5L': [('Bottle', '1.5L', 8), ('Shrink Wrap', '8x1.5L', 1)],
+    }
+
+    @staticmethod
+    def sync_default_components(shop_id=None, package_id=None, stock_item_ids=None):
+        """
+        Add the default bill-of-materials rows involving a newly created package or
+        newly created stock items, for one shop or (shop_id=None) every shop.
+        Existing rows are never changed, so components edited in the admin are
+        kept. Runs a fixed number of queries however many shops are covered.
+        """
+        from packages.models import Packages
+
+        items = StockItem.objects.all()
+        packages = Packages.objects.all()
+        if shop_id:
+            items = items.filter(shop_id=shop_id)
+            packages = packages.filter(shop_id=shop_id)
+        if package_id:
+            packages = packages.filter(id=package_id)
+        if stock_item_ids is not None:
+            stock_item_ids = set(stock_item_ids)
+
+        # {shop_id: {(item_name, item_type): stock_item_id}}
+        shop_items = {}
+        for item_id, item_shop_id, item_name, item_type in items.values_list('id', 'shop_id', 'item_name', 'item_type'):
+            shop_items.setdefault(item_shop_id, {})[(item_name, item_type)] = item_id
+
+        package_components = [
+            PackageComponent(package_id=package.id, stock_item_id=item_id, quantity=quantity)
+            for package in packages
+            for item_id, quantity in StockCalculationService.get_default_package_components(
+                package, shop_items.get(package.shop_id, {})
+            ).items()
+            if stock_item_ids is None or item_id in stock_item_ids
+        ]
+
+        item_components = []
+        if package_id is None:
+            for item_ids in shop_items.values():
+                for (item_name, item_type), assembly_id in item_ids.items():
+                    if item_name != 'Water Bundle':
+                        continue
+                    for component_name, component_type, quantity in StockCalculationService.BUNDLE_RECIPES.get(item_type, []):
+                        component_id = item_ids.get((component_name, component_type))
+                        if not component_id:
+                            continue
+                        if stock_item_ids is None or {assembly_id, component_id} & stock_item_ids:
+                            item_components.append(StockItemComponent(
+                                assembly_id=assembly_id, component_id=component_id, quantity=quantity
+                            ))
+
+        PackageComponent.objects.bulk_create(package_components, batch_size=1000, ignore_conflicts=True)
+        StockItemComponent.objects.bulk_create(item_components, batch_size=1000, ignore_conflicts=True)
+        StockItemResolver.invalidate(shop_id)
+
     @staticmethod
     @transaction.atomic
     def process_water_bundle_creation(stock_log):
         """
-        Process water bundle creation by deducting corresponding bottles and shrink wraps.
+        Process water bundle creation by deducting the bundle's components (bottles
+        and shrink wrap, from its StockItemComponent recipe).
         This method is called when a positive stock log entry is created for a water bundle.
+
+        The components' balance rows stay locked (in stock_item_id order) from the
+        stock check until the caller's transaction commits, so concurrent bundle
+        creations can't both pass the check for the same bottles. Callers must
+        roll back the bundle's own log when this raises.
         
         Returns a list of created stock log entries for the deducted items.
         """
@@ -140,82 +640,39 @@ class StockCalculationService:
         if stock_log.stock_item.item_name != 'Water Bundle' or stock_log.quantity_change <= 0:
             return []
             
-        created_logs = []
-        shop = stock_log.shop
+        shop_id = stock_log.shop_id
         bundle_type = stock_log.stock_item.item_type
         bundle_quantity = stock_log.quantity_change
         director_name = stock_log.director_name
         notes = f"Auto-deducted for Water Bundle creation: {bundle_type} x{bundle_quantity}"
         
-        # Parse the water bundle format to determine number of bottles and size
-        if bundle_type == '12x1L':
-            bottle_quantity = 12 * bundle_quantity
-            bottle_type = '1L'
-            shrink_wrap_type = '12x1L'
-        elif bundle_type == '24x0.5L':
-            bottle_quantity = 24 * bundle_quantity
-            bottle_type = '0.5L'
-            shrink_wrap_type = '24x0.5L'
-        elif bundle_type == '8x1.5L':
-            bottle_quantity = 8 * bundle_quantity
-            bottle_type = '1.5L'
-            shrink_wrap_type = '8x1.5L'
-        else:
-            # Unknown bundle type
+        # Look up the bundle's recipe
+        components = StockItemResolver.get_assembly_components(shop_id, stock_log.stock_item_id)
+        if not components:
+            # No recipe for this bundle type
             return []
             
         try:
-            # Find the corresponding bottle stock item
-            bottle_stock_item = StockItem.objects.get(
-                shop=shop,
-                item_name='Bottle',
-                item_type=bottle_type
-            )
-            
-            # Find the corresponding shrink wrap stock item
-            shrink_wrap_stock_item = StockItem.objects.get(
-                shop=shop,
-                item_name='Shrink Wrap',
-                item_type=shrink_wrap_type
-            )
-            
-            # Check if there's enough stock to deduct
-            bottle_stock = StockCalculationService.get_current_stock_level(bottle_stock_item)
-            shrink_wrap_stock = StockCalculationService.get_current_stock_level(shrink_wrap_stock_item)
-            
-            if bottle_stock < bottle_quantity:
-                raise ValueError(f"Not enough {bottle_type} bottles in stock. Required: {bottle_quantity}, Available: {bottle_stock}")
-                
-            if shrink_wrap_stock < bundle_quantity:
-                raise ValueError(f"Not enough {shrink_wrap_type} shrink wraps in stock. Required: {bundle_quantity}, Available: {shrink_wrap_stock}")
-            
-            # Create deduction for bottles
-            bottle_log = StockLog.objects.create(
-                stock_item=bottle_stock_item,
-                quantity_change=-bottle_quantity,  # Negative for deduction
-                notes=notes,
-                shop=shop,
-                director_name=director_name,
-                log_date=timezone.now()
-            )
-            created_logs.append(bottle_log)
+            # Check if there's enough stock to deduct, holding the components' rows
+            required = {item_id: per_bundle * bundle_quantity for item_id, per_bundle in components}
+            levels = StockCalculationService.lock_stock_levels(required.keys())
+            for item_id, quantity in required.items():
+                available = levels.get(item_id, 0)
+                if available < quantity:
+                    item_name, item_type = StockItemResolver.get_item_key(shop_id, item_id)
+                    raise ValueError(
+                        f"Not enough {item_type} {item_name.lower()}s in stock. Required: {quantity}, Available: {available}"
+                    )
             
-            # Create deduction for shrink wrap
-            shrink_wrap_log = StockLog.objects.create(
-                stock_item=shrink_wrap_stock_item,
-                quantity_change=-bundle_quantity,  # Negative for deduction
-                notes=notes,
-                shop=shop,
-                director_name=director_name,
-                log_date=timezone.now()
+            # Create deductions for bottles and shrink wrap
+            return StockCalculationService.write_deductions(
+                shop_id, list(required.items()), notes, director_name
             )
-            created_logs.append(shrink_wrap_log)
-            
-            return created_logs
             
-        except StockItem.DoesNotExist as e:
-            # Required stock items don't exist
-            raise ValueError(f"Cannot process water bundle: {str(e)}")
+        except (ValueError, DatabaseError):
+            # Database errors (deadlocks, lock timeouts) abort the transaction and
+            # must reach the caller as they are, not as a stock shortage
+            raise
         except Exception as e:
             # Other errors
             raise ValueError(f"Error processing water bundle: {str(e)}")
@@ -224,79 +681,16 @@ class StockCalculationService:
     @transaction.atomic
     def deduct_caps_and_labels_for_refill(refill, agent_name):
         """
-        Deduct caps and labels from inventory when a refill is recorded.
-        - Deducts caps of type '10/20L' for 10L and 20L refills
-        - Deducts labels matching the refill's water amount (5L, 10L, or 20L)
-        - Allows negative stock values if physical stock is present but not recorded
+        Deduct caps and labels from inventory when a refill is recorded, using the
+        refill package's bill of materials (by default a 10/20L cap for 10L and 20L
+        refills and a matching label for 5L, 10L and 20L refills).
+        Allows negative stock values if physical stock is present but not recorded.
         
         Returns a list of created stock log entries for the deducted items.
         """
-        created_logs = []
-        shop = refill.shop
-        package = refill.package
-        quantity = refill.quantity
-        notes = f"Auto-deducted for Refill: {package.water_amount_label}L x{quantity}"
-        
-        # Only process refills with water amount labels that match our caps/labels
-        water_amount = package.water_amount_label
-        
+        notes = f"Auto-deducted for Refill: {refill.package.water_amount_label}L x{refill.quantity}"
         try:
-            # Deduct caps for 10L and 20L refills
-            if water_amount in [10, 20]:
-                try:
-                    # Find the corresponding cap stock item
-                    cap_stock_item = StockItem.objects.get(
-                        shop=shop,
-                        item_name='Cap',
-                        item_type='10/20L'
-                    )
-                    
-                    # Create deduction for caps - no validation check for available stock
-                    cap_log = StockLog.objects.create(
-                        stock_item=cap_stock_item,
-                        quantity_change=-quantity,  # Negative for deduction
-                        notes=notes,
-                        shop=shop,
-                        director_name=agent_name,
-                        log_date=timezone.now()
-                    )
-                    created_logs.append(cap_log)
-                    
-                except StockItem.DoesNotExist:
-                    # Log or handle if caps aren't tracked for this shop
-                    pass
-            
-            # Deduct labels matching the water amount (5L, 10L, 20L)
-            # Convert integer water_amount to string format for matching with label types
-            label_type = f"{water_amount}L"
-            
-            # Only deduct labels if water amount is a standard size (5L, 10L, 20L)
-            if water_amount in [5, 10, 20]:
-                try:
-                    # Find the corresponding label stock item
-                    label_stock_item = StockItem.objects.get(
-                        shop=shop,
-                        item_name='Label',
-                        item_type=label_type
-                    )
-                    
-                    # Create deduction for labels - no validation check for available stock
-                    label_log = StockLog.objects.create(
-                        stock_item=label_stock_item,
-                        quantity_change=-quantity,  # Negative for deduction
-                        notes=notes,
-                        shop=shop,
-                        director_name=agent_name,
-                        log_date=timezone.now()
-                    )
-                    created_logs.append(label_log)
-                    
-                except StockItem.DoesNotExist:
-                    # Log or handle if labels aren't tracked for this shop
-                    pass
-            
-            return created_logs
-            
+            return StockCalculationService.deduct_package_components(refill, agent_name, notes)
         except Exception as e:
             # Handle any other errors
             raise ValueError(f"Error processing refill inventory deduction: {str(e)}")
@@ -305,120 +699,462 @@ class StockCalculationService:
     @transaction.atomic
     def deduct_stock_for_sale(sale, agent_name):
         """
-        Deduct appropriate stock items when a sale is recorded.
-        - For bottle sales: deducts the corresponding bottle type and label
-        - For water bundles: deducts the corresponding bundle
-        
-        Affected items:
-        - Labels (5L, 10L, 20L)
-        - Bottles (0.5L, 1L, 1.5L, 2L, 5L, 10L, 20L, 20L Hard)
-        - Water bundles (12x1L, 24x0.5L, 8x1.5L)
+        Deduct appropriate stock items when a sale is recorded, using the sale
+        package's bill of materials. By default:
+        - For bottle sales: the corresponding bottle type and label
+        - For water bundles: the corresponding bundle
         
         Returns a list of created stock log entries for the deducted items.
         """
-        created_logs = []
-        shop = sale.shop
-        package = sale.package
-        quantity = sale.quantity
-        notes = f"Auto-deducted for Sale: {package.water_amount_label}L x{quantity}"
-        
+        notes = f"Auto-deducted for Sale: {sale.package.water_amount_label}L x{sale.quantity}"
         try:
-            # Check if it's a bottle sale
-            if package.sale_type == 'SALE' and package.bottle_type not in ['BUNDLE']:
-                # Get water amount and determine bottle type
-                water_amount = package.water_amount_label
-                
-                # Determine the bottle type string based on water amount and bottle_type
-                bottle_item_type = f"{water_amount}L"
-                if package.bottle_type == 'HARD' and water_amount == 20:
-                    bottle_item_type = '20L Hard'
-                
-                try:
-                    # Find the corresponding bottle stock item
-                    bottle_stock_item = StockItem.objects.get(
-                        shop=shop,
-                        item_name='Bottle',
-                        item_type=bottle_item_type
-                    )
-                    
-                    # Create deduction for bottles
-                    bottle_log = StockLog.objects.create(
-                        stock_item=bottle_stock_item,
-                        quantity_change=-quantity,  # Negative for deduction
-                        notes=notes,
-                        shop=shop,
-                        director_name=agent_name,
-                        log_date=timezone.now()
-                    )
-                    created_logs.append(bottle_log)
-                    
-                except StockItem.DoesNotExist:
-                    pass
-                
-                # For standard bottle sizes, also deduct labels
-                if water_amount in [5, 10, 20]:
-                    try:
-                        # Find the corresponding label stock item
-                        label_type = f"{water_amount}L"
-                        label_stock_item = StockItem.objects.get(
-                            shop=shop,
-                            item_name='Label',
-                            item_type=label_type
-                        )
-                        
-                        # Create deduction for labels
-                        label_log = StockLog.objects.create(
-                            stock_item=label_stock_item,
-                            quantity_change=-quantity,  # Negative for deduction
-                            notes=notes,
-                            shop=shop,
-                            director_name=agent_name,
-                            log_date=timezone.now()
-                        )
-                        created_logs.append(label_log)
-                        
-                    except StockItem.DoesNotExist:
-                        pass
-                
-            # Handle water bundle sales
-            elif package.sale_type == 'SALE' and package.bottle_type == 'BUNDLE':
-                # Get description to identify bundle type
-                description = package.description.lower()
-                
-                # Determine the bundle type
-                bundle_type = None
-                if '12x1' in description:
-                    bundle_type = '12x1L'
-                elif '24x0.5' in description or '24x500' in description:
-                    bundle_type = '24x0.5L'
-                elif '8x1.5' in description:
-                    bundle_type = '8x1.5L'
-                
-                if bundle_type:
-                    try:
-                        # Find the corresponding water bundle stock item
-                        bundle_stock_item = StockItem.objects.get(
-                            shop=shop,
-                            item_name='Water Bundle',
-                            item_type=bundle_type
-                        )
-                        
-                        # Create deduction for water bundle
-                        bundle_log = StockLog.objects.create(
-                            stock_item=bundle_stock_item,
-                            quantity_change=-quantity,  # Negative for deduction
-                            notes=notes,
-                            shop=shop,
-                            director_name=agent_name,
-                            log_date=timezone.now()
-                        )
-                        created_logs.append(bundle_log)
-                        
-                    except StockItem.DoesNotExist:
-                        pass
-            
-            return created_logs
-            
+            return StockCalculationService.deduct_package_components(sale, agent_name, notes)
         except Exception as e:
             # Handle any other errors
-            raise ValueError(f"Error processing sale inventory deduction: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"Error processing sale inventory deduction: {str(e)}")
+
+
+class StockItemResolver:
+    """
+    Per-process cache of each shop's stock items and bill of materials, so
+    automatic deductions don't query for them on every write.
+
+    For each shop it holds the (item_name, item_type) -> StockItem id map, every
+    package's PackageComponent rows and every assembled item's StockItemComponent
+    rows, loaded with three queries the first time the shop is needed. Signal
+    handlers drop the shop when any of those rows (or its packages) are saved or
+    deleted in this process; entries also expire after TIMEOUT seconds so changes
+    made by other worker processes are picked up.
+    """
+
+    TIMEOUT = 300
+
+    _shops = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_shop(cls, shop_id):
+        now = time.monotonic()
+        with cls._lock:
+            cached = cls._shops.get(shop_id)
+        if cached is not None and now - cached[0] < cls.TIMEOUT:
+            return cached[1]
+
+        items = {
+            (item_name, item_type): item_id
+            for item_id, item_name, item_type in StockItem.objects.filter(shop_id=shop_id).values_list(
+                'id', 'item_name', 'item_type'
+            )
+        }
+        packages = {}
+        for package_id, stock_item_id, quantity in PackageComponent.objects.filter(
+            package__shop_id=shop_id
+        ).values_list('package_id', 'stock_item_id', 'quantity'):
+            packages.setdefault(package_id, []).append((stock_item_id, quantity))
+        assemblies = {}
+        for assembly_id, component_id, quantity in StockItemComponent.objects.filter(
+            assembly__shop_id=shop_id
+        ).values_list('assembly_id', 'component_id', 'quantity'):
+            assemblies.setdefault(assembly_id, []).append((component_id, quantity))
+
+        shop = {
+            'items': items,
+            'keys': {item_id: key for key, item_id in items.items()},
+            'packages': packages,
+            'assemblies': assemblies,
+        }
+        with cls._lock:
+            cls._shops[shop_id] = (now, shop)
+        return shop
+
+    @classmethod
+    def get_item_ids(cls, shop_id):
+        """Return {(item_name, item_type): stock_item_id} for a shop"""
+        return cls.get_shop(shop_id)['items']
+
+    @classmethod
+    def get_item_key(cls, shop_id, stock_item_id):
+        """Return (item_name, item_type) for one of a shop's stock items"""
+        return cls.get_shop(shop_id)['keys'].get(stock_item_id, ('Item', str(stock_item_id)))
+
+    @classmethod
+    def get_package_components(cls, shop_id, package_id):
+        """Return [(stock_item_id, quantity per unit)] for a package"""
+        return cls.get_shop(shop_id)['packages'].get(package_id, [])
+
+    @classmethod
+    def get_assembly_components(cls, shop_id, stock_item_id):
+        """Return [(component_id, quantity per unit)] for an assembled stock item"""
+        return cls.get_shop(shop_id)['assemblies'].get(stock_item_id, [])
+
+    @classmethod
+    def invalidate(cls, shop_id=None):
+        """Forget a shop's cached rows (or every shop's when shop_id is None)"""
+        with cls._lock:
+            if shop_id is None:
+                cls._shops.clear()
+            else:
+                cls._shops.pop(shop_id, None)
+
+
+class StockCheckpointService:
+    """
+    Month-end StockCheckpoint rows, so balances as of any date only sum the logs
+    written after the nearest checkpoint instead of the item's whole history.
+    """
+
+    @staticmethod
+    def month_start(day):
+        """Local midnight on the 1st of the month containing `day`, as an aware datetime"""
+        return timezone.make_aware(datetime(day.year, day.month, 1))
+
+    @staticmethod
+    def next_month_start(day):
+        """Local midnight on the 1st of the month after `day`"""
+        if day.month == 12:
+            return timezone.make_aware(datetime(day.year + 1, 1, 1))
+        return timezone.make_aware(datetime(day.year, day.month + 1, 1))
+
+    @staticmethod
+    def get_latest_checkpoints(stock_item_ids, as_of=None):
+        """
+        Return {stock_item_id: (period_end, quantity)} for each item's most recent
+        checkpoint ending at or before `as_of` (or the most recent one at all).
+        """
+        checkpoints = StockCheckpoint.objects.filter(stock_item=OuterRef('pk'))
+        if as_of is not None:
+            checkpoints = checkpoints.filter(period_end__lte=as_of)
+        checkpoints = checkpoints.order_by('-period_end')
+
+        rows = StockItem.objects.filter(id__in=stock_item_ids).annotate(
+            checkpoint_end=Subquery(checkpoints.values('period_end')[:1]),
+            checkpoint_quantity=Subquery(checkpoints.values('quantity')[:1]),
+        ).filter(checkpoint_end__isnull=False).values_list('id', 'checkpoint_end', 'checkpoint_quantity')
+        return {item_id: (period_end, quantity) for item_id, period_end, quantity in rows}
+
+    @staticmethod
+    def get_balances_before(stock_item_ids, as_of=None, before=None):
+        """
+        Return {stock_item_id: quantity} summing each item's logs dated before
+        `as_of` (all logs when it is None). `before` can replace the log_date
+        filter with a finer one, such as a (log_date, id) keyset edge, provided
+        it only includes logs dated at or before `as_of`.
+
+        Each item starts from its latest checkpoint ending at or before `as_of`,
+        so only the logs after that checkpoint are summed.
+        """
+        stock_item_ids = list(stock_item_ids)
+        if not stock_item_ids:
+            return {}
+        if before is None:
+            before = Q(log_date__lt=as_of) if as_of is not None else Q()
+
+        checkpoints = StockCheckpointService.get_latest_checkpoints(stock_item_ids, as_of)
+        balances = {item_id: 0 for item_id in stock_item_ids}
+
+        # Items checkpointed at the same month end share one log range; most
+        # items are checkpointed together, so this stays a short OR
+        ranges = Q(stock_item_id__in=[item_id for item_id in stock_item_ids if item_id not in checkpoints])
+        by_period = {}
+        for item_id, (period_end, quantity) in checkpoints.items():
+            balances[item_id] = quantity
+            by_period.setdefault(period_end, []).append(item_id)
+        for period_end, item_ids in by_period.items():
+            ranges |= Q(stock_item_id__in=item_ids, log_date__gte=period_end)
+
+        totals = StockLog.objects.filter(ranges).filter(before).order_by().values(
+            'stock_item_id'
+        ).annotate(total=Sum('quantity_change')).values_list('stock_item_id', 'total')
+        for item_id, total in totals:
+            balances[item_id] += total or 0
+        return balances
+
+    @staticmethod
+    def create_checkpoints(period_end, shop_id=None):
+        """
+        Write (or overwrite) the checkpoints ending at `period_end` for every stock
+        item, or a shop's items. Each balance is built from the previous checkpoint,
+        so creating months in order only reads one month of logs at a time.
+        Returns the number of checkpoints written.
+        """
+        if period_end > timezone.now():
+            raise ValueError("Checkpoints can only be created for periods that have ended")
+
+        items = StockItem.objects.all()
+        if shop_id:
+            items = items.filter(shop_id=shop_id)
+        item_ids = list(items.values_list('id', flat=True))
+
+        balances = StockCheckpointService.get_balances_before(item_ids, period_end)
+        StockCheckpoint.objects.bulk_create(
+            [
+                StockCheckpoint(stock_item_id=item_id, period_end=period_end, quantity=quantity)
+                for item_id, quantity in balances.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['stock_item', 'period_end'],
+            update_fields=['quantity'],
+        )
+        return len(balances)
+
+    @staticmethod
+    def invalidate(stock_item_id, log_date):
+        """
+        Delete an item's checkpoints that a log dated `log_date` falls before.
+        Logs dated in the current month can't affect any checkpoint, so the
+        common case costs no query.
+        """
+        if log_date is None or log_date >= StockCheckpointService.month_start(timezone.localdate()):
+            return 0
+        deleted, _ = StockCheckpoint.objects.filter(stock_item_id=stock_item_id, period_end__gt=log_date).delete()
+        return deleted
+
+
+class StockReorderService:
+    """
+    Reorder recommendations from each item's recent consumption rather than the
+    static threshold/reorder_point alone.
+
+    Daily usage is the moving average of the item's negative StockLog entries
+    over a rolling window. Days until stockout divide the current level by that
+    rate. An item needs reordering when it is at or below its reorder_point or
+    would run out within the supplier lead time. The suggested quantity tops it
+    up to cover the lead time plus `cover_days` of usage, and at least to the
+    reorder_point, so a flagged item is never suggested 0.
+    """
+
+    DEFAULT_WINDOW_DAYS = 30
+    MAX_WINDOW_DAYS = 365
+    DEFAULT_LEAD_TIME_DAYS = 7
+    DEFAULT_COVER_DAYS = 30
+
+    @staticmethod
+    def annotate_usage(queryset, since):
+        """
+        Annotate a StockItem queryset with `window_usage`, the units taken out
+        since `since`, aggregated in the same grouped query as the items
+        """
+        if 'current_quantity' not in queryset.query.annotations:
+            queryset = StockCalculationService.annotate_current_quantity(queryset)
+        return queryset.annotate(
+            window_usage=Coalesce(
+                Sum(
+                    'stock_logs__quantity_change',
+                    filter=Q(stock_logs__quantity_change__lt=0, stock_logs__log_date__gte=since)
+                ),
+                Value(0)
+            )
+        )
+
+    @staticmethod
+    def plan_item(item, window_days, lead_time_days, cover_days):
+        """Reorder figures for one item annotated by annotate_usage"""
+        current = item.current_quantity
+        daily_usage = -item.window_usage / window_days
+        days_until_stockout = None
+        if daily_usage > 0:
+            days_until_stockout = max(0, current) / daily_usage
+
+        reorder = current <= item.reorder_point or (
+            days_until_stockout is not None and days_until_stockout <= lead_time_days
+        )
+        # Top up to cover the lead time plus cover_days of usage, and never to
+        # less than the reorder_point, so every flagged item gets a quantity
+        target = item.reorder_point
+        if daily_usage > 0:
+            target = max(target, math.ceil(daily_usage * (lead_time_days + cover_days)))
+        suggested = max(1, target - current) if reorder else 0
+
+        return {
+            'id': item.id,
+            'item_name': item.item_name,
+            'item_type': item.item_type,
+            'unit': item.unit,
+            'current_quantity': current,
+            'threshold': item.threshold,
+            'reorder_point': item.reorder_point,
+            'daily_usage': round(daily_usage, 2),
+            'days_until_stockout': round(days_until_stockout, 1) if days_until_stockout is not None else None,
+            'reorder': reorder,
+            'suggested_order_quantity': suggested,
+        }
+
+    @staticmethod
+    def get_plan(queryset, window_days=None, lead_time_days=None, cover_days=None, include_all=False, now=None):
+        """
+        Build the reorder plan for every item in a StockItem queryset in one pass.
+        Returns a list of shops, each with its items ordered by days until stockout
+        (items with no usage last); only items to reorder unless include_all.
+        """
+        window_days = window_days or StockReorderService.DEFAULT_WINDOW_DAYS
+        lead_time_days = StockReorderService.DEFAULT_LEAD_TIME_DAYS if lead_time_days is None else lead_time_days
+        cover_days = StockReorderService.DEFAULT_COVER_DAYS if cover_days is None else cover_days
+        since = (now or timezone.now()) - timedelta(days=window_days)
+
+        items = StockReorderService.annotate_usage(queryset.select_related('shop'), since)
+
+        shops = {}
+        for item in items:
+            plan = StockReorderService.plan_item(item, window_days, lead_time_days, cover_days)
+            if not (include_all or plan['reorder']):
+                continue
+            shop = shops.setdefault(item.shop_id, {
+                'shop_id': item.shop_id,
+                'shop_name': item.shop.shopName,
+                'items': [],
+            })
+            shop['items'].append(plan)
+
+        for shop in shops.values():
+            shop['items'].sort(key=lambda plan: (
+                plan['days_until_stockout'] is None,
+                plan['days_until_stockout'] or 0,
+                plan['item_name'],
+                plan['item_type'],
+            ))
+        return sorted(shops.values(), key=lambda shop: shop['shop_name'])
+
+
+class StockLedgerService:
+    """
+    Service class for paging through StockLog entries with the stock level before
+    and after each movement.
+
+    Pages are fetched by keyset on (log_date, id), so every page costs the same no
+    matter how deep into the log it is. Within a page, running balances come from
+    a SUM() OVER (PARTITION BY stock_item ORDER BY log_date, id) window over the
+    page's rows. The window starts from each item's balance just before the page.
+    The cursor carries those balances forward, so the log before the page is only
+    summed (from the nearest StockCheckpoint) the first time an item appears.
+
+    The queryset must only be filtered in ways that keep every movement of an item
+    inside the date range (shop, item, dates); otherwise balances would skip rows.
+    """
+
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+
+    @staticmethod
+    def encode_cursor(data):
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Decode a cursor from a previous page; raises ValueError if it is invalid"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            log_date = datetime.fromisoformat(data['log_date'])
+            balances = {int(item_id): int(balance) for item_id, balance in data.get('balances', {}).items()}
+            return log_date, int(data['id']), balances
+        except (TypeError, KeyError, ValueError, AttributeError, binascii.Error) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+
+    @staticmethod
+    def get_page_size(value):
+        try:
+            page_size = int(value)
+        except (TypeError, ValueError):
+            return StockLedgerService.DEFAULT_PAGE_SIZE
+        return max(1, min(page_size, StockLedgerService.MAX_PAGE_SIZE))
+
+    @staticmethod
+    def get_page(queryset, cursor=None, page_size=None, descending=True):
+        """
+        Return one page of the ledger as a dictionary with 'results' (StockLog
+        instances with balance_before and balance_after set) and 'next_cursor'
+        (None on the last page).
+        """
+        page_size = page_size or StockLedgerService.DEFAULT_PAGE_SIZE
+        ordering = ['-log_date', '-id'] if descending else ['log_date', 'id']
+
+        balances = {}
+        if cursor:
+            log_date, log_id, balances = StockLedgerService.decode_cursor(cursor)
+            if descending:
+                after_cursor = Q(log_date__lt=log_date) | Q(log_date=log_date, id__lt=log_id)
+            else:
+                after_cursor = Q(log_date__gt=log_date) | Q(log_date=log_date, id__gt=log_id)
+            queryset = queryset.filter(after_cursor)
+
+        page_ids = list(queryset.order_by(*ordering).values_list('id', flat=True)[:page_size + 1])
+        has_more = len(page_ids) > page_size
+        page_ids = page_ids[:page_size]
+        if not page_ids:
+            return {'results': [], 'next_cursor': None}
+
+        # Running change per item within the page, plus the page total per item
+        rows = list(
+            StockLog.objects.filter(id__in=page_ids).select_related('stock_item', 'shop').annotate(
+                page_running_change=Window(
+                    expression=Sum('quantity_change'),
+                    partition_by=[F('stock_item_id')],
+                    order_by=[F('log_date').asc(), F('id').asc()],
+                ),
+                page_item_change=Window(
+                    expression=Sum('quantity_change'),
+                    partition_by=[F('stock_item_id')],
+                ),
+            ).order_by(*ordering)
+        )
+
+        # Items not seen on an earlier page start from the log up to the page edge:
+        # everything before the oldest row (ascending), or up to and including the
+        # newest row (descending)
+        unseen = {row.stock_item_id for row in rows} - balances.keys()
+        if unseen:
+            edge = rows[0]
+            before_edge = Q(log_date__lt=edge.log_date) | Q(log_date=edge.log_date, id__lt=edge.id)
+            if descending:
+                before_edge |= Q(id=edge.id)
+            balances.update(StockCheckpointService.get_balances_before(unseen, edge.log_date, before_edge))
+
+        # Balance before each item's oldest row on this page
+        opening = {}
+        for row in rows:
+            if row.stock_item_id not in opening:
+                carried = balances[row.stock_item_id]
+                opening[row.stock_item_id] = carried - row.page_item_change if descending else carried
+
+        for row in rows:
+            row.balance_after = opening[row.stock_item_id] + row.page_running_change
+            row.balance_before = row.balance_after - row.quantity_change
+
+        # Carry each item's balance at the far edge of this page to the next page
+        for stock_item_id, balance in opening.items():
+            if descending:
+                balances[stock_item_id] = balance
+            else:
+                balances[stock_item_id] = balance + next(
+                    row.page_item_change for row in rows if row.stock_item_id == stock_item_id
+                )
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = StockLedgerService.encode_cursor({
+                'log_date': last.log_date.isoformat(),
+                'id': last.id,
+                'balances': {str(item_id): balance for item_id, balance in balances.items()},
+            })
+
+        return {'results': rows, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def serialize_entry(log):
+        """Ledger row in the shape used by the inventory history responses"""
+        return {
+            'id': log.id,
+            'item_id': log.stock_item_id,
+            'item_name': log.stock_item.item_name,
+            'item_type': log.stock_item.item_type,
+            'user': log.director_name,
+            'timestamp': log.log_date.isoformat(),
+            'previous_quantity': log.balance_before,
+            'new_quantity': log.balance_after,
+            'quantity_change': log.quantity_change,
+            'adjustment_type': 'add' if log.quantity_change > 0 else 'subtract' if log.quantity_change < 0 else 'set',
+            'quantity': abs(log.quantity_change),
+            'reason': log.notes,
+            'shop_name': log.shop.shopName,
+        }
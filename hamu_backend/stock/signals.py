@@ -0,0 +1,101 @@
+"""
+Signal handlers that keep StockBalance equal to the sum of each StockItem's
+StockLog entries (and drop month-end StockCheckpoints that a back-dated log
+falls before), seed the default bill of materials for new packages and
+stock items, and drop a shop from the StockItemResolver cache when its stock
+items, packages or components change.
+
+Bulk queryset.update()/delete() calls bypass these handlers; run
+`python manage.py verify_stock_balances --repair` after such operations.
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from packages.models import Packages
+
+from .models import StockItem, StockLog, PackageComponent, StockItemComponent
+from .services import StockCalculationService, StockCheckpointService, StockItemResolver
+
+
+@receiver(pre_save, sender=StockLog, dispatch_uid='stock_balance_capture_previous')
+def capture_previous_change(sender, instance, **kwargs):
+    """Remember which item an edited log counted against, and by how much"""
+    instance._balance_previous = None
+    if instance.pk:
+        instance._balance_previous = sender.objects.filter(pk=instance.pk).values_list(
+            'stock_item_id', 'quantity_change', 'log_date'
+        ).first()
+
+
+@receiver(post_save, sender=StockLog, dispatch_uid='stock_balance_apply_save')
+def apply_saved_change(sender, instance, **kwargs):
+    """Move a created or edited log's quantity into its item's balance"""
+    # Net the old and new quantities per item so each balance is touched once
+    changes = {instance.stock_item_id: instance.quantity_change}
+    previous = getattr(instance, '_balance_previous', None)
+    if previous is not None:
+        changes[previous[0]] = changes.get(previous[0], 0) - previous[1]
+
+    with transaction.atomic():
+        for stock_item_id, delta in changes.items():
+            StockCalculationService.apply_balance_change(stock_item_id, delta)
+        # Back-dated (or re-dated) logs make later month-end checkpoints stale
+        StockCheckpointService.invalidate(instance.stock_item_id, instance.log_date)
+        if previous is not None:
+            StockCheckpointService.invalidate(previous[0], previous[2])
+    instance._balance_previous = None
+
+
+@receiver(post_delete, sender=StockLog, dispatch_uid='stock_balance_apply_delete')
+def remove_deleted_change(sender, instance, **kwargs):
+    """Take a deleted log's quantity out of its item's balance"""
+    StockCalculationService.apply_balance_change(
+        instance.stock_item_id, -instance.quantity_change, create_missing=False
+    )
+    StockCheckpointService.invalidate(instance.stock_item_id, instance.log_date)
+
+
+@receiver(post_save, sender=StockItem, dispatch_uid='stock_item_resolver_save')
+@receiver(post_delete, sender=StockItem, dispatch_uid='stock_item_resolver_delete')
+def invalidate_stock_item_resolver(sender, instance, **kwargs):
+    """Reload the shop's stock items on the next automatic deduction"""
+    StockItemResolver.invalidate(instance.shop_id)
+
+
+@receiver(post_save, sender=Packages, dispatch_uid='stock_package_resolver_save')
+@receiver(post_delete, sender=Packages, dispatch_uid='stock_package_resolver_delete')
+def invalidate_package_resolver(sender, instance, **kwargs):
+    """Reload the shop's package components after a package changes"""
+    StockItemResolver.invalidate(instance.shop_id)
+
+
+@receiver(post_save, sender=PackageComponent, dispatch_uid='stock_package_component_save')
+@receiver(post_delete, sender=PackageComponent, dispatch_uid='stock_package_component_delete')
+def invalidate_package_component(sender, instance, **kwargs):
+    # Components are edited rarely; dropping every shop avoids a lookup during cascades
+    StockItemResolver.invalidate()
+
+
+@receiver(post_save, sender=StockItemComponent, dispatch_uid='stock_item_component_save')
+@receiver(post_delete, sender=StockItemComponent, dispatch_uid='stock_item_component_delete')
+def invalidate_stock_item_component(sender, instance, **kwargs):
+    StockItemResolver.invalidate()
+
+
+@receiver(post_save, sender=Packages, dispatch_uid='stock_package_default_components')
+def seed_package_components(sender, instance, created, **kwargs):
+    """Give a new package the default bill of materials for its type"""
+    if created:
+        transaction.on_commit(lambda: StockCalculationService.sync_default_components(
+            instance.shop_id, package_id=instance.pk
+        ))
+
+
+@receiver(post_save, sender=StockItem, dispatch_uid='stock_item_default_components')
+def seed_stock_item_components(sender, instance, created, **kwargs):
+    """Link a new stock item to the packages and bundles that use it by default"""
+    if created:
+        transaction.on_commit(lambda: StockCalculationService.sync_default_components(
+            instance.shop_id, stock_item_ids=[instance.pk]
+        ))
@@ -1,3 +1,173 @@
-from django.test import TestCase
+import threading
+import unittest
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from shops.models import Shops
+
+from .models import StockItem, StockItemComponent, StockLog
+from .services import StockCalculationService, StockReorderService
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Row locking is only exercised on PostgreSQL')
+class WaterBundleConcurrencyTests(TransactionTestCase):
+    """
+    Parallel bundle creations against a real database: each thread records a
+    bundle and its deductions in its own transaction, the way the StockLog
+    serializer does. Skipped on other databases; run against PostgreSQL with
+
+        python manage.py test stock.tests.WaterBundleConcurrencyTests
+    """
+    workers = 12
+
+    def setUp(self):
+        self.shop = Shops.objects.create(shopName='Concurrency', freeRefillInterval=7)
+        self.bottles = self.create_item('Bottle', '1L', 60)
+        self.wrap = self.create_item('Shrink Wrap', '12x1L', 10)
+        self.bundle = self.create_item('Water Bundle', '12x1L', 0)
+        StockItemComponent.objects.get_or_create(assembly=self.bundle, component=self.bottles, defaults={'quantity': 12})
+        StockItemComponent.objects.get_or_create(assembly=self.bundle, component=self.wrap, defaults={'quantity': 1})
+
+    def create_item(self, item_name, item_type, quantity):
+        item = StockItem.objects.create(shop=self.shop, item_name=item_name, item_type=item_type)
+        if quantity:
+            self.add_log(item, quantity, 'Opening stock')
+        return item
+
+    def add_log(self, item, quantity, notes):
+        return StockLog.objects.create(
+            stock_item=item, shop=self.shop, quantity_change=quantity,
+            notes=notes, director_name='Test', log_date=timezone.now()
+        )
+
+    def create_bundle(self, bundle):
+        with transaction.atomic():
+            log = self.add_log(bundle, 1, 'Bundle')
+            StockCalculationService.process_water_bundle_creation(log)
+
+    def run_in_parallel(self, bundles):
+        """
+        Create one bundle per entry at the same moment; returns (created, rejected,
+        errors). Every rejection must be a stock shortage.
+        """
+        barrier = threading.Barrier(len(bundles))
+        lock = threading.Lock()
+        outcome = {'created': 0, 'rejected': 0, 'errors': []}
+
+        def worker(bundle):
+            try:
+                barrier.wait()
+                self.create_bundle(bundle)
+                result = 'created'
+            except ValueError as e:
+                if not str(e).startswith('Not enough'):
+                    with lock:
+                        outcome['errors'].append(e)
+                    return
+                result = 'rejected'
+            except DatabaseError as e:
+                # Deadlocks and lock timeouts end up here
+                with lock:
+                    outcome['errors'].append(e)
+                return
+            finally:
+                # Each thread has its own connection; don't leave it open
+                connection.close()
+            with lock:
+                outcome[result] += 1
+
+        threads = [threading.Thread(target=worker, args=(bundle,)) for bundle in bundles]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertFalse(any(thread.is_alive() for thread in threads), 'bundle creation hung')
+        return outcome['created'], outcome['rejected'], outcome['errors']
+
+    def level(self, item):
+        return StockCalculationService.get_current_stock_level(StockItem.objects.get(pk=item.pk))
+
+    def test_parallel_bundles_do_not_oversell(self):
+        created, rejected, errors = self.run_in_parallel([self.bundle] * self.workers)
+
+        self.assertEqual(errors, [])
+        # 60 bottles make exactly 5 bundles of 12
+        self.assertEqual(created, 5)
+        self.assertEqual(rejected, self.workers - 5)
+        self.assertEqual(self.level(self.bottles), 0)
+        self.assertEqual(self.level(self.wrap), 5)
+        self.assertEqual(self.level(self.bundle), 5)
+        self.assertEqual(self.level(self.bottles), StockCalculationService.sum_stock_logs(self.bottles.pk))
+
+    def test_overlapping_recipes_do_not_deadlock(self):
+        # A second assembly whose recipe lists the same components the other way
+        # round; both must still lock bottles and wrap in the same order
+        other = self.create_item('Water Bundle', '8x1.5L', 0)
+        StockItemComponent.objects.filter(assembly=other).delete()
+        StockItemComponent.objects.create(assembly=other, component=self.wrap, quantity=1)
+        StockItemComponent.objects.create(assembly=other, component=self.bottles, quantity=6)
+
+        created, rejected, errors = self.run_in_parallel([self.bundle, other] * (self.workers // 2))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(created + rejected, self.workers)
+        self.assertGreaterEqual(self.level(self.bottles), 0)
+        self.assertGreaterEqual(self.level(self.wrap), 0)
+        self.assertEqual(self.level(self.wrap), 10 - created)
+
+
+class StockReorderPlanTests(TestCase):
+    """Reorder suggestions from the moving-average usage and the reorder_point"""
+
+    def setUp(self):
+        self.shop = Shops.objects.create(shopName='Reorder', freeRefillInterval=10)
+        self.now = timezone.now()
+
+    def create_item(self, item_name, item_type, opening, used=0, reorder_point=300):
+        item = StockItem.objects.create(
+            shop=self.shop, item_name=item_name, item_type=item_type, reorder_point=reorder_point
+        )
+        StockLog.objects.create(
+            stock_item=item, shop=self.shop, quantity_change=opening, notes='Opening stock',
+            director_name='Test', log_date=self.now - timedelta(days=60)
+        )
+        if used:
+            StockLog.objects.create(
+                stock_item=item, shop=self.shop, quantity_change=-used, notes='Used',
+                director_name='Test', log_date=self.now - timedelta(days=5)
+            )
+        return item
+
+    def get_plan(self):
+        plan = StockReorderService.get_plan(
+            StockItem.objects.filter(shop=self.shop), include_all=True, now=self.now
+        )
+        return {(item['item_name'], item['item_type']): item for item in plan[0]['items']}
+
+    def test_every_flagged_item_gets_a_positive_suggestion(self):
+        # Below the reorder_point with slow usage: 18 used in 30 days is 0.6/day
+        self.create_item('Label', '20L', 50, used=18)
+        # Exactly at the reorder_point with no usage
+        self.create_item('Cap', '10/20L', 300)
+        # Above the reorder_point but running out within the lead time
+        self.create_item('Bottle', '1L', 3500, used=3000, reorder_point=100)
+        # Well stocked and barely used
+        self.create_item('Shrink Wrap', '12x1L', 1000, used=3, reorder_point=100)
+
+        plan = self.get_plan()
+
+        flagged = [item for item in plan.values() if item['reorder']]
+        self.assertEqual(len(flagged), 3)
+        for item in flagged:
+            self.assertGreater(item['suggested_order_quantity'], 0, item)
+
+        label = plan[('Label', '20L')]
+        self.assertEqual(label['current_quantity'], 32)
+        self.assertEqual(label['suggested_order_quantity'], 300 - 32)
+        # 100 units/day over 7 lead + 30 cover days
+        self.assertEqual(plan[('Bottle', '1L')]['suggested_order_quantity'], 3700 - 500)
+        self.assertFalse(plan[('Shrink Wrap', '12x1L')]['reorder'])
+        self.assertEqual(plan[('Shrink Wrap', '12x1L')]['suggested_order_quantity'], 0)
@@ -1,15 +1,23 @@
+import json
+from datetime import datetime, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum, F, Case, When, IntegerField
+from django.db.models import Sum, F, Case, When, IntegerField, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from .models import StockItem, StockLog
 from .serializers import StockItemSerializer, StockLogSerializer
+from hamu_backend.pagination import TransactionPagination
 from hamu_backend.permissions import IsShopAgentOrDirector
-from .services import StockCalculationService
-from .filters import StockLogFilter
+from .services import StockCalculationService, StockLedgerService, StockReorderService
+from .filters import StockLogFilter, StockLedgerFilter
 
 
 class StockItemViewSet(viewsets.ModelViewSet):
@@ -22,17 +30,19 @@ class StockItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsShopAgentOrDirector]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['item_name', 'item_type']
-    ordering_fields = ['item_name', 'item_type', 'created_at']
+    ordering_fields = ['item_name', 'item_type', 'created_at', 'current_quantity']
     filterset_fields = ['shop', 'item_type']
     
     def get_queryset(self):
         user = self.request.user
         if user.user_class == 'Director':
             # Directors see all stock items across all shops
-            return StockItem.objects.all().select_related('shop')
+            queryset = StockItem.objects.all().select_related('shop')
         else:
             # Agents only see stock items from their shop
-            return StockItem.objects.filter(shop=user.shop).select_related('shop')
+            queryset = StockItem.objects.filter(shop=user.shop).select_related('shop')
+        # Current quantities are read in the same query instead of once per item
+        return StockCalculationService.annotate_current_quantity(queryset)
     
     def perform_create(self, serializer):
         """Automatically set shop for agent users"""
@@ -48,36 +58,72 @@ class StockItemViewSet(viewsets.ModelViewSet):
         List stock items that are low in inventory.
         Uses item.threshold from database for consistency with web analytics.
         """
-        queryset = self.get_queryset()
-        
-        # For each stock item, calculate current quantity using the service
-        results = []
-        for item in queryset:
-            quantity = StockCalculationService.get_current_stock_level(item)
-            
-            # Use item.threshold from database (same as web analytics)
-            threshold = item.threshold if item.threshold else 5  # Default 5 if not set
-            
-            # Check if quantity is at or below threshold (consistent with web: <=)
-            if quantity <= threshold:
-                results.append({
-                    'id': item.id,
-                    'shop': item.shop.shopName,
-                    'item_name': item.item_name,
-                    'item_type': item.item_type,
-                    'current_quantity': quantity,
-                    'threshold': threshold
-                })
+        # Use item.threshold from database (same as web analytics), default 5 if not set
+        # Check if quantity is at or below threshold (consistent with web: <=)
+        queryset = self.get_queryset().annotate(
+            low_stock_threshold=Coalesce(NullIf('threshold', Value(0)), Value(5))
+        ).filter(current_quantity__lte=F('low_stock_threshold'))
+
+        results = [
+            {
+                'id': item.id,
+                'shop': item.shop.shopName,
+                'item_name': item.item_name,
+                'item_type': item.item_type,
+                'current_quantity': item.current_quantity,
+                'threshold': item.low_stock_threshold
+            }
+            for item in queryset
+        ]
                 
         return Response(results)
     
+    @action(detail=False, methods=['get'])
+    def reorder_plan(self, request):
+        """
+        Suggested order quantities per shop from each item's recent usage.
+        Optional parameters: shop_id, window_days (default 30, max 365),
+        lead_time_days (default 7), cover_days (default 30) and
+        include_all=true to list items that don't need reordering yet.
+        """
+        queryset = self.get_queryset()
+        shop_id = request.query_params.get('shop_id')
+        if shop_id:
+            queryset = queryset.filter(shop_id=shop_id)
+
+        try:
+            window_days = int(request.query_params.get('window_days', StockReorderService.DEFAULT_WINDOW_DAYS))
+            lead_time_days = int(request.query_params.get('lead_time_days', StockReorderService.DEFAULT_LEAD_TIME_DAYS))
+            cover_days = int(request.query_params.get('cover_days', StockReorderService.DEFAULT_COVER_DAYS))
+        except ValueError:
+            return Response({"error": "window_days, lead_time_days and cover_days must be whole numbers"}, status=400)
+        if not 1 <= window_days <= StockReorderService.MAX_WINDOW_DAYS or lead_time_days < 0 or cover_days < 0:
+            return Response({"error": f"window_days must be between 1 and {StockReorderService.MAX_WINDOW_DAYS}, "
+                                      "lead_time_days and cover_days cannot be negative"}, status=400)
+
+        shops = StockReorderService.get_plan(
+            queryset,
+            window_days=window_days,
+            lead_time_days=lead_time_days,
+            cover_days=cover_days,
+            include_all=request.query_params.get('include_all', '').lower() == 'true'
+        )
+        return Response({
+            'window_days': window_days,
+            'lead_time_days': lead_time_days,
+            'cover_days': cover_days,
+            'shops': shops,
+        })
+
     @action(detail=False, methods=['get'])
     def stock_by_shop(self, request):
         """
-        Get current stock levels for all items in a shop
+        Get current stock levels for all items in a shop, or the closing levels
+        on a past day with as_of=YYYY-MM-DD
         """
         user = self.request.user
         shop_id = request.query_params.get('shop_id')
+        as_of = request.query_params.get('as_of')
         
         # If no shop_id provided and user is an agent, use their shop
         if not shop_id and user.user_class != 'Director':
@@ -86,8 +132,19 @@ class StockItemViewSet(viewsets.ModelViewSet):
         if not shop_id:
             return Response({"error": "shop_id parameter is required for directors"}, status=400)
             
+        # Closing levels include every log dated on the as_of day
+        as_of_end = None
+        if as_of:
+            try:
+                as_of_date = parse_date(as_of)
+            except ValueError:
+                as_of_date = None
+            if not as_of_date:
+                return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+            as_of_end = timezone.make_aware(datetime.combine(as_of_date + timedelta(days=1), datetime.min.time()))
+
         # Get stock by shop using the service
-        result = StockCalculationService.get_current_stock_by_shop(shop_id)
+        result = StockCalculationService.get_current_stock_by_shop(shop_id, as_of=as_of_end)
         return Response(result)
         
     @action(detail=False, methods=['get'])
@@ -127,7 +184,7 @@ class StockItemViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def refills_impact(self, request):
         """
-        Calculate how refills have impacted stock levels (water usage)
+        Calculate how refills have impacted stock levels (caps, labels and water usage)
         """
         # Get query parameters
         start_date = request.query_params.get('start_date')
@@ -167,6 +224,9 @@ class StockLogViewSet(viewsets.ModelViewSet):
     """
     serializer_class = StockLogSerializer
     permission_classes = [IsShopAgentOrDirector]
+    pagination_class = TransactionPagination
+    # Keyset pages with ?pagination=cursor
+    cursor_ordering_field = 'log_date'
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['notes', 'director_name', 'stock_item__item_name']
     ordering_fields = ['log_date', 'quantity_change']
@@ -202,18 +262,66 @@ class StockLogViewSet(viewsets.ModelViewSet):
             
         serializer.save()
         
+    @action(detail=False, methods=['get'])
+    def ledger(self, request):
+        """
+        Stock movements with the quantity before and after each one, newest first.
+        Accepts the StockLogFilter shop/item/min_date/max_date filters, page_size
+        (max 200) and the next_cursor from the previous page as cursor.
+        """
+        filterset = StockLedgerFilter(request.query_params, queryset=self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=400)
+
+        try:
+            page = StockLedgerService.get_page(
+                filterset.qs,
+                cursor=request.query_params.get('cursor'),
+                page_size=StockLedgerService.get_page_size(request.query_params.get('page_size')),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            'results': [StockLedgerService.serialize_entry(log) for log in page['results']],
+            'next_cursor': page['next_cursor'],
+        })
+
     @action(detail=False, methods=['get'])
     def reconciliation_report(self, request):
         """
-        Compare StockLog entries with calculated impacts from sales and refills
+        Compare automatic deduction StockLog entries with the deductions implied by
+        sales and refills, per stock item and day. Streams NDJSON: one
+        {"type": "discrepancy", ...} line per mismatching item/day, then a
+        {"type": "summary", ...} line. Accepts shop_id and start_date/end_date
+        (YYYY-MM-DD, defaulting to the last 30 days).
         """
         # Get query parameters
         shop_id = request.query_params.get('shop_id')
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        
-        # This endpoint would call StockCalculationService.reconcile_stocklogs_with_events()
-        # and return a detailed reconciliation report
-        # Implementation depends on specific business requirements
-        
-        return Response({"message": "Reconciliation report feature coming soon"})
+
+        # Agents can only reconcile their own shop
+        user = self.request.user
+        if user.user_class != 'Director':
+            shop_id = user.shop.id
+
+        try:
+            parsed_end_date = parse_date(end_date) if end_date else timezone.localdate()
+            parsed_start_date = parse_date(start_date) if start_date else parsed_end_date - timedelta(days=30)
+        except ValueError:
+            parsed_start_date = parsed_end_date = None
+        if not parsed_start_date or not parsed_end_date:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+        if parsed_start_date > parsed_end_date:
+            return Response({"error": "start_date must be on or before end_date"}, status=400)
+
+        rows = StockCalculationService.reconcile_stocklogs_with_events(
+            start_date=parsed_start_date,
+            end_date=parsed_end_date,
+            shop_id=shop_id
+        )
+        return StreamingHttpResponse(
+            (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows),
+            content_type='application/x-ndjson'
+        )